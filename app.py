@@ -1,7 +1,15 @@
 from config import *
 from utils import *
-from media import *
+import media
+import hashlib
+import json
+import os
+import struct
+from threading import Thread
 from typing import Dict, List
+from werkzeug.exceptions import HTTPException
+from werkzeug.http import is_resource_modified, parse_range_header
+from werkzeug.serving import BaseWSGIServer, make_server
 from flask import (
     Flask,
     render_template,
@@ -13,36 +21,18 @@ from flask import (
     jsonify,
 )
 
-writing = False
-
-
-def updateDB(groupBy: str = None) -> None:
-    """
-    Updates the database schema and populates the media table.
-    Populates the media table with paths from the home directory.
-    Optionally classifies media by class if specified.
-    Cleans the database.
-
-    Args:
-        groupBy (str, optional): Specifies whether to classify media by 'class'. Defaults to None.
-    """
-    writeConn = connectDB(dbPath())
-    createSchema(writeConn, dbSchema())
-
-    populateMediaTable(writeConn, mediaPaths(homeDir()))
-    if groupBy == "class":
-        classifyMedia(
-            writeConn,
-            pathOf(yoloModelPath()),
-            getUnlinkedMedia(connectDB(dbPath())),
-        )
-    cleanDB(writeConn)
-    closeConnection(writeConn)
+thumbnails = media.ThumbnailCache(thumbnailDir(), thumbnailSize(), thumbnailFormat(), thumbnailQuality(), thumbnailCacheBytes())
+lookup = media.MediaLookup(dbPath(), mediaLookupSize())
+indexer = media.Indexer(thumbnails, lookup)
 
 
 def groupPaths(hidden, fileType, groupBy) -> str:
     """
-    Groups media paths by directory or class and returns them as JSON.
+    Groups media IDs by directory or class and returns them as JSON.
+    Triggers an index run and answers from the last committed state of the database,
+    unless the request asks to wait for that run with `?wait=1`.
+    Classes can be regrouped at another confidence with `?threshold=0.5`, from the stored detections,
+    down to `detectionFloor()`.
 
     Args:
         hidden (int): Specifies whether to include hidden files.
@@ -50,19 +40,21 @@ def groupPaths(hidden, fileType, groupBy) -> str:
         groupBy (str): Specifies the grouping method ('directory' or 'class').
 
     Returns:
-        str: JSON created from a list of tuples where each tuple contains a group name and a group of paths.
+        str: JSON created from a list of tuples where each tuple contains a group name, the IDs of its media,
+        their file types and their hashes, each joined with commas.
     """
-    global writing
-    if not writing:
-        writing = True
-        updateDB(groupBy)
-        writing = False
+    threshold = request.args.get("threshold", type=float)
+    # Detections below the floor are not stored, a lower threshold would silently group as if at the floor
+    if threshold is not None and not detectionFloor() <= threshold <= 1:
+        return jsonify({"error": f"threshold must be between {detectionFloor()} and 1"}), 400
+
+    indexer.request(groupBy, wait=request.args.get("wait") == "1")
 
     readConn = connectDB(dbPath())
     if groupBy == "directory":
-        result = groupByDir(readConn, hidden, fileType)
+        result = groupByDir(readConn, hidden, fileType, groupOf="mediaID")
     else:
-        result = groupByClass(readConn, hidden, fileType)
+        result = groupByClass(readConn, hidden, fileType, groupOf="mediaID", threshold=threshold)
     closeConnection(readConn)
 
     return jsonify(result)
@@ -84,6 +76,163 @@ def sendFile(filePath: str) -> Response:
         app.logger.error(f"Error serving file: {e}")
         return "An error occurred while serving the file.", 500
 
+def mediaETag(fileHash: str, signature: tuple) -> str:
+    """
+    The strong ETag of an indexed media file.
+    A sampled fingerprint does not cover the bytes between its chunks, so the size and modification time
+    recorded with it are added, an edit in place there changes the ETag even if the fingerprint stays.
+
+    Args:
+        fileHash (str): The hash of the media.
+        signature (tuple): The (size, mtime, inode, device) signature recorded when the file was hashed.
+
+    Returns:
+        str: The ETag, without quotes.
+    """
+    if not isSampled(fileHash):
+        return fileHash
+    size, mtime, _, _ = signature
+    return f"{fileHash}-{size:x}-{mtime:x}"
+
+
+def sendMedia(filePath: str, etag: str = None) -> Response:
+    """
+    Send a media file as a conditional response that answers Range requests, see `rangeEnviron`.
+
+    Args:
+        filePath (str): The path to the media file.
+        etag (str, optional): The strong ETag of the file, see `mediaETag`.
+            None lets Werkzeug derive one from the modification time and size.
+
+    Returns:
+        The file, partial content or a 304, a 416 for a range past the end of the file,
+        or a custom error message with a 500 status code if an error occurs.
+    """
+    try:
+        response = send_file(filePath, etag=etag or True, conditional=False)
+        return response.make_conditional(rangeEnviron(request.environ, response), accept_ranges=True,
+                                         complete_length=response.content_length)
+    except HTTPException:
+        raise
+    except Exception as e:
+        app.logger.error(f"Error serving file: {e}")
+        return "An error occurred while serving the file.", 500
+
+
+def sendThumbnail(fileHash: str, filePath: str, fileType: str, maxAge: int) -> Response:
+    """
+    Send the cached thumbnail of an indexed media, creating it first if it is missing.
+    Images OpenCV cannot read are sent whole, as the browser may still show them.
+
+    Args:
+        fileHash (str): The hash of the media.
+        filePath (str): The path to the media file.
+        fileType (str): 'img' or 'vid'.
+        maxAge (int): Seconds the webview may reuse the thumbnail without asking again.
+
+    Returns:
+        The thumbnail, the image itself, or an error message with a 500 status code for unreadable videos.
+    """
+    thumbnailPath = thumbnails.get(fileHash, filePath, fileType)
+    if thumbnailPath is not None:
+        return send_file(thumbnailPath, mimetype=thumbnails.mimetype, etag=f"{fileHash}-{thumbnails.size}", max_age=maxAge)
+    if fileType == "img":
+        return sendMedia(filePath)
+    return "Unable to read the video file.", 500
+
+
+def lookupMedia(key: str, value) -> tuple:
+    """
+    Resolve a media ID or hash to its media row through `lookup`.
+    A cached row whose file is gone is looked up again, the indexer may have moved the file since.
+
+    Args:
+        key (str): 'mediaID' or 'hash'.
+        value: The media ID or the hash.
+
+    Returns:
+        tuple: The media row, see `MediaLookup.get`, and the current (size, mtime, inode, device) signature
+        of its file, or (None, None) if the media is not indexed or its file does not exist.
+    """
+    row = lookup.get(key, value)
+    signature = row and fileSignature(row[2])
+    if row is not None and signature is None:
+        lookup.forget(row)
+        row = lookup.get(key, value)
+        signature = row and fileSignature(row[2])
+    if row is None or signature is None:
+        return None, None
+    return row, signature
+
+
+def selectedIDs() -> List[int]:
+    """
+    Read the media IDs posted by a button, `{"selectedMedia": [1, 2, 3]}`.
+
+    Returns:
+        List[int]: The media IDs, None if the body holds something else.
+    """
+    try:
+        return [int(mediaID) for mediaID in (request.get_json(silent=True) or {}).get("selectedMedia", [])]
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+def packThumbnails(thumbnailPaths: Dict[int, str], mimetype: str) -> bytes:
+    """
+    Pack several thumbnails into one binary bundle:
+    a 4 byte big-endian length, a JSON index of that length, then the thumbnails back to back.
+    The index holds the mimetype, `[mediaID, offset, length]` of every thumbnail with offsets counted
+    from the end of the index, and the media IDs without a thumbnail under `missing`.
+
+    Args:
+        thumbnailPaths (Dict[int, str]): The thumbnail file of each media ID, None if it has none.
+        mimetype (str): The mimetype of the thumbnails.
+
+    Returns:
+        bytes: The bundle.
+    """
+    items, missing, chunks, offset = [], [], [], 0
+    for mediaID, thumbnailPath in thumbnailPaths.items():
+        try:
+            with open(thumbnailPath, "rb") as f:
+                data = f.read()
+        except (OSError, TypeError):
+            missing.append(mediaID)
+            continue
+        items.append([mediaID, offset, len(data)])
+        chunks.append(data)
+        offset += len(data)
+    index = json.dumps({"mimetype": mimetype, "items": items, "missing": missing}).encode()
+    return b"".join([struct.pack(">I", len(index)), index, *chunks])
+
+
+def rangeEnviron(environ: dict, response: Response) -> dict:
+    """
+    Adjust the Range header of a request to RFC 9110 before Werkzeug answers it, as Werkzeug applies
+    Range before If-None-Match and answers ranges it does not support with a 416.
+    The Range header is dropped when it is malformed or asks for several ranges, so the whole file is sent,
+    and when the validators already match, so a 304 is sent. A suffix longer than the file asks for all of it.
+
+    Args:
+        environ (dict): The WSGI environment of the request, left unchanged.
+        response (Response): The response for the whole file, with its ETag and Last-Modified.
+
+    Returns:
+        dict: A copy of the environment to make the response conditional against.
+    """
+    environ = dict(environ)
+    if "HTTP_RANGE" not in environ:
+        return environ
+    parsed = parse_range_header(environ["HTTP_RANGE"])
+    if parsed is None or len(parsed.ranges) != 1 or not is_resource_modified(
+        environ, response.headers.get("ETag"), last_modified=response.headers.get("Last-Modified")
+    ):
+        del environ["HTTP_RANGE"]
+    elif parsed.ranges[0][0] < 0 and -parsed.ranges[0][0] > (response.content_length or 0):
+        environ["HTTP_RANGE"] = "bytes=0-"
+    return environ
+
 app = Flask(__name__, template_folder=f"{pathOf('static')}")
 
 @app.route("/")
@@ -99,12 +248,102 @@ def staticFile(path):
 
 @app.route('/media/<path:path>')
 def mediaFile(path):
-    return sendFile(path)
+    """
+    Serve a media file with its content hash in a strong ETag, so the webview revalidates unchanged
+    media with a 304 and Range requests for video seeking are answered with partial content.
+    """
+    filePath = decodeLinkPath(path)
+    if filePath is None:
+        return "File not found.", 404
+
+    conn = connectDB(dbPath())
+    indexed = getMediaSignature(conn, filePath)
+    closeConnection(conn)
+    # The hash only stands for the bytes while the file is as it was when hashed
+    return sendMedia(filePath, mediaETag(*indexed) if indexed and indexed[1] == fileSignature(filePath) else None)
+
+
+@app.route("/m/<int:mediaID>")
+def mediaByID(mediaID):
+    """
+    Serve an indexed media file by ID, like `/media` without decoding and probing a path.
+    """
+    row, signature = lookupMedia("mediaID", mediaID)
+    if row is None:
+        return "File not found.", 404
+    _, fileHash, filePath, _, indexedSignature = row
+    return sendMedia(filePath, mediaETag(fileHash, indexedSignature) if indexedSignature == signature else None)
 
 
 @app.route("/thumbnail/<path:path>")
 def thumbnail(path):
-    return getThumbnail(decodeLinkPath(path))
+    filePath = decodeLinkPath(path)
+    if filePath is None:
+        return "File not found.", 404
+
+    conn = connectDB(dbPath())
+    row = getMediaForPath(conn, filePath)
+    closeConnection(conn)
+    if row is None:
+        # Not indexed yet, there is no hash to cache it under
+        fileType = "vid" if checkExtension(filePath, [".mp4", ".mkv", ".webm"]) else "img"
+        data = media.createThumbnail(filePath, fileType, thumbnails.size, thumbnails.format, thumbnails.quality)
+        if data is not None:
+            return Response(data, mimetype=thumbnails.mimetype)
+        if fileType == "img":
+            # Formats OpenCV cannot read may still be shown by the browser
+            return sendMedia(filePath)
+        return "Unable to read the video file.", 500
+
+    _, fileHash, fileType = row
+    return sendThumbnail(fileHash, filePath, fileType, thumbnailMaxAge())
+
+
+@app.route("/t/<string:fileHash>")
+def thumbnailByHash(fileHash):
+    """
+    Serve the thumbnail of an indexed media by content hash.
+    The URL changes with the content, so the webview may keep it for `hashedThumbnailMaxAge()`.
+    """
+    row, _ = lookupMedia("hash", fileHash)
+    if row is None:
+        return "File not found.", 404
+    _, fileHash, filePath, fileType, _ = row
+    return sendThumbnail(fileHash, filePath, fileType, hashedThumbnailMaxAge())
+
+
+@app.route("/thumbnails")
+def thumbnailBundle():
+    """
+    Thumbnails of the media in `?ids=1,2,3` in a single response, see `packThumbnails`,
+    so a page of the grid loads in a handful of requests instead of one per card.
+    """
+    try:
+        mediaIDs = list(dict.fromkeys(int(mediaID) for mediaID in request.args.get("ids", "").split(",") if mediaID))
+    except ValueError:
+        return jsonify({"error": "ids must be a comma separated list of media IDs"}), 400
+    if len(mediaIDs) > thumbnailBundleSize():
+        return jsonify({"error": f"at most {thumbnailBundleSize()} ids per request"}), 400
+
+    conn = connectDB(dbPath())
+    rows = getMediaForIDs(conn, mediaIDs)
+    closeConnection(conn)
+
+    # The bundle only changes when the content of one of its media does
+    key = f"{thumbnails.size}.{thumbnails.format}:" + ",".join(f"{mediaID}={rows.get(mediaID, ('',))[0]}" for mediaID in mediaIDs)
+    response = Response(mimetype="application/octet-stream")
+    response.set_etag(hashlib.sha1(key.encode()).hexdigest())
+    response.cache_control.public = True
+    response.cache_control.max_age = thumbnailMaxAge()
+    if request.if_none_match.contains(response.get_etag()[0]):
+        response.status_code = 304
+        return response
+
+    found = [mediaID for mediaID in mediaIDs if mediaID in rows]
+    thumbnailPaths = dict.fromkeys(mediaIDs)
+    thumbnailPaths.update(zip(found, thumbnails.getMany([rows[mediaID] for mediaID in found], decodeWorkers())))
+    response.set_data(packThumbnails(thumbnailPaths, thumbnails.mimetype))
+    return response
 
 
 # Sections
@@ -136,54 +375,78 @@ def trash(groupBy):
 
 @app.route("/toTrash", methods=["POST"])
 def toTrash():
-    data = request.get_json().get("selectedMedia", [])
+    data = selectedIDs()
+    if data is None:
+        return jsonify({"error": "selectedMedia must be a list of media IDs"}), 400
     print(f"Moving files to trash: {data}")
     conn = connectDB(dbPath())
-    moveToTrash(conn, data)
+    moveToTrashByID(conn, data)
     closeConnection(conn)
     return jsonify({"success": True})
 
 
 @app.route("/delete", methods=["POST"])
 def delete():
-    data = request.get_json().get("selectedMedia", [])
+    data = selectedIDs()
+    if data is None:
+        return jsonify({"error": "selectedMedia must be a list of media IDs"}), 400
     print(f"Deleting files: {data}")
     conn = connectDB(dbPath())
-    deleteFromDB(conn, data)
+    deleteByID(conn, data)
     closeConnection(conn)
+    lookup.clear()
     return jsonify({"success": True})
 
 
 @app.route("/hide", methods=["POST"])
 def hide():
-    data = request.get_json().get("selectedMedia", [])
+    data = selectedIDs()
+    if data is None:
+        return jsonify({"error": "selectedMedia must be a list of media IDs"}), 400
     print(f"Hiding files: {data}")
     conn = connectDB(dbPath())
-    toggleVisibility(conn, data, 1)
+    toggleVisibilityByID(conn, data, 1)
     closeConnection(conn)
     return jsonify({"success": True})
 
 
 @app.route("/unhide", methods=["POST"])
 def unhide():
-    data = request.get_json().get("selectedMedia", [])
+    data = selectedIDs()
+    if data is None:
+        return jsonify({"error": "selectedMedia must be a list of media IDs"}), 400
     print(f"Unhiding files: {data}")
     conn = connectDB(dbPath())
-    toggleVisibility(conn, data, 0)
+    toggleVisibilityByID(conn, data, 0)
     closeConnection(conn)
     return jsonify({"success": True})
 
 
 @app.route("/restore", methods=["POST"])
 def restore():
-    data = request.get_json().get("selectedMedia", [])
+    data = selectedIDs()
+    if data is None:
+        return jsonify({"error": "selectedMedia must be a list of media IDs"}), 400
     print(f"Restoring files: {data}")
     conn = connectDB(dbPath())
-    toggleVisibility(conn, data, 0)
+    toggleVisibilityByID(conn, data, 0)
     closeConnection(conn)
     return jsonify({"success": True})
 
 
+@app.route("/index/status")
+def indexStatus():
+    return jsonify(indexer.status())
+
+
+@app.route("/i/<int:mediaID>")
+def infoByID(mediaID):
+    conn = connectDB(dbPath())
+    info = getInfoByID(conn, mediaID)
+    closeConnection(conn)
+    return jsonify(info)
+
+
 @app.route("/info/<path:path>")
 def info(path):
     conn = connectDB(dbPath())
@@ -192,8 +455,29 @@ def info(path):
     return jsonify(info)
 
 
+def startServer(host: str = "127.0.0.1", port: int = 5000) -> BaseWSGIServer:
+    """
+    Serve the app from a daemon thread.
+    The socket is already listening when this returns, so a window opened next loads the UI right away.
+
+    Args:
+        host (str): The interface to listen on.
+        port (int): The port to listen on.
+
+    Returns:
+        BaseWSGIServer: The running server, stop it with `shutdown()`.
+    """
+    server = make_server(host, port, app, threaded=True)
+    Thread(target=server.serve_forever, name="server", daemon=True).start()
+    return server
+
+
 if __name__ == "__main__":
 
-    app.run(debug=True, host="0.0.0.0")
+    debug = True
+    # The reloader runs the app in a child process, its parent only watches files and must not index
+    if not debug or os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        indexer.start()
+    app.run(debug=debug, host="0.0.0.0")
     # On the off chance something occurs listner still stops after run is done
     print("Exiting Application, Listener stopped") 
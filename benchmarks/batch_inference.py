@@ -0,0 +1,37 @@
+"""
+Images/sec of YOLOv8 inference versus batch size on CPU.
+
+Usage:
+    python -m benchmarks.batch_inference [--model models/yolov8n.onnx] [--images 64] [--batches 1 2 4 8 16]
+"""
+import argparse
+import time
+import numpy as np
+from yolov8 import get_detector
+
+
+def run(modelPath: str, imageCount: int, batchSizes: list) -> None:
+    detector = get_detector(modelPath)
+    rng = np.random.default_rng(0)
+    images = [rng.integers(0, 255, (1080, 1920, 3), dtype=np.uint8) for _ in range(imageCount)]
+
+    # Warm up the session so the first batch size is not penalised
+    detector.detect_batch(images[:1])
+
+    print(f"model batch dimension: {detector.input_shape[0]}")
+    print(f"{'batch':>6} {'images/s':>10} {'ms/image':>10}")
+    for batchSize in batchSizes:
+        start = time.perf_counter()
+        for i in range(0, imageCount, batchSize):
+            detector.detect_batch(images[i:i + batchSize])
+        elapsed = time.perf_counter() - start
+        print(f"{batchSize:>6} {imageCount / elapsed:>10.2f} {elapsed * 1000 / imageCount:>10.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default="models/yolov8n.onnx")
+    parser.add_argument("--images", type=int, default=64)
+    parser.add_argument("--batches", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    args = parser.parse_args()
+    run(args.model, args.images, args.batches)
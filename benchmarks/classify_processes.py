@@ -0,0 +1,36 @@
+"""
+Media/sec of process-pool classification for several worker layouts.
+
+Each layout splits the host's cores among the workers' ONNX intra-op thread pools.
+
+Usage:
+    python -m benchmarks.classify_processes --folder ~/Pictures [--model models/yolov8n.onnx] [--workers 1 2 4 8]
+"""
+import argparse
+import os
+import time
+from utils import mediaPaths
+from media.multiprocess import classifyInProcesses
+
+
+def run(folder: str, modelPath: str, workerCounts: list, limit: int) -> None:
+    rows = [(i, path, fileType) for i, (path, fileType, _) in enumerate(mediaPaths(folder))][:limit]
+    print(f"{len(rows)} media, {os.cpu_count()} cores")
+    print(f"{'workers':>8} {'threads':>8} {'media/s':>10} {'seconds':>10}")
+    for workers in workerCounts:
+        start = time.perf_counter()
+        for _ in classifyInProcesses(rows, modelPath, workers):
+            pass
+        elapsed = time.perf_counter() - start
+        threads = max(1, (os.cpu_count() or 1) // workers)
+        print(f"{workers:>8} {threads:>8} {len(rows) / elapsed:>10.2f} {elapsed:>10.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--folder", required=True)
+    parser.add_argument("--model", default="models/yolov8n.onnx")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--limit", type=int, default=200, help="Maximum number of media to classify")
+    args = parser.parse_args()
+    run(os.path.expanduser(args.folder), os.path.abspath(args.model), args.workers, args.limit)
@@ -0,0 +1,53 @@
+"""
+MB/s hashed versus number of hashing threads on a synthetic tree.
+
+The tree is written once and hashed with every worker count, so later runs are served
+from the page cache; drop caches between runs (or pass --dir on a cold tree) to measure the disk.
+
+Usage:
+    python -m benchmarks.hashing [--files 200] [--size-mb 8] [--workers 1 2 4 8] [--dir DIR]
+"""
+import argparse
+import os
+import tempfile
+import time
+from utils import genHashes, mediaPaths
+
+
+def makeTree(root: str, files: int, sizeMB: int) -> None:
+    chunk = os.urandom(1024 * 1024)
+    for i in range(files):
+        directory = os.path.join(root, f"album{i % 10}")
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, f"{i}.mp4"), "wb") as f:
+            for _ in range(sizeMB):
+                f.write(chunk)
+
+
+def run(root: str, workerCounts: list) -> None:
+    paths = list(mediaPaths(root))
+    totalMB = sum(os.path.getsize(path) for path, _, _ in paths) / (1024 * 1024)
+    print(f"{len(paths)} files, {totalMB:.0f} MB")
+    print(f"{'workers':>8} {'MB/s':>10} {'seconds':>10}")
+    for workers in workerCounts:
+        start = time.perf_counter()
+        for _ in genHashes(paths, workers):
+            pass
+        elapsed = time.perf_counter() - start
+        print(f"{workers:>8} {totalMB / elapsed:>10.1f} {elapsed:>10.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=200)
+    parser.add_argument("--size-mb", type=int, default=8)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--dir", help="Hash an existing tree instead of a synthetic one")
+    args = parser.parse_args()
+
+    if args.dir:
+        run(args.dir, args.workers)
+    else:
+        with tempfile.TemporaryDirectory() as root:
+            makeTree(root, args.files, args.size_mb)
+            run(root, args.workers)
@@ -0,0 +1,123 @@
+"""
+Addressing media by path (before) versus by media ID and content hash (after).
+
+Resolution: revalidating every file with If-None-Match, so the 304 leaves only the cost of
+finding the file, through `/media/<path>` (decode and probe the path, query by path) and through
+`/m/<mediaID>` on first request (lookup misses, query by ID) and afterwards (answered from memory).
+Thumbnails compare `/thumbnail/<path>` with `/t/<hash>` the same way, once they are cached.
+Payload: bytes of the grouping JSON and of a button request selecting every media.
+
+Requests go through the Flask test client, so the numbers are server time and bytes without the network.
+HOME points to a temporary folder holding --count synthetic files --depth folders deep,
+so the database and caches are fresh and the real ones are left alone.
+
+Usage:
+    python -m benchmarks.media_lookup [--count 2000] [--depth 6]
+"""
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import time
+from urllib.parse import quote
+
+
+def syntheticLibrary(home: str, count: int, depth: int) -> list:
+    # Tiny images, the cost measured here is finding them
+    import cv2
+    import numpy as np
+
+    folder = os.path.join(home, *(f"Library folder {level}" for level in range(depth)))
+    os.makedirs(folder)
+    rng = np.random.default_rng(0)
+    paths = []
+    for i in range(count):
+        paths.append(os.path.join(folder, f"IMG_{i:05d}.jpg"))
+        cv2.imwrite(paths[-1], rng.integers(0, 255, (32, 32, 3), dtype=np.uint8))
+    return paths
+
+
+def revalidate(client, urls: list, before=None) -> list:
+    etags = [client.get(url).headers["ETag"] for url in urls]
+    if before is not None:
+        before()
+    latencies = []
+    for url, etag in zip(urls, etags):
+        start = time.perf_counter()
+        response = client.get(url, headers={"If-None-Match": etag})
+        latencies.append((time.perf_counter() - start) * 1000)
+        assert response.status_code == 304, f"{url} answered {response.status_code}"
+    return latencies
+
+
+def timed(client, urls: list) -> list:
+    latencies = []
+    for url in urls:
+        start = time.perf_counter()
+        client.get(url)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+def report(results: dict) -> None:
+    print(f"{'':>28} {'requests':>9} {'mean ms':>9} {'p95 ms':>8}")
+    for name, latencies in results.items():
+        print(f"{name:>28} {len(latencies):>9} {statistics.mean(latencies):>9.3f} {statistics.quantiles(latencies, n=20)[-1]:>8.3f}")
+
+
+def run(paths: list) -> None:
+    # Imported once HOME is set, the app creates its caches on import
+    from config import dbPath, dbSchema, dbIndexes
+    from utils import connectDB, createSchema, createIndexes, closeConnection, mediaPaths, groupByDir
+    from media.process import populateMediaTable
+    import app
+
+    conn = connectDB(dbPath())
+    createSchema(conn, dbSchema())
+    createIndexes(conn, dbIndexes())
+    populateMediaTable(conn, mediaPaths(os.path.dirname(paths[0])))
+    conn.commit()
+    # The grouping JSON as it was: paths, file types and media IDs
+    byPath = [(group, paths, types, ids) for (group, paths, types, _), (_, ids, _, _)
+              in zip(groupByDir(conn, 0, "img"), groupByDir(conn, 0, "img", groupOf="mediaID"))]
+    byPath = json.dumps(byPath, separators=(",", ":")).encode()
+    closeConnection(conn)
+
+    client = app.app.test_client()
+    groups = client.get("/img/directory")
+    mediaIDs = [mediaID for _, ids, _, _ in groups.get_json() for mediaID in ids.split(",")]
+    hashes = [fileHash for _, _, _, group in groups.get_json() for fileHash in group.split(",")]
+    quoted = [quote(path.lstrip("/")) for path in paths]
+
+    results = {
+        "/media/<path>": revalidate(client, [f"/media/{path}" for path in quoted]),
+        # Fetching the ETags fills the lookup, it is cleared before timing
+        "/m/<mediaID>, first": revalidate(client, [f"/m/{mediaID}" for mediaID in mediaIDs], app.lookup.clear),
+    }
+    results["/m/<mediaID>, cached"] = revalidate(client, [f"/m/{mediaID}" for mediaID in mediaIDs])
+    # Creates the thumbnails
+    timed(client, [f"/t/{fileHash}" for fileHash in hashes])
+    results["/thumbnail/<path>, cached"] = timed(client, [f"/thumbnail/{path}" for path in quoted])
+    results["/t/<hash>, cached"] = timed(client, [f"/t/{fileHash}" for fileHash in hashes])
+
+    print(f"{len(paths)} media in {os.path.dirname(paths[0])}")
+    report(results)
+
+    print(f"\n{'payload':>28} {'paths KiB':>10} {'IDs KiB':>9}")
+    print(f"{'grouping JSON':>28} {len(byPath) / 1024:>10.1f} {len(groups.get_data()) / 1024:>9.1f}")
+    selectPaths = json.dumps({"selectedMedia": paths}).encode()
+    selectIDs = json.dumps({"selectedMedia": list(map(int, mediaIDs))}).encode()
+    print(f"{'select all':>28} {len(selectPaths) / 1024:>10.1f} {len(selectIDs) / 1024:>9.1f}")
+    print(f"Lookup: {app.lookup.stats()}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--count", type=int, default=2000)
+    parser.add_argument("--depth", type=int, default=6, help="Folders between HOME and the media")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as home:
+        os.environ["HOME"] = os.environ["USERPROFILE"] = home
+        run(syntheticLibrary(home, args.count, args.depth))
@@ -0,0 +1,173 @@
+"""
+Conditional and byte-range serving of /media, checked and measured through the Flask test client.
+
+Runs edge cases of conditional and range requests against an indexed video and prints PASS or FAIL for each,
+then compares the bytes transferred when scrubbing through the video with Range requests
+and when reopening it with If-None-Match, against downloading it whole every time.
+Exits with status 1 when a case fails.
+
+HOME points to a temporary folder, so the database is fresh and the real one is left alone.
+Without --video, a synthetic clip of about --megabytes is written to it.
+
+Usage:
+    python -m benchmarks.media_serving [--video clip.mp4] [--megabytes 32] [--seeks 50] [--chunk 1048576]
+"""
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+from email.utils import format_datetime, parsedate_to_datetime
+from datetime import timedelta
+from urllib.parse import quote
+
+
+def syntheticVideo(path: str, megabytes: float) -> str:
+    # Random bytes behind a real header are enough to serve, nothing decodes them
+    with open(path, "wb") as f:
+        f.write(b"\x00\x00\x00\x18ftypmp42")
+        f.write(os.urandom(int(megabytes * 2**20)))
+    return path
+
+
+def edgeCases(client, url: str, content: bytes, expectedETag: str) -> list:
+    size = len(content)
+    full = client.get(url)
+    etag = full.headers.get("ETag")
+    lastModified = full.headers.get("Last-Modified")
+    earlier = format_datetime(parsedate_to_datetime(lastModified) - timedelta(days=1), usegmt=True)
+
+    def get(**headers):
+        return client.get(url, headers=headers)
+
+    def partial(response, start: int, end: int) -> bool:
+        return (response.status_code == 206 and response.data == content[start:end + 1]
+                and response.headers.get("Content-Range") == f"bytes {start}-{end}/{size}")
+
+    cases = [
+        ("full response with strong hash ETag", full.status_code == 200 and full.data == content and etag == f'"{expectedETag}"'),
+        ("ranges advertised", full.headers.get("Accept-Ranges") == "bytes"),
+        ("If-None-Match match is 304", get(**{"If-None-Match": etag}).status_code == 304),
+        ("If-None-Match in a list is 304", get(**{"If-None-Match": f'"other", {etag}'}).status_code == 304),
+        ("If-None-Match * is 304", get(**{"If-None-Match": "*"}).status_code == 304),
+        ("weak If-None-Match match is 304", get(**{"If-None-Match": f"W/{etag}"}).status_code == 304),
+        ("If-None-Match mismatch is 200", get(**{"If-None-Match": '"other"'}).status_code == 200),
+        ("If-Modified-Since Last-Modified is 304", get(**{"If-Modified-Since": lastModified}).status_code == 304),
+        ("If-Modified-Since earlier is 200", get(**{"If-Modified-Since": earlier}).status_code == 200),
+        ("If-None-Match mismatch wins over If-Modified-Since",
+         get(**{"If-None-Match": '"other"', "If-Modified-Since": lastModified}).status_code == 200),
+        ("first bytes", partial(get(Range="bytes=0-99"), 0, 99)),
+        ("single byte", partial(get(Range="bytes=0-0"), 0, 0)),
+        ("middle range", partial(get(Range=f"bytes={size // 2}-{size // 2 + 4095}"), size // 2, size // 2 + 4095)),
+        ("open ended range", partial(get(Range=f"bytes={size - 1000}-"), size - 1000, size - 1)),
+        ("suffix range", partial(get(Range="bytes=-500"), size - 500, size - 1)),
+        ("suffix longer than the file", partial(get(Range=f"bytes=-{size + 10}"), 0, size - 1)),
+        ("end past the file is clamped", partial(get(Range=f"bytes={size - 10}-{size + 1000}"), size - 10, size - 1)),
+        ("start past the file is 416", get(Range=f"bytes={size}-").status_code == 416),
+        ("416 tells the length", get(Range=f"bytes={size}-").headers.get("Content-Range") == f"bytes */{size}"),
+        ("malformed range is ignored", get(Range="bytes=abc").status_code == 200),
+        ("several ranges send the whole file", get(Range="bytes=0-99,200-299").status_code == 200),
+        ("inverted range is ignored", get(Range="bytes=100-10").status_code in (200, 416)),
+        ("If-Range match gives the range", partial(get(Range="bytes=0-99", **{"If-Range": etag}), 0, 99)),
+        ("If-Range mismatch gives the whole file", get(Range="bytes=0-99", **{"If-Range": '"other"'}).status_code == 200),
+        ("range with If-None-Match match is 304", get(Range="bytes=0-99", **{"If-None-Match": etag}).status_code == 304),
+        ("HEAD has no body", client.head(url).data == b"" and client.head(url).headers.get("ETag") == etag),
+    ]
+    return cases
+
+
+def transferred(client, url: str, size: int, seeks: int, chunk: int) -> dict:
+    random.seed(0)
+    whole = sum(len(client.get(url).data) for _ in range(seeks))
+    scrubbed = 0
+    for _ in range(seeks):
+        start = random.randrange(0, size)
+        scrubbed += len(client.get(url, headers={"Range": f"bytes={start}-{start + chunk - 1}"}).data)
+    etag = client.get(url).headers["ETag"]
+    revalidated = sum(len(client.get(url, headers={"If-None-Match": etag}).data) for _ in range(seeks))
+    return {"whole file each time": whole, f"{chunk // 1024} KiB ranges": scrubbed, "revalidated (304)": revalidated}
+
+
+def run(video: str, seeks: int, chunk: int) -> int:
+    # Imported once HOME is set, the app creates its caches on import
+    from config import dbPath, dbSchema, dbIndexes
+    from utils import connectDB, createSchema, createIndexes, closeConnection, mediaPaths, getMediaSignature, getMediaIDForPath
+    from media.process import populateMediaTable
+    import app
+
+    conn = connectDB(dbPath())
+    createSchema(conn, dbSchema())
+    createIndexes(conn, dbIndexes())
+
+    def scan():
+        populateMediaTable(conn, (item for item in mediaPaths(os.path.dirname(video)) if item[0] == video))
+        conn.commit()
+        app.lookup.clear()
+
+    scan()
+    fileHash, signature = getMediaSignature(conn, video)
+
+    client = app.app.test_client()
+    url = f"/media/{quote(video.lstrip('/'))}"
+    with open(video, "rb") as f:
+        content = f.read()
+
+    cases = edgeCases(client, url, content, app.mediaETag(fileHash, signature))
+    # A file changed after indexing must not keep the old content hash as its ETag
+    with open(video, "ab") as f:
+        f.write(b"\x00")
+    changed = client.get(url)
+    cases.append(("changed file drops the stale hash ETag", changed.headers.get("ETag") != f'"{fileHash}"'))
+    with open(video, "r+b") as f:
+        f.truncate(len(content))
+    unindexed = shutil.copy(video, f"{video}.copy.mp4")
+    response = client.get(f"/media/{quote(unindexed.lstrip('/'))}", headers={"Range": "bytes=0-99"})
+    cases.append(("unindexed file is served with ranges", response.status_code == 206 and response.data == content[:100]))
+    os.remove(unindexed)
+
+    # Same size, one byte flipped between the chunks a sampled fingerprint reads, then indexed again.
+    # The cases above touched the file, it is indexed again first so the ETag is the strong one
+    scan()
+    byID = f"/m/{getMediaIDForPath(conn, video)}"
+    etag = client.get(byID).headers["ETag"]
+    cases.append(("indexed file by ID has the strong hash ETag", etag == f'"{app.mediaETag(*getMediaSignature(conn, video))}"'))
+    with open(video, "r+b") as f:
+        f.seek(2 * 2**20)
+        f.write(bytes([content[2 * 2**20] ^ 0xFF]))
+    scan()
+    for name, target in (("path", url), ("ID", byID)):
+        response = client.get(target, headers={"If-None-Match": etag})
+        cases.append((f"edit in place of the same size drops the ETag by {name}",
+                      response.status_code == 200 and response.headers.get("ETag") != etag))
+    response = client.get(byID, headers={"Range": "bytes=0-99", "If-Range": etag})
+    cases.append(("If-Range with the ETag before the edit gives the whole file", response.status_code == 200))
+    closeConnection(conn)
+
+    failed = 0
+    for name, passed in cases:
+        failed += not passed
+        print(f"{'PASS' if passed else 'FAIL'}  {name}")
+
+    print(f"\n{seeks} openings of a {len(content) / 2**20:.1f} MiB video")
+    for name, count in transferred(client, url, len(content), seeks, chunk).items():
+        print(f"{name:>24} {count / 2**20:>10.2f} MiB")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--video", help="Video file, copied to the temporary folder")
+    parser.add_argument("--megabytes", type=float, default=32)
+    parser.add_argument("--seeks", type=int, default=50)
+    parser.add_argument("--chunk", type=int, default=2**20, help="Bytes per Range request")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as home:
+        os.environ["HOME"] = os.environ["USERPROFILE"] = home
+        os.makedirs(os.path.join(home, "videos"))
+        if args.video:
+            video = shutil.copy(args.video, os.path.join(home, "videos", os.path.basename(args.video)))
+        else:
+            video = syntheticVideo(os.path.join(home, "videos", "clip.mp4"), args.megabytes)
+        sys.exit(run(video, args.seeks, args.chunk))
@@ -0,0 +1,95 @@
+"""
+Vectorised multi-class NMS versus the original per-class, per-box loop.
+
+First checks on randomised inputs (ties, duplicates, degenerate boxes, varying class counts and thresholds)
+that both return identical keep indices, then times both over a range of box counts.
+
+Usage:
+    python -m benchmarks.nms [--cases 500] [--counts 10 100 1000 10000] [--classes 5]
+"""
+import argparse
+import time
+import numpy as np
+from yolov8.utils import compute_iou, multiclass_nms
+
+
+def legacyNms(boxes: np.ndarray, scores: np.ndarray, iou_threshold: float) -> list:
+    # nms before vectorisation
+    sorted_indices = np.argsort(scores)[::-1]
+    keep_boxes = []
+    while sorted_indices.size > 0:
+        box_id = sorted_indices[0]
+        keep_boxes.append(box_id)
+        ious = compute_iou(boxes[box_id, :], boxes[sorted_indices[1:], :])
+        keep_indices = np.where(ious < iou_threshold)[0]
+        sorted_indices = sorted_indices[keep_indices + 1]
+    return keep_boxes
+
+
+def legacyMulticlassNms(boxes: np.ndarray, scores: np.ndarray, class_ids: np.ndarray, iou_threshold: float) -> list:
+    # multiclass_nms before vectorisation
+    keep_boxes = []
+    for class_id in np.unique(class_ids):
+        class_indices = np.where(class_ids == class_id)[0]
+        class_keep_boxes = legacyNms(boxes[class_indices, :], scores[class_indices], iou_threshold)
+        keep_boxes.extend(class_indices[class_keep_boxes])
+    return keep_boxes
+
+
+def randomDetections(rng: np.random.Generator, count: int, classes: int, size: float = 640.0) -> tuple:
+    """
+    Clustered boxes in (x1, y1, x2, y2) format like a crowded scene at a low confidence threshold.
+    """
+    centers = rng.uniform(0, size, (max(1, count // 20), 2))
+    xy = centers[rng.integers(0, len(centers), count)] + rng.normal(0, 8, (count, 2))
+    wh = rng.uniform(0, 120, (count, 2))
+    boxes = np.concatenate([xy - wh / 2, xy + wh / 2], axis=1).astype(np.float32)
+    scores = rng.uniform(0.01, 1, count).astype(np.float32)
+    class_ids = rng.integers(0, classes, count)
+    return boxes, scores, class_ids
+
+
+def check(cases: int) -> None:
+    rng = np.random.default_rng(0)
+    for case in range(cases):
+        count = int(rng.integers(0, 400))
+        boxes, scores, class_ids = randomDetections(rng, count, int(rng.integers(1, 10)))
+        if count and case % 3 == 0:
+            # Tied scores, duplicated and zero area boxes
+            scores = np.round(scores, 1)
+            duplicates = rng.integers(0, count, count // 4)
+            boxes[duplicates[: len(duplicates) // 2]] = boxes[duplicates[len(duplicates) // 2:][: len(duplicates) // 2]]
+            boxes[rng.integers(0, count, count // 10), 2] = boxes[rng.integers(0, count, count // 10), 0]
+        threshold = float(rng.choice([0.0, 0.3, 0.5, 0.7, 1.0]))
+
+        with np.errstate(invalid="ignore"):
+            expected = [int(i) for i in legacyMulticlassNms(boxes, scores, class_ids, threshold)]
+        actual = [int(i) for i in multiclass_nms(boxes, scores, class_ids, threshold)]
+        if expected != actual:
+            raise AssertionError(f"case {case}: {count} boxes, threshold {threshold} kept {actual} instead of {expected}")
+    print(f"{cases} random cases: identical keep indices")
+
+
+def run(counts: list, classes: int) -> None:
+    rng = np.random.default_rng(1)
+    print(f"{'boxes':>7} {'kept':>6} {'original ms':>12} {'vectorised ms':>14} {'speedup':>8}")
+    for count in counts:
+        boxes, scores, class_ids = randomDetections(rng, count, classes)
+        timings = []
+        for nms in (legacyMulticlassNms, multiclass_nms):
+            repeat = max(1, 2000 // count)
+            start = time.perf_counter()
+            for _ in range(repeat):
+                kept = nms(boxes, scores, class_ids, 0.5)
+            timings.append((time.perf_counter() - start) * 1000 / repeat)
+        print(f"{count:>7} {len(kept):>6} {timings[0]:>12.3f} {timings[1]:>14.3f} {timings[0] / timings[1]:>7.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cases", type=int, default=500)
+    parser.add_argument("--counts", type=int, nargs="+", default=[10, 100, 1000, 10000])
+    parser.add_argument("--classes", type=int, default=5)
+    args = parser.parse_args()
+    check(args.cases)
+    run(args.counts, args.classes)
@@ -0,0 +1,69 @@
+"""
+Per-image preprocessing latency and memory allocated, the original `prepare_input` versus
+the buffered one writing into a reused float32 NCHW tensor.
+
+Allocations are measured with tracemalloc, which sees numpy and OpenCV output arrays.
+
+Usage:
+    python -m benchmarks.preprocessing [--model models/yolov8n.onnx] [--images 32] [--size 1920x1080]
+"""
+import argparse
+import time
+import tracemalloc
+import cv2
+import numpy as np
+from yolov8 import get_detector
+
+
+def legacyPrepare(image: np.ndarray, width: int, height: int) -> np.ndarray:
+    # prepare_input before the buffered preprocessing
+    input_img = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+    input_img = cv2.resize(input_img, (width, height))
+    input_img = input_img / 255.0
+    input_img = input_img.transpose(2, 0, 1)
+    return input_img[np.newaxis, :, :, :].astype(np.float32)
+
+
+def measure(name: str, prepare, images: list) -> None:
+    prepare(images[0])
+    start = time.perf_counter()
+    for image in images:
+        prepare(image)
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    for image in images:
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        prepare(image)
+        peak = tracemalloc.get_traced_memory()[1] - before
+    tracemalloc.stop()
+    print(f"{name:>10} {elapsed * 1000 / len(images):>10.3f} {peak / 2**20:>12.2f}")
+
+
+def run(modelPath: str, imageCount: int, width: int, height: int) -> None:
+    detector = get_detector(modelPath)
+    rng = np.random.default_rng(0)
+    images = [rng.integers(0, 255, (height, width, 3), dtype=np.uint8) for _ in range(imageCount)]
+
+    buffer = detector.input_buffer(1)
+    reference = legacyPrepare(images[0], detector.input_width, detector.input_height)
+    print(f"max difference to original: {np.abs(detector.prepare_input(images[0], buffer) - reference).max()}")
+
+    print(f"{'mode':>10} {'ms/image':>10} {'peak MiB':>12}")
+    measure("original", lambda image: legacyPrepare(image, detector.input_width, detector.input_height), images)
+    measure("allocate", lambda image: detector.prepare_input(image), images)
+    measure("buffered", lambda image: detector.prepare_input(image, buffer), images)
+    detector.letterbox = True
+    measure("letterbox", lambda image: detector.prepare_input(image, buffer), images)
+    detector.letterbox = False
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default="models/yolov8n.onnx")
+    parser.add_argument("--images", type=int, default=32)
+    parser.add_argument("--size", default="1920x1080", help="Width x height of the synthetic images")
+    args = parser.parse_args()
+    width, height = map(int, args.size.split("x"))
+    run(args.model, args.images, width, height)
@@ -0,0 +1,74 @@
+"""
+Throughput and accuracy of the INT8 quantized model against the FP32 model on a folder of images.
+
+Both models classify the same images through the indexing path (reduced decode, batched inference
+at `classThreshold()`). Reports images/sec of each model, the share of images whose class sets
+are identical and the mean Jaccard similarity of the class sets, with the classes gained and lost most often.
+
+Create the quantized model first with `python -m yolov8.quantize`.
+
+Usage:
+    python -m benchmarks.quantized --images ~/Pictures [--fp32 models/yolov8n.onnx]
+        [--int8 models/yolov8n.int8.onnx] [--count 200] [--batch 8]
+"""
+import argparse
+import time
+from collections import Counter
+from config import classThreshold
+from media.image import readImage
+from yolov8 import get_detector
+from yolov8.YOLOv8 import uniqueClasses
+from yolov8.quantize import calibration_images
+
+
+def readable(paths: list) -> list:
+    return [path for path in paths if readImage(path)[0] is not None]
+
+
+def classify(modelPath: str, paths: list, batch: int) -> tuple:
+    detector = get_detector(modelPath)
+    inputSize = (detector.input_height, detector.input_width)
+    detector.warm_up()
+
+    results = []
+    start = time.perf_counter()
+    for i in range(0, len(paths), batch):
+        images, shapes = zip(*(readImage(path, inputSize) for path in paths[i:i + batch]))
+        detections = detector.detect_batch(list(images), conf_thres=classThreshold(), iou_thres=0.5, img_shapes=list(shapes))
+        results.extend(set(uniqueClasses(class_ids)) for _, _, class_ids in detections)
+    return results, len(paths) / (time.perf_counter() - start)
+
+
+def jaccard(a: set, b: set) -> float:
+    return len(a & b) / len(a | b) if a | b else 1.0
+
+
+def run(fp32: str, int8: str, paths: list, batch: int) -> None:
+    reference, fp32Rate = classify(fp32, paths, batch)
+    quantized, int8Rate = classify(int8, paths, batch)
+
+    identical = sum(a == b for a, b in zip(reference, quantized))
+    similarity = sum(jaccard(a, b) for a, b in zip(reference, quantized)) / len(paths)
+    lost = Counter(name for a, b in zip(reference, quantized) for name in a - b)
+    gained = Counter(name for a, b in zip(reference, quantized) for name in b - a)
+
+    print(f"{len(paths)} images, batch {batch}, threshold {classThreshold()}")
+    print(f"{'model':>6} {'images/s':>10}")
+    print(f"{'fp32':>6} {fp32Rate:>10.2f}")
+    print(f"{'int8':>6} {int8Rate:>10.2f}  ({int8Rate / fp32Rate:.2f}x)")
+    print(f"Identical class sets: {identical}/{len(paths)} ({identical / len(paths):.1%})")
+    print(f"Mean Jaccard similarity: {similarity:.3f}")
+    print(f"Most often lost: {', '.join(f'{name} ({n})' for name, n in lost.most_common(5)) or '-'}")
+    print(f"Most often gained: {', '.join(f'{name} ({n})' for name, n in gained.most_common(5)) or '-'}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", required=True, help="Folder of images")
+    parser.add_argument("--fp32", default="models/yolov8n.onnx")
+    parser.add_argument("--int8", default="models/yolov8n.int8.onnx")
+    parser.add_argument("--count", type=int, default=200)
+    parser.add_argument("--batch", type=int, default=8)
+    args = parser.parse_args()
+
+    run(args.fp32, args.int8, readable(calibration_images(args.images, args.count)), args.batch)
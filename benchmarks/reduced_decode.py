@@ -0,0 +1,80 @@
+"""
+Decode time and peak RSS per image of a full size `cv2.imread` versus the reduced JPEG decode
+used for classification (`media.image.readImage`).
+
+Each mode runs in its own process so peak RSS is not shared between them.
+Without --images, synthetic JPEGs of --megapixels are written to a temporary folder.
+
+Usage:
+    python -m benchmarks.reduced_decode [--images ~/Pictures] [--count 16] [--megapixels 24] [--input 640]
+"""
+import argparse
+import glob
+import multiprocessing
+import os
+import resource
+import tempfile
+import time
+import cv2
+import numpy as np
+
+
+def decode(mode: str, paths: list, inputSize: int, results) -> None:
+    from media.image import readImage
+
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    times, pixels = [], []
+    for path in paths:
+        start = time.perf_counter()
+        if mode == "full":
+            img = cv2.imread(path)
+        else:
+            img, _ = readImage(path, (inputSize, inputSize))
+        times.append(time.perf_counter() - start)
+        pixels.append(img.shape[0] * img.shape[1])
+        del img
+    # ru_maxrss is in KiB on Linux
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    results.put((mode, np.mean(times) * 1000, np.mean(pixels) / 1e6, peak / 1024, (peak - baseline) / 1024))
+
+
+def syntheticImages(folder: str, count: int, megapixels: float) -> list:
+    width = int((megapixels * 1e6 * 4 / 3) ** 0.5)
+    height = width * 3 // 4
+    rng = np.random.default_rng(0)
+    paths = []
+    for i in range(count):
+        # Upscaled noise compresses like a photo more than raw noise does
+        img = cv2.resize(rng.integers(0, 255, (height // 16, width // 16, 3), dtype=np.uint8), (width, height))
+        paths.append(os.path.join(folder, f"{i}.jpg"))
+        cv2.imwrite(paths[-1], img, [cv2.IMWRITE_JPEG_QUALITY, 90])
+    return paths
+
+
+def run(paths: list, inputSize: int) -> None:
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    print(f"{len(paths)} images, detector input {inputSize}x{inputSize}")
+    print(f"{'mode':>8} {'ms/image':>10} {'decoded MP':>11} {'peak RSS MiB':>13} {'RSS growth MiB':>15}")
+    for mode in ("full", "reduced"):
+        process = context.Process(target=decode, args=(mode, paths, inputSize, results))
+        process.start()
+        row = results.get()
+        process.join()
+        print(f"{row[0]:>8} {row[1]:>10.2f} {row[2]:>11.2f} {row[3]:>13.1f} {row[4]:>15.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", help="Folder of JPEG files")
+    parser.add_argument("--count", type=int, default=16)
+    parser.add_argument("--megapixels", type=float, default=24)
+    parser.add_argument("--input", type=int, default=640)
+    args = parser.parse_args()
+
+    if args.images:
+        files = sorted(glob.glob(os.path.join(args.images, "*.jp*g")) + glob.glob(os.path.join(args.images, "*.JP*G")))
+        run(files[:args.count], args.input)
+    else:
+        with tempfile.TemporaryDirectory() as folder:
+            run(syntheticImages(folder, args.count, args.megapixels), args.input)
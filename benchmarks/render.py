@@ -0,0 +1,76 @@
+"""
+Per-image time of the classification-only path (`detectClasses` on the reduced decode, as indexing does)
+versus detecting and rendering the annotated full size image (`renderClasses`, as `imageClasses` with an outputPath does).
+
+Without --images, synthetic JPEGs of --megapixels are written to a temporary folder.
+
+Usage:
+    python -m benchmarks.render [--model models/yolov8n.onnx] [--images ~/Pictures] [--count 8] [--megapixels 24]
+"""
+import argparse
+import glob
+import os
+import tempfile
+import time
+import cv2
+from yolov8 import get_detector, detectClasses, renderClasses
+from media.image import readImage
+from benchmarks.reduced_decode import syntheticImages
+
+
+def classifyReduced(path: str, modelPath: str, inputSize: tuple) -> list:
+    img, shape = readImage(path, inputSize)
+    return detectClasses(img, modelPath, shape)
+
+
+def timed(function, paths: list) -> float:
+    start = time.perf_counter()
+    for path in paths:
+        function(path)
+    return (time.perf_counter() - start) * 1000 / len(paths)
+
+
+def run(modelPath: str, paths: list) -> None:
+    detector = get_detector(modelPath)
+    inputSize = (detector.input_height, detector.input_width)
+    images = [cv2.imread(path) for path in paths]
+    # Warm up the session
+    detectClasses(images[0], modelPath)
+
+    results = {
+        "full decode + render": timed(lambda path: renderClasses(cv2.imread(path), modelPath), paths),
+        "full decode, labels only": timed(lambda path: detectClasses(cv2.imread(path), modelPath), paths),
+        "reduced decode, labels only": timed(lambda path: classifyReduced(path, modelPath, inputSize), paths),
+    }
+    # Rendering alone, on already decoded images
+    start = time.perf_counter()
+    for image in images:
+        boxes, scores, class_ids = detector.detect_objects(image, conf_thres=0.3)
+        detector.draw_detections(image, boxes, scores, class_ids)
+    render = (time.perf_counter() - start) * 1000 / len(images)
+    start = time.perf_counter()
+    for image in images:
+        detector.detect_objects(image, conf_thres=0.3)
+    render -= (time.perf_counter() - start) * 1000 / len(images)
+
+    print(f"{len(paths)} images, {images[0].shape[1]}x{images[0].shape[0]}")
+    print(f"{'path':>28} {'ms/image':>10}")
+    for name, elapsed in results.items():
+        print(f"{name:>28} {elapsed:>10.2f}")
+    print(f"{'draw_detections alone':>28} {render:>10.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default="models/yolov8n.onnx")
+    parser.add_argument("--images", help="Folder of JPEG files")
+    parser.add_argument("--count", type=int, default=8)
+    parser.add_argument("--megapixels", type=float, default=24)
+    args = parser.parse_args()
+
+    if args.images:
+        files = sorted(glob.glob(os.path.join(args.images, "*.jp*g")) + glob.glob(os.path.join(args.images, "*.JP*G")))
+        run(args.model, files[:args.count])
+    else:
+        with tempfile.TemporaryDirectory() as folder:
+            run(args.model, syntheticImages(folder, args.count, args.megapixels))
@@ -0,0 +1,109 @@
+"""
+Cold start of the app: time from launching the interpreter until `/` answers,
+and where the import of `app` spends its time according to `python -X importtime`.
+
+The server is started the way `main.py` does it, without the window. HOME points to an empty
+temporary folder so the real library and database are left alone.
+
+Exits with status 1 when `import app` loads one of the --forbid modules, or when the median
+time to the first response is over --budget milliseconds, so it can guard against regressions.
+
+Usage:
+    python -m benchmarks.startup [--runs 5] [--port 5099] [--top 12] [--budget 1500]
+        [--forbid cv2 numpy onnxruntime]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SERVER = """
+import threading
+from app import indexer, startServer
+startServer(port={port})
+indexer.start()
+threading.Event().wait()
+"""
+
+
+def firstResponse(port: int, env: dict, timeout: float = 30.0) -> float:
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable, "-c", SERVER.format(port=port)], cwd=ROOT, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while time.perf_counter() - start < timeout:
+            if process.poll() is not None:
+                raise RuntimeError(f"Server exited with status {process.returncode}")
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/", timeout=1) as response:
+                    response.read()
+                    return (time.perf_counter() - start) * 1000
+            except OSError:
+                time.sleep(0.005)
+        raise TimeoutError(f"No response within {timeout}s")
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def importTimes(env: dict) -> dict:
+    # Each line is "import time: self [us] | cumulative | imported package", nested imports are indented
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import app"], cwd=ROOT, env=env,
+                            capture_output=True, text=True, check=True)
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        own, cumulative, name = line[len("import time:"):].split("|")
+        times[name.strip()] = (int(own), int(cumulative))
+    return times
+
+
+def run(runs: int, port: int, top: int, budget: float, forbid: list) -> int:
+    with tempfile.TemporaryDirectory() as home:
+        env = dict(os.environ, HOME=home, USERPROFILE=home, PYTHONPATH=ROOT)
+        times = importTimes(env)
+        responses = [firstResponse(port, env) for _ in range(runs)]
+
+    packages = defaultdict(int)
+    for name, (own, _) in times.items():
+        packages[name.split(".")[0]] += own
+    total = sum(packages.values())
+
+    print(f"import app: {total / 1000:.1f} ms, {len(times)} modules")
+    print(f"{'package':>20} {'ms':>8} {'share':>7}")
+    for name, own in sorted(packages.items(), key=lambda item: -item[1])[:top]:
+        print(f"{name:>20} {own / 1000:>8.1f} {own / total:>7.1%}")
+
+    median = statistics.median(responses)
+    print(f"First response to /: median {median:.1f} ms, min {min(responses):.1f} ms over {runs} runs")
+
+    failed = False
+    loaded = [name for name in forbid if name in times]
+    if loaded:
+        print(f"FAIL: import app loads {', '.join(loaded)}")
+        failed = True
+    if budget and median > budget:
+        print(f"FAIL: first response over the {budget:.0f} ms budget")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--port", type=int, default=5099)
+    parser.add_argument("--top", type=int, default=12, help="Number of packages in the import breakdown")
+    parser.add_argument("--budget", type=float, default=0, help="Maximum median first response in ms, 0 for none")
+    parser.add_argument("--forbid", nargs="*", default=["cv2", "numpy", "onnxruntime"],
+                        help="Modules that must not be imported by `import app`")
+    args = parser.parse_args()
+
+    sys.exit(run(args.runs, args.port, args.top, args.budget, args.forbid))
@@ -0,0 +1,168 @@
+"""
+Payload and latency of the image grid, loading the originals from /media (before)
+versus the cached thumbnails from /thumbnail, on first request (created) and afterwards (cached),
+and versus the same thumbnails in /thumbnails bundles.
+Video posters compare decoding and encoding the first frame on every request (before) with the cached posters.
+
+Requests go through the Flask test client, so the numbers are server time and bytes without the network.
+"Decode" is the time to decode the payloads, what the webview pays before it can paint the cards.
+
+HOME points to a temporary folder, so the database and thumbnail cache are fresh and the real ones are left alone.
+Without --images, synthetic JPEGs of --megapixels are written to a temporary folder,
+without --videos, synthetic 1080p clips with a black first second.
+
+Usage:
+    python -m benchmarks.thumbnails [--images ~/Pictures] [--videos ~/Videos] [--count 100] [--megapixels 12]
+"""
+import argparse
+import glob
+import json
+import os
+import struct
+import statistics
+import tempfile
+import time
+from urllib.parse import quote
+
+
+def fetch(client, urls: list) -> tuple:
+    payloads, latencies = [], []
+    for url in urls:
+        start = time.perf_counter()
+        response = client.get(url)
+        payloads.append(response.get_data())
+        latencies.append((time.perf_counter() - start) * 1000)
+    return payloads, latencies
+
+
+def syntheticVideos(folder: str, count: int, seconds: float = 4.0) -> list:
+    import cv2
+    import numpy as np
+
+    rng = np.random.default_rng(0)
+    paths = []
+    for i in range(count):
+        paths.append(os.path.join(folder, f"{i}.mp4"))
+        writer = cv2.VideoWriter(paths[-1], cv2.VideoWriter_fourcc(*"mp4v"), 25, (1920, 1080))
+        scene = cv2.resize(rng.integers(0, 255, (68, 120, 3), dtype=np.uint8), (1920, 1080))
+        for frame in range(int(seconds * 25)):
+            writer.write(scene if frame >= 25 else np.zeros_like(scene))
+        writer.release()
+    return paths
+
+
+def legacyPoster(path: str) -> bytes:
+    # getThumbnail before posters were cached: the first frame, full size, on every request
+    import cv2
+
+    cap = cv2.VideoCapture(path)
+    _, frame = cap.read()
+    cap.release()
+    return cv2.imencode(".jpg", frame)[1].tobytes()
+
+
+def timedCalls(function, paths: list) -> tuple:
+    payloads, latencies = [], []
+    for path in paths:
+        start = time.perf_counter()
+        payloads.append(function(path))
+        latencies.append((time.perf_counter() - start) * 1000)
+    return payloads, latencies
+
+
+def decodeTime(payloads: list) -> float:
+    import cv2
+    import numpy as np
+
+    start = time.perf_counter()
+    for payload in payloads:
+        cv2.imdecode(np.frombuffer(payload, np.uint8), cv2.IMREAD_COLOR)
+    return (time.perf_counter() - start) * 1000 / len(payloads)
+
+
+def unpack(bundles: list) -> list:
+    # Split /thumbnails bundles back into thumbnails, see app.packThumbnails
+    payloads = []
+    for bundle in bundles:
+        length = struct.unpack(">I", bundle[:4])[0]
+        start = 4 + length
+        for _, offset, size in json.loads(bundle[4:start])["items"]:
+            payloads.append(bundle[start + offset:start + offset + size])
+    return payloads
+
+
+def report(results: dict) -> None:
+    print(f"{'':>24} {'requests':>9} {'MiB':>9} {'total ms':>9} {'p95 ms':>8} {'decode ms':>10}")
+    for name, (payloads, latencies) in results.items():
+        p95 = statistics.quantiles(latencies, n=20)[-1] if len(latencies) > 1 else latencies[0]
+        if name.startswith("bundles"):
+            payloads = unpack(payloads)
+        print(f"{name:>24} {len(latencies):>9} {sum(map(len, payloads)) / 2**20:>9.2f} {sum(latencies):>9.1f} "
+              f"{p95:>8.2f} {decodeTime(payloads):>10.2f}")
+
+
+def run(paths: list, videos: list) -> None:
+    # Imported once HOME is set, the app creates its thumbnail cache on import
+    from config import dbPath, dbSchema, dbIndexes, thumbnailBundleSize
+    from utils import connectDB, createSchema, createIndexes, closeConnection, mediaPaths, getMediaIDForPath
+    from media.process import populateMediaTable
+    import app
+
+    folders = {os.path.dirname(path) for path in paths + videos}
+    conn = connectDB(dbPath())
+    createSchema(conn, dbSchema())
+    createIndexes(conn, dbIndexes())
+    for folder in folders:
+        populateMediaTable(conn, (item for item in mediaPaths(folder) if item[0] in paths + videos))
+    conn.commit()
+    mediaIDs = [str(getMediaIDForPath(conn, path)) for path in paths]
+    closeConnection(conn)
+    bundles = [f"/thumbnails?ids={','.join(mediaIDs[i:i + thumbnailBundleSize()])}" for i in range(0, len(mediaIDs), thumbnailBundleSize())]
+
+    client = app.app.test_client()
+    quoted = [quote(path.lstrip("/")) for path in paths]
+    results = {
+        "originals": fetch(client, [f"/media/{path}" for path in quoted]),
+        "thumbnails, created": fetch(client, [f"/thumbnail/{path}" for path in quoted]),
+        "thumbnails, cached": fetch(client, [f"/thumbnail/{path}" for path in quoted]),
+        f"bundles of {thumbnailBundleSize()}, cached": fetch(client, bundles),
+    }
+
+    print(f"{len(paths)} images, thumbnails of {app.thumbnails.size}px {app.thumbnails.format}")
+    report(results)
+
+    if videos:
+        quoted = [quote(path.lstrip("/")) for path in videos]
+        print(f"{len(videos)} videos")
+        report({
+            "first frame per request": timedCalls(legacyPoster, videos),
+            "posters, created": fetch(client, [f"/thumbnail/{path}" for path in quoted]),
+            "posters, cached": fetch(client, [f"/thumbnail/{path}" for path in quoted]),
+        })
+    print(f"Cache: {app.thumbnails.stats()}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", help="Folder of images")
+    parser.add_argument("--videos", help="Folder of videos")
+    parser.add_argument("--count", type=int, default=100)
+    parser.add_argument("--megapixels", type=float, default=12)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as home:
+        os.environ["HOME"] = os.environ["USERPROFILE"] = home
+        if args.images:
+            files = sorted(glob.glob(os.path.join(os.path.abspath(args.images), "*.*")))
+            images = [path for path in files if os.path.splitext(path)[1].lower() in (".jpg", ".jpeg", ".png", ".webp", ".bmp")][:args.count]
+        else:
+            from benchmarks.reduced_decode import syntheticImages
+            os.makedirs(os.path.join(home, "images"))
+            images = syntheticImages(os.path.join(home, "images"), args.count, args.megapixels)
+        if args.videos:
+            files = sorted(glob.glob(os.path.join(os.path.abspath(args.videos), "*.*")))
+            videos = [path for path in files if os.path.splitext(path)[1].lower() in (".mp4", ".mkv", ".webm")][:args.count]
+        else:
+            os.makedirs(os.path.join(home, "videos"))
+            videos = syntheticVideos(os.path.join(home, "videos"), max(1, args.count // 10))
+        run(images, videos)
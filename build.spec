@@ -1,4 +1,5 @@
 # -*- mode: python ; coding: utf-8 -*-
+from PyInstaller.utils.hooks import collect_submodules
 
 
 a = Analysis(
@@ -6,7 +7,8 @@ a = Analysis(
     pathex=[],
     binaries=[],
     datas=[('static/', 'static/'),('models/', 'models/'),],
-    hiddenimports=[],
+    # media and yolov8 import these on first use through importlib, which the analysis cannot follow
+    hiddenimports=collect_submodules('media') + ['yolov8.YOLOv8'],
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
@@ -1 +1 @@
-from .config import homeDir, dataDir, logPath, dbPath, dbSchema, yoloModelPath, LOG_CONFIG 
+from .config import homeDir, dataDir, logPath, dbPath, dbSchema, dbIndexes, yoloModelPath, quantizedModelPath, modelPrecision, sessionProfile, modelCacheDir, thumbnailDir, thumbnailSize, thumbnailFormat, thumbnailQuality, thumbnailCacheBytes, thumbnailMaxAge, hashedThumbnailMaxAge, thumbnailBundleSize, pregenerateThumbnails, mediaLookupSize, batchSize, hashWorkers, decodeWorkers, inferenceWorkers, classifyProcesses, frameInterval, maxVideoFrames, videoSampling, sceneProbeInterval, sceneThreshold, stableKeyframes, minSegmentLength, classThreshold, detectionFloor, LOG_CONFIG 
@@ -61,6 +61,11 @@ def dbSchema() -> Dict:
           "fileType TEXT CHECK(fileType IN ('img', 'vid'))",
           "timeStamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP",
           "hidden INTEGER",
+          "size INTEGER",
+          "mtime INTEGER",
+          "inode INTEGER",
+          "device INTEGER",
+          "fullHash TEXT",
       ],
       "CLASS": ["classID INTEGER PRIMARY KEY AUTOINCREMENT", "class TEXT UNIQUE"],
       "JUNCTION": [
@@ -70,6 +75,31 @@ def dbSchema() -> Dict:
           "FOREIGN KEY(classID) REFERENCES CLASS(classID)",
           "PRIMARY KEY (mediaID, classID)",
       ],
+      "DETECTIONS": [
+          "mediaID INTEGER",
+          "classID INTEGER",
+          "score REAL",
+          "x1 REAL",
+          "y1 REAL",
+          "x2 REAL",
+          "y2 REAL",
+          "frameTime REAL",
+          "FOREIGN KEY(mediaID) REFERENCES MEDIA(mediaID) ON DELETE CASCADE",
+          "FOREIGN KEY(classID) REFERENCES CLASS(classID)",
+      ],
+    }
+
+def dbIndexes() -> Dict:
+    """
+    Returns the database indexes, by name.
+
+    Returns:
+        Dict: The indexed table and columns of each index.
+    """
+    return {
+        "mediaPath": "MEDIA(path)",
+        "detectionsMedia": "DETECTIONS(mediaID, score)",
+        "detectionsScore": "DETECTIONS(score, mediaID, classID)",
     }
             
 def yoloModelPath() -> str:
@@ -82,6 +112,285 @@ def yoloModelPath() -> str:
     return "models/yolov8n.onnx"
 
 
+def quantizedModelPath() -> str:
+    """
+    Returns the path to the INT8 quantized variant of the YOLO model, created with `python -m yolov8.quantize`.
+
+    Returns:
+        str: The path to the quantized YOLO model.
+    """
+    return "models/yolov8n.int8.onnx"
+
+
+def modelPrecision() -> str:
+    """
+    Precision of the model used for classification.
+    'int8' uses `quantizedModelPath()` when it exists, which is faster on CPUs with fast integer kernels
+    at a small cost in accuracy, compare both with `python -m benchmarks.quantized` before switching.
+
+    Returns:
+        str: 'fp32' or 'int8'.
+    """
+    return "fp32"
+
+
+def sessionProfile() -> Dict:
+    """
+    ONNX Runtime session settings of the detection model.
+    Threads set to 0 let ONNX Runtime decide, 'parallel' execution only helps models with independent branches.
+
+    Returns:
+        Dict: intra_op_threads, inter_op_threads, execution_mode ('sequential' or 'parallel')
+        and optimization_level ('disable', 'basic', 'extended' or 'all').
+    """
+    return {
+        "intra_op_threads": 0,
+        "inter_op_threads": 0,
+        "execution_mode": "sequential",
+        "optimization_level": "all",
+    }
+
+def modelCacheDir() -> str:
+    """
+    Directory of the optimized models saved by ONNX Runtime, so later starts skip graph optimization.
+
+    Returns:
+        str: The path to the model cache directory.
+    """
+    directory = os.path.join(dataDir(), "models")
+    os.makedirs(directory, exist_ok=True)
+    return directory
+
+def thumbnailDir() -> str:
+    """
+    Directory of the cached image thumbnails.
+
+    Returns:
+        str: The path to the thumbnail cache directory.
+    """
+    directory = os.path.join(dataDir(), "thumbnails")
+    os.makedirs(directory, exist_ok=True)
+    return directory
+
+def thumbnailSize() -> int:
+    """
+    Longest edge of the thumbnails shown in the grid, in pixels.
+
+    Returns:
+        int: The thumbnail size.
+    """
+    return 320
+
+def thumbnailFormat() -> str:
+    """
+    Encoding of the cached thumbnails, WebP files are smaller at the same quality.
+
+    Returns:
+        str: 'jpg' or 'webp'.
+    """
+    return "jpg"
+
+def thumbnailQuality() -> int:
+    """
+    Encoder quality of the cached thumbnails, from 1 to 100.
+
+    Returns:
+        int: The thumbnail quality.
+    """
+    return 80
+
+def thumbnailCacheBytes() -> int:
+    """
+    Disk budget of the thumbnail cache, the least recently used thumbnails are deleted beyond it.
+
+    Returns:
+        int: The maximum size of the thumbnail cache in bytes.
+    """
+    return 512 * 2**20
+
+def thumbnailMaxAge() -> int:
+    """
+    Seconds the webview may reuse a thumbnail without asking again.
+    Thumbnails are requested by path and a file can change in place, so this is kept short,
+    afterwards the hash based ETag turns the request into a 304.
+
+    Returns:
+        int: The max-age of thumbnail responses.
+    """
+    return 60
+
+def hashedThumbnailMaxAge() -> int:
+    """
+    Seconds the webview may reuse a thumbnail requested by content hash from /t/<hash>.
+    Changed media get a new hash and so a new URL, only a change of thumbnailSize or thumbnailFormat
+    waits for this to expire.
+
+    Returns:
+        int: The max-age of thumbnail responses addressed by hash.
+    """
+    return 24 * 60 * 60
+
+def thumbnailBundleSize() -> int:
+    """
+    Most thumbnails sent in one /thumbnails bundle, the grid asks for them in chunks of this size.
+
+    Returns:
+        int: The maximum number of media IDs per bundle request.
+    """
+    return 100
+
+def pregenerateThumbnails() -> bool:
+    """
+    Whether the indexer creates the thumbnails and video posters of new media in the background after each run,
+    so the grid does not wait for them. Pregeneration stops once the cache is full.
+
+    Returns:
+        bool: True to pregenerate thumbnails.
+    """
+    return True
+
+def mediaLookupSize() -> int:
+    """
+    Number of media rows kept in memory to resolve /m/<mediaID> and /t/<hash> without querying the database.
+
+    Returns:
+        int: The maximum number of cached media rows.
+    """
+    return 4096
+
+def batchSize() -> int:
+    """
+    Number of images or video frames sent to the model in a single inference run.
+
+    Returns:
+        int: The classification batch size.
+    """
+    return 8
+
+def hashWorkers() -> int:
+    """
+    Number of threads hashing files while scanning.
+
+    Returns:
+        int: The size of the hashing pool.
+    """
+    return min(8, os.cpu_count() or 1)
+
+def decodeWorkers() -> int:
+    """
+    Number of threads decoding and preprocessing media for classification.
+
+    Returns:
+        int: The number of decoder threads.
+    """
+    return min(4, os.cpu_count() or 1)
+
+def inferenceWorkers() -> int:
+    """
+    Number of threads running inference on the shared model session.
+
+    Returns:
+        int: The number of inference threads.
+    """
+    return 1
+
+def classifyProcesses() -> int:
+    """
+    Number of worker processes classifying media, each with its own model session.
+    0 classifies in threads of the main process instead.
+    Worth enabling on many-core hosts where NumPy/OpenCV post-processing holds the GIL.
+
+    Returns:
+        int: The number of classification processes.
+    """
+    return 0
+
+def frameInterval() -> float:
+    """
+    Seconds of video between two frames sampled for classification.
+
+    Returns:
+        float: The sampling interval in seconds.
+    """
+    return 2.0
+
+def maxVideoFrames() -> int:
+    """
+    Maximum number of frames sampled from a single video, longer videos are sampled more sparsely.
+
+    Returns:
+        int: The frame budget per video.
+    """
+    return 120
+
+def videoSampling() -> str:
+    """
+    How frames of a video are picked for classification.
+    'scene' keeps only frames starting a new scene, 'interval' keeps every frameInterval() seconds.
+
+    Returns:
+        str: The sampling mode.
+    """
+    return "scene"
+
+def sceneProbeInterval() -> float:
+    """
+    Seconds of video between two frames probed for scene changes when videoSampling() is 'scene'.
+    Probes a second or more apart are reached by seeking, closer ones decode every frame in between.
+
+    Returns:
+        float: The probe interval in seconds.
+    """
+    return 1.0
+
+def sceneThreshold() -> float:
+    """
+    Histogram distance (0 to 1) from the previous keyframe above which a frame starts a new scene.
+
+    Returns:
+        float: The scene change threshold.
+    """
+    return 0.25
+
+def stableKeyframes() -> int:
+    """
+    Stop classifying a video once its detected classes were unchanged for this many consecutive frames.
+    0 classifies every sampled frame.
+
+    Returns:
+        int: The number of frames without new classes before stopping.
+    """
+    return 8
+
+def minSegmentLength() -> float:
+    """
+    Shortest stretch of video, in seconds, classified as a separate segment.
+    Videos shorter than twice this length are not split.
+
+    Returns:
+        float: The minimum segment length in seconds.
+    """
+    return 300.0
+
+def classThreshold() -> float:
+    """
+    Default confidence above which a detection tags its media with the class.
+
+    Returns:
+        float: The default confidence threshold.
+    """
+    return 0.3
+
+def detectionFloor() -> float:
+    """
+    Lowest confidence of the detections stored in the DETECTIONS table.
+    Classes can be regrouped at any threshold above it without running the model again.
+
+    Returns:
+        float: The confidence floor of stored detections.
+    """
+    return 0.1
+
 LOG_CONFIG = {
     "version": 1,
     "disable_existing_loggers": False,
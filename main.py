@@ -2,18 +2,15 @@
 
 import logging
 import logging.config
+import multiprocessing
 import queue
 import sys
 import webview
-from threading import Thread, Event
-from app import app
+from app import indexer, startServer
 from utils import StreamToLogger
 from config import *
 
 
-# This event will be set when we need to stop the Flask server
-stopEvent = Event()
-
 appTitle = "PictoPy"
 host = "http://127.0.0.1"
 port = 5000
@@ -48,15 +45,13 @@ def setupLogging() -> logging.Logger:
 
     return listener
 
-def run():
-    while not stopEvent.is_set():
-        app.run(port=port, use_reloader=False)
-
 if __name__ == '__main__':
-    t = Thread(target=run)
-    t.daemon = True  # This ensures the thread will exit when the main program exits
-    t.start()
+    # Classification worker processes re-run this module in frozen builds
+    multiprocessing.freeze_support()
+    server = startServer(port=port)
     listener = setupLogging()
+    # The UI is served already, the schema and the model warm-up come after it
+    indexer.start()
 
     webview.create_window(
         appTitle,
@@ -70,6 +65,6 @@ if __name__ == '__main__':
     
     webview.start()
 
-    stopEvent.set()  # Signal the Flask server to shut down
+    server.shutdown()
 
     listener.stop()
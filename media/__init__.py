@@ -1,3 +1,23 @@
-from .image import imageClasses
-from .video import videoClasses, getThumbnail
-from .process import populateMediaTable, classifyMedia
\ No newline at end of file
+import importlib
+
+# Submodules pull in OpenCV, NumPy and the detector, each is imported when one of its names is first used
+_lazy = {
+    "imageClasses": ".image",
+    "videoClasses": ".video",
+    "getThumbnail": ".video",
+    "populateMediaTable": ".process",
+    "classifyMedia": ".process",
+    "Indexer": ".indexer",
+    "ThumbnailCache": ".thumbnail",
+    "createThumbnail": ".thumbnail",
+    "MediaLookup": ".lookup",
+}
+__all__ = list(_lazy)
+
+
+def __getattr__(name):
+    if name not in _lazy:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(_lazy[name], __name__), name)
+    globals()[name] = value
+    return value
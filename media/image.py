@@ -1,7 +1,13 @@
 import cv2
+import struct
 import numpy as np
 from typing import List, Tuple
-from yolov8.YOLOv8 import detectClasses
+from yolov8 import get_detector
+from yolov8.YOLOv8 import detectClasses, renderClasses
+from config import classThreshold
+
+# Reduced JPEG decode flags by scale denominator, largest first
+REDUCED_FLAGS = ((8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4), (2, cv2.IMREAD_REDUCED_COLOR_2))
 
 def saveImage(image: cv2.Mat, filename: str) -> None:
     """
@@ -13,9 +19,78 @@ def saveImage(image: cv2.Mat, filename: str) -> None:
     """
     cv2.imwrite(filename, image)
 
-def imageClasses(imgPath: str, model_path: str, outputPath: str = None) -> List[str]:
+def jpegSize(imgPath: str) -> Tuple[int, int]:
+    """
+    Read the dimensions of a JPEG file from its frame header without decoding it.
+
+    Args:
+        imgPath (str): The path to the image file.
+
+    Returns:
+        Tuple[int, int]: The (height, width) of the image, None if it is not a readable JPEG.
+    """
+    try:
+        with open(imgPath, "rb") as f:
+            if f.read(2) != b"\xff\xd8":
+                return None
+            while True:
+                marker = f.read(2)
+                if len(marker) < 2 or marker[0] != 0xFF:
+                    return None
+                # Fill bytes may pad markers
+                while marker[1] == 0xFF:
+                    fill = f.read(1)
+                    if not fill:
+                        return None
+                    marker = marker[1:] + fill
+                code = marker[1]
+                if code in (0xD8, 0x01) or 0xD0 <= code <= 0xD7:
+                    continue
+                length = struct.unpack(">H", f.read(2))[0]
+                # SOF0-SOF15, except DHT (C4), JPG (C8) and DAC (CC)
+                if 0xC0 <= code <= 0xCF and code not in (0xC4, 0xC8, 0xCC):
+                    _, height, width = struct.unpack(">BHH", f.read(5))
+                    return (height, width) if height and width else None
+                f.seek(length - 2, 1)
+    except (OSError, struct.error):
+        return None
+
+def readImage(imgPath: str, inputSize: Tuple[int, int] = (640, 640)) -> Tuple[np.ndarray, Tuple[int, int]]:
+    """
+    Read an image at the smallest JPEG scale still at least as large as the detector input.
+    Other formats are read at full size.
+
+    Args:
+        imgPath (str): The path to the image file.
+        inputSize (Tuple[int, int]): The (height, width) of the detector input.
+
+    Returns:
+        Tuple[np.ndarray, Tuple[int, int]]: The image, None if it could not be read,
+        and the (height, width) of the full size image to rescale boxes to.
+    """
+    size = jpegSize(imgPath)
+    if size:
+        height, width = size
+        for scale, flag in REDUCED_FLAGS:
+            if height // scale >= inputSize[0] and width // scale >= inputSize[1]:
+                img = cv2.imread(imgPath, flag)
+                if img is None:
+                    break
+                # EXIF orientation is applied on decode, the header holds the stored dimensions
+                if (img.shape[0] > img.shape[1]) != (height > width):
+                    height, width = width, height
+                return img, (height, width)
+
     img = cv2.imread(imgPath)
-    _classes, processedImg = detectClasses(img, model_path)
+    return img, None if img is None else img.shape[:2]
+
+def imageClasses(imgPath: str, model_path: str, outputPath: str = None) -> List[str]:
     if outputPath:
+        # Detections are drawn on the full size image
+        _classes, processedImg = renderClasses(cv2.imread(imgPath), model_path, classThreshold())
         saveImage(processedImg, outputPath)
-    return _classes  
\ No newline at end of file
+        return _classes
+
+    detector = get_detector(model_path)
+    img, shape = readImage(imgPath, (detector.input_height, detector.input_width))
+    return detectClasses(img, model_path, shape, classThreshold())
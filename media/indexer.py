@@ -0,0 +1,248 @@
+import sys
+import time
+import threading
+from typing import Dict, List, Tuple
+from config import dbPath, dbSchema, dbIndexes, homeDir, yoloModelPath, quantizedModelPath, modelPrecision, sessionProfile, modelCacheDir, pregenerateThumbnails, batchSize, decodeWorkers, inferenceWorkers, classifyProcesses
+from utils import *
+from media.process import populateMediaTable, classifyMedia
+from yolov8 import configure_sessions, warm_up
+
+
+def locateModel(path: str) -> str:
+    """
+    Find a model next to the app or in the pyinstaller bundle.
+    Unlike pathOf, a model found in neither place is not an error.
+
+    Args:
+        path (str): Relative path of the model file.
+
+    Returns:
+        str: The path to the model file, None if it does not exist.
+    """
+    bundled = getattr(sys, "_MEIPASS", None)
+    for candidate in [path] + ([f"{bundled}/{path}"] if bundled else []):
+        if pathExist(candidate):
+            return candidate
+    return None
+
+
+def classificationModel() -> str:
+    """
+    Path of the model used for classification, the quantized variant when `modelPrecision()` is 'int8'.
+    Falls back to the full precision model when the quantized one has not been created.
+
+    Returns:
+        str: The path to the model file.
+    """
+    if modelPrecision() == "int8":
+        path = locateModel(quantizedModelPath())
+        if path is not None:
+            return path
+        print(f"Quantized model {quantizedModelPath()} not found, using {yoloModelPath()}")
+    # A missing model is reported when it is loaded
+    return locateModel(yoloModelPath()) or yoloModelPath()
+
+
+class Indexer:
+    """
+    Background worker that owns every write done while indexing:
+    walking and hashing the home directory, creating thumbnails, classifying media and cleaning the database.
+    Requests only trigger work and keep reading whatever has been committed so far.
+
+    Runs are single-flight: triggers arriving while a run is pending or in progress
+    are coalesced into it instead of starting another scan. Every run gets a generation
+    number so callers can wait for the run covering their trigger.
+    """
+
+    def __init__(self, thumbnails: "ThumbnailCache" = None, lookup: "MediaLookup" = None) -> None:
+        """
+        Args:
+            thumbnails (ThumbnailCache, optional): Cache to create the thumbnails of new media in after each run.
+            lookup (MediaLookup, optional): Cached media rows to clear whenever moved, changed or deleted media is committed.
+        """
+        self.thread = None
+        self.lock = threading.Lock()
+        self.condition = threading.Condition(self.lock)
+        self.requested = 0
+        self.started = 0
+        self.completed = 0
+        self.classify = False
+        self.runClassifies = False
+        self.running = False
+        self.counts = {"done": 0, "failed": 0, "runs": 0, "coalesced": 0}
+        self.busyTime = 0.0
+        self.pipeline = None
+        self.thumbnails = thumbnails
+        self.lookup = lookup
+        # Thread creating the thumbnails of the last run, see `pregenerate`
+        self.filler = None
+
+    def start(self) -> None:
+        """
+        Create the schema so requests can read right away, then start the worker thread.
+        The model is loaded and warmed up in the background meanwhile.
+        Calling it again is a no-op.
+        """
+        with self.lock:
+            if self.thread is not None:
+                return
+            conn = connectDB(dbPath())
+            createSchema(conn, dbSchema())
+            createIndexes(conn, dbIndexes())
+            closeConnection(conn)
+            configure_sessions(sessionProfile(), modelCacheDir())
+            warm_up(classificationModel())
+            self.thread = threading.Thread(target=self.run, name="indexer", daemon=True)
+            self.thread.start()
+
+    def request(self, groupBy: str = None, wait: bool = False) -> int:
+        """
+        Trigger an index run, or join the one that is already pending or in progress.
+
+        A run in progress that does not classify cannot serve a 'class' trigger,
+        so in that case a follow-up run is scheduled instead.
+
+        Args:
+            groupBy (str, optional): 'class' to also classify unlinked media. Defaults to None.
+            wait (bool, optional): Block until the run serving this trigger is committed.
+                Otherwise return at once and let the caller read the last committed state.
+
+        Returns:
+            int: The generation of the run serving this trigger.
+        """
+        classify = groupBy == "class"
+        with self.condition:
+            if self.requested > self.started:
+                # A run is pending, it will also cover this trigger
+                self.classify = self.classify or classify
+                self.counts["coalesced"] += 1
+            elif self.running and (self.runClassifies or not classify):
+                self.counts["coalesced"] += 1
+            else:
+                self.requested += 1
+                self.classify = classify
+                self.condition.notify_all()
+            generation = self.requested
+            if wait:
+                self.condition.wait_for(lambda: self.completed >= generation)
+            return generation
+
+    def run(self) -> None:
+        while True:
+            with self.condition:
+                self.condition.wait_for(lambda: self.requested > self.completed)
+                self.started = self.requested
+                self.runClassifies = self.classify
+                self.classify = False
+                self.running = True
+            start = time.perf_counter()
+            try:
+                self.updateDB("class" if self.runClassifies else None)
+            except Exception as e:
+                print(f"Indexing failed: {e}")
+            finally:
+                with self.condition:
+                    self.running = False
+                    self.completed = self.started
+                    self.counts["runs"] += 1
+                    self.busyTime += time.perf_counter() - start
+                    self.condition.notify_all()
+
+    def updateDB(self, groupBy: str = None) -> None:
+        """
+        Migrates data written by older versions and populates the media table.
+        Populates the media table with paths from the home directory.
+        Optionally classifies media by class if specified.
+        Cleans the database, then starts creating missing thumbnails in the background.
+
+        Args:
+            groupBy (str, optional): Specifies whether to classify media by 'class'. Defaults to None.
+        """
+        writeConn = connectDB(dbPath())
+        try:
+            upgradeDB(writeConn)
+            self.record(populateMediaTable(writeConn, mediaPaths(homeDir())), 0)
+            # Make the scanned media visible to readers before classification starts
+            writeConn.commit()
+            if self.lookup is not None:
+                self.lookup.clear()
+            if groupBy == "class":
+                from media.pipeline import ClassificationPipeline
+
+                # Process mode has no shared pipeline to report on
+                self.pipeline = None if classifyProcesses() else ClassificationPipeline(
+                    classificationModel(), decodeWorkers(), inferenceWorkers(), batchSize()
+                )
+                self.record(*classifyMedia(
+                    writeConn,
+                    classificationModel(),
+                    getUnlinkedMedia(writeConn),
+                    pipeline=self.pipeline,
+                ))
+            cleanDB(writeConn)
+            if self.thumbnails is not None:
+                # Files changed in place got a new hash, their old thumbnails are never asked for again
+                removed = self.thumbnails.retain({row[0] for row in getMediaHashes(writeConn, includeTrash=True)})
+                if removed:
+                    print(f"Removed {removed} stale thumbnails")
+                if pregenerateThumbnails():
+                    self.pregenerate(getMediaHashes(writeConn))
+        finally:
+            closeConnection(writeConn)
+            if self.lookup is not None:
+                # cleanDB deleted rows of missing files and old trash
+                self.lookup.clear()
+
+    def pregenerate(self, media: List[Tuple[str, str, str]]) -> None:
+        """
+        Create the missing thumbnails of media on a background thread, so a run, and requests waiting for it,
+        never wait for thumbnails. A fill still going from an earlier run is left to finish,
+        whatever it skips is created after the next run.
+
+        Args:
+            media (List[Tuple[str, str, str]]): (hash, path, fileType) of the media, most wanted first.
+        """
+        if self.filler is not None and self.filler.is_alive():
+            return
+
+        def fill() -> None:
+            created = self.thumbnails.fill(media, decodeWorkers())
+            if created:
+                print(f"Created {created} thumbnails")
+
+        self.filler = threading.Thread(target=fill, name="thumbnails", daemon=True)
+        self.filler.start()
+
+    def record(self, done: int, failed: int) -> None:
+        with self.lock:
+            self.counts["done"] += done
+            self.counts["failed"] += failed
+
+    def status(self) -> Dict[str, float]:
+        """
+        Get the progress of the indexer.
+
+        Returns:
+            Dict: Pending runs, whether a run is active, the last committed generation,
+            runs done and triggers coalesced into them, media indexed and failed so far,
+            throughput in media per second of indexing time,
+            the stage statistics of the latest classification pipeline, the thumbnail cache and the media lookup statistics.
+        """
+        pipeline = self.pipeline.stats() if self.pipeline else None
+        thumbnails = self.thumbnails.stats() if self.thumbnails else None
+        lookup = self.lookup.stats() if self.lookup else None
+        with self.lock:
+            done, failed = self.counts["done"], self.counts["failed"]
+            return {
+                "queued": int(self.requested > self.started),
+                "running": self.running,
+                "generation": self.completed,
+                "runs": self.counts["runs"],
+                "coalesced": self.counts["coalesced"],
+                "done": done,
+                "failed": failed,
+                "throughput": (done + failed) / self.busyTime if self.busyTime else 0.0,
+                "pipeline": pipeline,
+                "thumbnails": thumbnails,
+                "lookup": lookup,
+            }
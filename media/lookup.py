@@ -0,0 +1,85 @@
+import threading
+from collections import OrderedDict
+from typing import Dict, Tuple
+from utils import connectDB, closeConnection, getMediaRecord
+
+
+class MediaLookup:
+    """
+    Media rows by media ID and by hash in front of the database, so `/m/<mediaID>` and `/t/<hash>`
+    are resolved without opening a connection once a media has been seen.
+    The least recently used rows are dropped beyond `capacity` keys.
+
+    Rows go stale when the indexer moves, changes or deletes media, it calls `clear` after committing.
+    Only found rows are kept, media that is not indexed yet is looked up again on the next request.
+    """
+
+    def __init__(self, dbPath: str, capacity: int = 4096) -> None:
+        self.dbPath = dbPath
+        self.capacity = capacity
+        self.lock = threading.Lock()
+        # (column, value) to media row, least recently used first
+        self.rows = OrderedDict()
+        # Bumped by `clear`, a row read from the database before it is not cached
+        self.generation = 0
+        self.counts = {"hits": 0, "misses": 0}
+
+    def get(self, key: str, value) -> Tuple[int, str, str, str, Tuple[int, int, int, int]]:
+        """
+        Get the media row of a media ID or hash.
+
+        Args:
+            key (str): 'mediaID' or 'hash'.
+            value: The media ID or the hash.
+
+        Returns:
+            Tuple: mediaID, hash, path, fileType and the (size, mtime, inode, device) signature
+            recorded when the file was hashed, None if no media has this ID or hash.
+        """
+        with self.lock:
+            row = self.rows.get((key, value))
+            if row is not None:
+                self.rows.move_to_end((key, value))
+                self.counts["hits"] += 1
+                return row
+            self.counts["misses"] += 1
+            generation = self.generation
+
+        conn = connectDB(self.dbPath)
+        row = getMediaRecord(conn, key, value)
+        closeConnection(conn)
+        if row is None:
+            return None
+
+        with self.lock:
+            if generation == self.generation:
+                # The file and the thumbnail of a media are asked for by different keys
+                self.rows[("mediaID", row[0])] = row
+                self.rows[("hash", row[1])] = row
+                while len(self.rows) > self.capacity:
+                    self.rows.popitem(last=False)
+        return row
+
+    def forget(self, row: Tuple) -> None:
+        """
+        Drop a row found to be stale, so the next lookup of its media ID or hash reads the database.
+
+        Args:
+            row (Tuple): The row returned by `get`.
+        """
+        with self.lock:
+            self.rows.pop(("mediaID", row[0]), None)
+            self.rows.pop(("hash", row[1]), None)
+
+    def clear(self) -> None:
+        with self.lock:
+            self.rows.clear()
+            self.generation += 1
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Returns:
+            Dict: Lookups answered from memory and from the database, and the number of cached keys.
+        """
+        with self.lock:
+            return {**self.counts, "keys": len(self.rows)}
@@ -0,0 +1,111 @@
+import os
+import cv2
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Generator, List, Tuple
+from yolov8 import get_detector, configure_sessions
+from yolov8.YOLOv8 import uniqueClasses, namedDetections
+from media.image import readImage
+from media.video import videoFrames, ClassStability
+from config import stableKeyframes, classThreshold, detectionFloor, sessionProfile, modelCacheDir
+
+# Set in each worker process by initWorker()
+_modelPath = None
+_batchSize = 8
+
+
+def initWorker(modelPath: str, threads: int, batchSize: int) -> None:
+    """
+    Load the model once per worker process, with its share of the host's cores.
+
+    Args:
+        modelPath: Path to the detection model.
+        threads: Intra-op threads of the worker's ONNX session.
+        batchSize: Maximum number of frames per inference run.
+    """
+    global _modelPath, _batchSize
+    _modelPath, _batchSize = modelPath, batchSize
+    # OpenCV's own thread pool would compete with the other workers
+    cv2.setNumThreads(1)
+    configure_sessions(sessionProfile(), modelCacheDir())
+    get_detector(modelPath, threads)
+
+
+def classifyFile(row: Tuple[int, str, str]) -> Tuple[int, List[str], List[Tuple]]:
+    """
+    Classify a media file inside a worker process.
+
+    Args:
+        row: Tuple of mediaID, path, and fileType.
+
+    Returns:
+        Tuple of mediaID, its sorted unique classes above classThreshold() and its detections
+        above detectionFloor() as stored by insertDetections(). Classes are None if the file could not be classified.
+    """
+    mediaID, file, fileType = row
+    detector = get_detector(_modelPath)
+    try:
+        if fileType == "img":
+            img, shape = readImage(file, (detector.input_height, detector.input_width))
+            if img is None:
+                raise ValueError(f"Unable to read {file}")
+            times = [None]
+            frameBatches = [([img], [shape])]
+        else:
+            times = []
+            frameBatches = ((frames, None) for frames in batched(videoFrames(file, times=times), _batchSize))
+
+        threshold = classThreshold()
+        stability = ClassStability(stableKeyframes())
+        detections = []
+        for frames, shapes in frameBatches:
+            results = detector.detect_batch(frames, conf_thres=min(detectionFloor(), threshold), iou_thres=0.5, img_shapes=shapes)
+            stable = False
+            for (boxes, scores, class_ids), frameTime in zip(results, times[-len(frames):]):
+                detections.extend(detection + (frameTime,) for detection in namedDetections(boxes, scores, class_ids))
+                stable = stability.update(uniqueClasses(class_ids[scores > threshold])) or stable
+            if stable:
+                break
+        return mediaID, sorted(stability.classes), detections
+    except Exception as e:
+        print(e)
+        return mediaID, None, None
+
+
+def batched(frames: Generator, size: int) -> Generator[List, None, None]:
+    batch = []
+    for frame in frames:
+        batch.append(frame)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def classifyInProcesses(rows: List[Tuple[int, str, str]], modelPath: str, processes: int,
+                        batchSize: int = 8) -> Generator[Tuple[int, List[str], List[Tuple]], None, None]:
+    """
+    Classify media on a pool of processes, each owning its own ONNX session.
+    The host's cores are divided among the workers' intra-op thread pools.
+    At most a few media per worker are in flight.
+
+    Args:
+        rows: Tuples of mediaID, path, and fileType, e.g. from getUnlinkedMedia().
+        modelPath: Path to the detection model.
+        processes: Number of worker processes.
+        batchSize: Maximum number of frames per inference run.
+
+    Yields:
+        Tuple of mediaID, its classes (None on failure) and its detections, in input order.
+    """
+    threads = max(1, (os.cpu_count() or 1) // processes)
+    with ProcessPoolExecutor(max_workers=processes, initializer=initWorker,
+                             initargs=(modelPath, threads, batchSize)) as executor:
+        pending = deque()
+        for row in rows:
+            pending.append(executor.submit(classifyFile, row))
+            if len(pending) >= processes * 4:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
@@ -0,0 +1,389 @@
+import queue
+import sqlite3
+import threading
+import time
+import numpy as np
+from typing import Dict, Generator, List, Tuple
+from yolov8 import get_detector
+from yolov8.YOLOv8 import uniqueClasses, namedDetections
+from yolov8.preprocess import InputBuffers
+from utils import insertClassRelation, insertDetections
+from media.image import readImage
+from media.video import videoFrames, videoSegments, ClassStability
+from config import stableKeyframes, minSegmentLength, classThreshold, detectionFloor
+
+# Marks the end of a stage's input
+_DONE = object()
+
+
+class ClassificationPipeline:
+    """
+    Staged classification of media with bounded queues between the stages:
+
+    - decoders read images / sample video frames and run `prepare_input`,
+    - inference workers share one detector session and batch prepared frames across media,
+    - the calling thread is the single writer, inserting DETECTIONS and JUNCTION rows in periodic transactions.
+
+    Detections are kept down to the `floor` confidence, media are tagged with the classes above `threshold`.
+
+    Long videos are split into time segments decoded in parallel by different decoders.
+    Each segment travels as several chunks of at most `batchSize` frames, the writer merges
+    their classes once every chunk of every segment has been through inference.
+    """
+
+    def __init__(self, modelPath: str, decoders: int = 2, inferencers: int = 1, batchSize: int = 8,
+                 queueSize: int = 32, commitEvery: int = 64, patience: int = stableKeyframes(),
+                 minSegment: float = minSegmentLength(), threshold: float = classThreshold(),
+                 floor: float = detectionFloor()) -> None:
+        """
+        Args:
+            modelPath: Path to the detection model.
+            decoders: Number of decoding threads.
+            inferencers: Number of inference threads.
+            batchSize: Maximum number of frames per inference run.
+            queueSize: Capacity of each queue between stages.
+            commitEvery: Number of classified media per write transaction.
+            patience: Stop decoding a video segment once its classes were stable for this many frames, 0 never stops.
+            minSegment: Minimum length in seconds of a video segment decoded on its own.
+            threshold: Confidence above which a detection tags its media with the class.
+            floor: Confidence above which detections are stored.
+        """
+        self.patience = patience
+        self.minSegment = minSegment
+        self.threshold = threshold
+        self.floor = min(floor, threshold)
+        # Per segment class tracking, and the segments whose remaining frames can be skipped
+        self.stability = {}
+        self.stopped = set()
+        self.modelPath = modelPath
+        self.decoders = decoders
+        self.inferencers = inferencers
+        self.batchSize = batchSize
+        self.commitEvery = commitEvery
+        self.queueSize = queueSize
+        self.queues = {
+            "decode": queue.Queue(queueSize),
+            "inference": queue.Queue(queueSize),
+            "write": queue.Queue(queueSize),
+        }
+        self.lock = threading.Lock()
+        self.busy = {"decode": 0.0, "inference": 0.0, "write": 0.0}
+        self.items = {"decode": 0, "inference": 0, "write": 0}
+        self.maxDepth = {name: 0 for name in self.queues}
+        self.running = {"decode": 0, "inference": 0}
+        self.videoStats = {}
+        # Set when the writer fails, stages blocked on a full or empty queue give up instead of waiting for it
+        self.stopping = threading.Event()
+
+    def put(self, stage: str, item) -> bool:
+        """
+        Queue an item for `stage`, waiting while its queue is full.
+
+        Returns:
+            False if the pipeline is stopping and the item was dropped.
+        """
+        while not self.stopping.is_set():
+            try:
+                self.queues[stage].put(item, timeout=0.1)
+            except queue.Full:
+                continue
+            depth = self.queues[stage].qsize()
+            if depth > self.maxDepth[stage]:
+                self.maxDepth[stage] = depth
+            return True
+        return False
+
+    def take(self, stage: str):
+        """
+        Take the next item for `stage`, waiting while its queue is empty.
+
+        Returns:
+            The item, or _DONE once the pipeline is stopping.
+        """
+        while not self.stopping.is_set():
+            try:
+                return self.queues[stage].get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return _DONE
+
+    def measure(self, stage: str, start: float, items: int = 1) -> None:
+        with self.lock:
+            self.busy[stage] += time.perf_counter() - start
+            self.items[stage] += items
+
+    def finish(self, stage: str, nextStage: str, consumers: int) -> None:
+        """
+        Called when a worker of `stage` exits, the last one tells every consumer of `nextStage` to stop.
+        """
+        with self.lock:
+            self.running[stage] -= 1
+            last = self.running[stage] == 0
+        if last:
+            for _ in range(consumers):
+                self.put(nextStage, _DONE)
+
+    def run(self, conn, rowsToClassify: Generator[Tuple[int, str, str], None, None]) -> Tuple[int, int]:
+        """
+        Classify media and insert the results into the DETECTIONS and JUNCTION tables.
+
+        Args:
+            conn: The database connection object, only used from the calling thread.
+            rowsToClassify: A generator of tuples containing mediaID, file, and fileType.
+
+        Returns:
+            The number of media classified and the number that failed.
+        """
+        self.detector = get_detector(self.modelPath)
+        # Decoded tensors wait in the inference queue, recycle them once inference is done
+        self.buffers = InputBuffers((self.detector.input_height, self.detector.input_width), keep=self.queueSize)
+        self.running = {"decode": self.decoders, "inference": self.inferencers}
+        self.stopping.clear()
+        # Rows usually come from a query on `conn`, read them here since the connection is bound to this thread
+        rows = list(rowsToClassify)
+        threads = [threading.Thread(target=self.feed, args=(rows,), name="pipeline-feed", daemon=True)]
+        threads += [threading.Thread(target=self.decode, name=f"pipeline-decode-{i}", daemon=True) for i in range(self.decoders)]
+        threads += [threading.Thread(target=self.infer, name=f"pipeline-infer-{i}", daemon=True) for i in range(self.inferencers)]
+        for thread in threads:
+            thread.start()
+
+        try:
+            return self.write(conn)
+        except BaseException:
+            # The stage threads would otherwise wait forever on queues nobody drains
+            self.stopping.set()
+            raise
+        finally:
+            for thread in threads:
+                thread.join()
+
+    def feed(self, rows: List[Tuple[int, str, str]]) -> None:
+        try:
+            for mediaID, file, fileType in rows:
+                segments = [(0.0, None)]
+                if fileType == "vid" and self.decoders > 1:
+                    segments = videoSegments(file, self.minSegment, self.decoders)
+                # A unit is one segment of a media: (mediaID, segment index, segment count)
+                for index, segment in enumerate(segments):
+                    self.put("decode", ((mediaID, index, len(segments)), file, fileType, segment))
+        finally:
+            for _ in range(self.decoders):
+                self.put("decode", _DONE)
+
+    def decode(self) -> None:
+        while True:
+            item = self.take("decode")
+            if item is _DONE:
+                break
+            unit, file, fileType, segment = item
+            chunks = 0
+            start = time.perf_counter()
+            try:
+                for frames, shapes, times in self.readFrames(unit, file, fileType, segment):
+                    tensor = self.detector.prepare_batch(frames, out=self.buffers.acquire(len(frames)))
+                    self.measure("decode", start, len(frames))
+                    if not self.put("inference", (unit, chunks, tensor, shapes, times, False)):
+                        break
+                    chunks += 1
+                    start = time.perf_counter()
+                if chunks == 0:
+                    raise ValueError(f"Unable to read {file}")
+                # Empty chunk closing the unit, carries its chunk count
+                self.put("inference", (unit, chunks, None, [], [], True))
+            except Exception as e:
+                print(e)
+                self.put("inference", (unit, chunks, None, None, None, True))
+
+        self.finish("decode", "inference", self.inferencers)
+
+    def readFrames(self, unit: Tuple[int, int, int], file: str, fileType: str,
+                   segment: Tuple[float, float]) -> Generator[Tuple[List[np.ndarray], List[Tuple[int, int]], List[float]], None, None]:
+        """
+        Yield the frames to classify for a media file, in chunks of at most `batchSize`,
+        with the (height, width) their boxes are rescaled to and their time in seconds (None for images).
+        Images are decoded at a reduced size when large enough, boxes still refer to the full size.
+        A video segment stops early once inference found its classes to be stable.
+        """
+        if fileType == "img":
+            img, shape = readImage(file, (self.detector.input_height, self.detector.input_width))
+            if img is not None:
+                yield [img], [shape], [None]
+            return
+
+        stats = {}
+        frames = []
+        times = []
+        try:
+            for frame in videoFrames(file, stats, segment, unit[2], times):
+                frames.append(frame)
+                if len(frames) == self.batchSize:
+                    yield frames, [frame.shape[:2] for frame in frames], times[-len(frames):]
+                    frames = []
+                    with self.lock:
+                        if unit in self.stopped:
+                            break
+            else:
+                if frames:
+                    yield frames, [frame.shape[:2] for frame in frames], times[-len(frames):]
+        finally:
+            with self.lock:
+                for key, value in stats.items():
+                    self.videoStats[key] = self.videoStats.get(key, 0) + value
+
+    def infer(self) -> None:
+        while True:
+            item = self.take("inference")
+            if item is _DONE:
+                break
+            batch = [item]
+            frames = 0 if item[2] is None else len(item[2])
+            # Fill the batch with whatever else is already decoded
+            while frames < self.batchSize:
+                try:
+                    item = self.queues["inference"].get_nowait()
+                except queue.Empty:
+                    break
+                if item is _DONE:
+                    # Put it back for this worker's next iteration
+                    self.put("inference", item)
+                    break
+                batch.append(item)
+                frames += 0 if item[2] is None else len(item[2])
+
+            start = time.perf_counter()
+            self.classifyBatch(batch)
+            self.measure("inference", start, frames)
+
+        self.finish("inference", "write", 1)
+
+    def classifyBatch(self, batch: List[Tuple]) -> None:
+        tensors = [item[2] for item in batch if item[2] is not None]
+        try:
+            results = []
+            if tensors:
+                rows = sum(len(tensor) for tensor in tensors)
+                tensor = tensors[0] if len(tensors) == 1 else np.concatenate(tensors, axis=0, out=self.detector.input_buffer(rows))
+                shapes = [shape for item in batch if item[2] is not None for shape in item[3]]
+                # Models with a fixed batch dimension only accept that many frames per run
+                chunk = self.detector.batch_size or self.batchSize
+                for i in range(0, len(shapes), chunk):
+                    results.extend(self.detector.detect_prepared(tensor[i:i + chunk], shapes[i:i + chunk],
+                                                                 conf_thres=self.floor, iou_thres=0.5))
+        except Exception as e:
+            print(e)
+            for unit, chunk, tensor, _, _, last in batch:
+                self.put("write", (unit, chunk, None, None, last))
+            return
+        finally:
+            for tensor in tensors:
+                self.buffers.release(tensor)
+
+        offset = 0
+        for unit, chunk, tensor, shapes, times, last in batch:
+            if tensor is None:
+                # Closing chunk, None shapes mark a decoding failure
+                if shapes is None:
+                    self.put("write", (unit, chunk, None, None, last))
+                else:
+                    self.put("write", (unit, chunk, set(), [], last))
+                continue
+            frameClasses, detections = [], []
+            for (boxes, scores, class_ids), frameTime in zip(results[offset:offset + len(shapes)], times):
+                frameClasses.append(uniqueClasses(class_ids[scores > self.threshold]))
+                detections.extend(detection + (frameTime,) for detection in namedDetections(boxes, scores, class_ids))
+            offset += len(shapes)
+            with self.lock:
+                stability = self.stability.setdefault(unit, ClassStability(self.patience))
+                if any([stability.update(classes) for classes in frameClasses]):
+                    self.stopped.add(unit)
+            self.put("write", (unit, chunk, set().union(*frameClasses), detections, last))
+
+    def write(self, conn) -> Tuple[int, int]:
+        """
+        Merge chunk results per segment, then segments per media,
+        and insert them, committing every `commitEvery` media.
+        """
+        done, failed, uncommitted = 0, 0, 0
+        pending = {}
+        segments = {}
+        while True:
+            item = self.take("write")
+            if item is _DONE:
+                break
+            unit, chunk, classes, detections, last = item
+            mediaID, _, segmentCount = unit
+            start = time.perf_counter()
+
+            state = pending.setdefault(unit, {"classes": set(), "detections": [], "seen": 0, "total": None, "failed": False})
+            state["seen"] += 1
+            if classes is None:
+                state["failed"] = True
+            else:
+                state["classes"].update(classes)
+                state["detections"].extend(detections)
+            if last:
+                # The closing chunk's index is the number of chunks before it
+                state["total"] = chunk + 1
+
+            if state["total"] is None or state["seen"] < state["total"]:
+                self.measure("write", start)
+                continue
+
+            # Every chunk of the segment is in, merge it into its media
+            del pending[unit]
+            with self.lock:
+                self.stability.pop(unit, None)
+                self.stopped.discard(unit)
+            media = segments.setdefault(mediaID, {"classes": set(), "detections": [], "seen": 0, "failed": False})
+            media["seen"] += 1
+            media["classes"].update(state["classes"])
+            media["detections"].extend(state["detections"])
+            media["failed"] = media["failed"] or state["failed"]
+
+            if media["seen"] == segmentCount:
+                del segments[mediaID]
+                if media["failed"]:
+                    failed += 1
+                    self.measure("write", start)
+                    continue
+                try:
+                    insertDetections(conn, media["detections"], mediaID, commit=False)
+                    insertClassRelation(conn, sorted(media["classes"]) or ["unidentified"], mediaID, commit=False)
+                except sqlite3.Error as e:
+                    # The media was deleted meanwhile, e.g. from /delete
+                    print(f"Unable to store the classes of media {mediaID}: {e}")
+                    failed += 1
+                else:
+                    done += 1
+                    uncommitted += 1
+                    if uncommitted >= self.commitEvery:
+                        conn.commit()
+                        uncommitted = 0
+            self.measure("write", start)
+
+        conn.commit()
+        return done, failed
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """
+        Get per-stage statistics, the stage with the highest busy time per worker is the bottleneck.
+
+        Returns:
+            Dict: For each stage its worker count, busy seconds, items processed,
+            and the current and highest depth of its input queue.
+            The 'video' entry holds the frame counts of sampleFrames() summed over all videos.
+        """
+        workers = {"decode": self.decoders, "inference": self.inferencers, "write": 1}
+        with self.lock:
+            stats = {
+                stage: {
+                    "workers": workers[stage],
+                    "busy": round(self.busy[stage], 3),
+                    "items": self.items[stage],
+                    "queue": self.queues[stage].qsize(),
+                    "maxQueue": self.maxDepth[stage],
+                }
+                for stage in self.queues
+            }
+            stats["video"] = dict(self.videoStats)
+            return stats
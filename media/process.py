@@ -1,23 +1,63 @@
 import sqlite3
-from typing import Generator, Tuple
+from typing import Dict, Generator, Tuple
 from utils import *
-from media import *
+from config import batchSize, hashWorkers, decodeWorkers, inferenceWorkers, classifyProcesses
+from yolov8 import model_stats
 
-def populateMediaTable(conn: sqlite3.Connection, files: Generator[Tuple[str, str, str], None, None]) -> None:
+# Stat signature and fingerprint of the paths skipped as duplicates of media indexed under another path.
+# They have no row to record it in, and are not hashed again while unchanged and that fingerprint is still indexed
+_duplicates: Dict[str, Tuple[Tuple[int, int, int, int], str]] = {}
+
+def populateMediaTable(conn: sqlite3.Connection, files: Generator[Tuple[str, str, str], None, None], workers: int = hashWorkers()) -> int:
     """
-    Generate file hash.
-    If hash already exists, update the path of existing media files.
+    Skip files whose stat signature (size, mtime, inode, device) is unchanged since the last scan,
+    including skipped duplicates of media that is still indexed.
+    Otherwise generate the sampled file fingerprint, using a pool of `workers` threads.
+    Results are written to the database by the calling thread in walk order.
+    If the fingerprint already exists, update the path of existing media files.
+    If the path already exists, the file changed in place and its hash is replaced,
+    files over the sampling size are hashed whole to tell, see `resolveCollision`.
     Otherwise, insert data of new media files.
 
     Args:
         conn: The database connection object.
         files: A generator of file paths.
+        workers: Number of hashing threads.
+
+    Returns:
+        The number of files that were hashed.
     """
-    for file, fileType, parentDir in files:
-        fileHash = genHash(file)
-        if updateMediaPath(conn, file, parentDir, fileHash):
+    knownSignatures = getMediaSignatures(conn)
+    if _duplicates:
+        indexed = {row[0] for row in getMediaHashes(conn, includeTrash=True)}
+        for file, (_, fingerprint) in list(_duplicates.items()):
+            if fingerprint not in indexed:
+                # The original changed or is gone, the file may not be a duplicate anymore
+                del _duplicates[file]
+
+    def changedFiles() -> Generator[Tuple[str, str, str, Tuple], None, None]:
+        for file, fileType, parentDir in files:
+            fileStat = fileSignature(file)
+            if fileStat is not None and knownSignatures.get(file) != fileStat and _duplicates.get(file, (None,))[0] != fileStat:
+                yield file, fileType, parentDir, fileStat
+
+    hashed = 0
+    for (file, fileType, parentDir, fileStat), fileHash in genHashes(changedFiles(), workers, genFingerprint):
+        if fileHash is None:
             continue
-        insertMedia(conn, fileHash, file, parentDir, fileType)
+        hashed += 1
+        fingerprint, fileHash = fileHash, resolveCollision(conn, file, fileHash)
+        if fileHash is None:
+            _duplicates[file] = (fileStat, fingerprint)
+            continue
+        _duplicates.pop(file, None)
+        if updateMediaPath(conn, file, parentDir, fileHash, fileStat):
+            continue
+        if updateMediaContent(conn, file, fileHash, fileStat):
+            continue
+        insertMedia(conn, fileHash, file, parentDir, fileType, fileStat)
+    return hashed
+
     """
     We aren't passing this directly to classifyMedia().
     Yields:
@@ -25,25 +65,123 @@ def populateMediaTable(conn: sqlite3.Connection, files: Generator[Tuple[str, str
         yield insertMedia(conn, fileHash, file, parentDir, fileType)
     """
 
-def classifyMedia(conn: sqlite3.Connection, objDetectionModel: str, rowsToClassify: Generator[Tuple[int, str, str], None, None]) -> None:
+def classifyMedia(conn: sqlite3.Connection, objDetectionModel: str, rowsToClassify: Generator[Tuple[int, str, str], None, None], imageBatch: int = batchSize(), pipeline: "ClassificationPipeline" = None, processes: int = classifyProcesses()) -> Tuple[int, int]:
     """
     Classify media files.
     Establish relation between media files and classes,
-    By inserting result into Junction Table.
+    By inserting result into Junction Table, and their detections into the Detections Table.
+    Decoding, inference and inserts overlap in a ClassificationPipeline,
+    or run on `processes` worker processes when given and no pipeline is passed.
+    Frames are sent to the model in batches of `imageBatch`.
 
     Args:
         conn: The database connection object.
         rowsToClassify: A generator of tuples containing mediaID, file, and fileType.
+        imageBatch: Number of frames per inference run.
+        pipeline: Pipeline to run, lets callers watch its stage statistics. One is created if omitted.
+        processes: Number of classification processes, 0 uses the threaded pipeline.
+
+    Returns:
+        The number of media classified and the number that failed.
     """
-    for mediaID, file, fileType in rowsToClassify:
-        try:
-            if fileType == "vid":
-                mediaClass = videoClasses(file, objDetectionModel)
-            elif fileType == "img":
-                mediaClass = imageClasses(file, objDetectionModel)
-            if not mediaClass:
-                mediaClass = ["unidentified"]
-        except Exception as e:
-            print(e)
-            continue
-        insertClassRelation(conn, mediaClass, mediaID)
+    # Only classification needs OpenCV and the detector, directory scans never import them
+    from media.pipeline import ClassificationPipeline
+    from media.multiprocess import classifyInProcesses
+
+    if processes and pipeline is None:
+        done, failed = 0, 0
+        for mediaID, mediaClass, detections in classifyInProcesses(list(rowsToClassify), objDetectionModel, processes, imageBatch):
+            if mediaClass is None:
+                failed += 1
+                continue
+            insertDetections(conn, detections, mediaID, commit=False)
+            insertClassRelation(conn, mediaClass or ["unidentified"], mediaID, commit=False)
+            done += 1
+            if done % 64 == 0:
+                conn.commit()
+        conn.commit()
+    else:
+        if pipeline is None:
+            pipeline = ClassificationPipeline(objDetectionModel, decodeWorkers(), inferenceWorkers(), imageBatch)
+        done, failed = pipeline.run(conn, rowsToClassify)
+        for stage, stats in pipeline.stats().items():
+            print(f"Stage {stage}: {stats}")
+
+    for path, stats in model_stats().items():
+        print(f"Model {path}: loaded {stats['loads']} time(s) in {stats['load_time']:.2f}s, reused {stats['hits']} time(s)")
+    return done, failed
+
+def resolveCollision(conn: sqlite3.Connection, file: str, fingerprint: str) -> str:
+    """
+    Decide which key a file is stored under when its fingerprint is already taken by another path,
+    or by the same path after its stat signature changed.
+    Full-content hashes settle whether the files really match, they are computed lazily
+    and cached in MEDIA.fullHash.
+    When the other path no longer exists and nothing contradicts it, the file is treated as moved.
+    A sampled fingerprint misses edits in place between its chunks, so a file at the same path is hashed whole
+    and re-keyed by its full hash unless that matches the cached one.
+
+    Args:
+        conn: The database connection object.
+        file: The path to the media file.
+        fingerprint: The sampled fingerprint of the file.
+
+    Returns:
+        The fingerprint if there is no collision or the file was moved,
+        the full-content hash if the content differs,
+        the full-content hash the path is already keyed by if its content is unchanged,
+        None if the file is a duplicate of media already indexed under another path.
+    """
+    row = getMediaByHash(conn, fingerprint)
+    if row is None:
+        indexed = getMediaSignature(conn, file)
+        if indexed is None or not isSampled(fingerprint) or isSampled(indexed[0]):
+            return fingerprint
+        # Keyed by its full hash since an earlier edit in place, touching it again must not drop its classes
+        return indexed[0] if genHash(file) == indexed[0] else fingerprint
+
+    mediaID, path, fullHash = row
+    if path == file:
+        if not isSampled(fingerprint):
+            return fingerprint
+        fileHash = genHash(file)
+        if fileHash is None or fileHash == fullHash:
+            return fingerprint
+        return keyFor(conn, file, fileHash)
+
+    indexedExists = pathExist(path)
+    if not isSampled(fingerprint):
+        # Small files are hashed whole, a match means the same content
+        return None if indexedExists else fingerprint
+
+    if indexedExists and fullHash is None:
+        fullHash = genHash(path)
+        setFullHash(conn, mediaID, fullHash)
+    elif fullHash is None:
+        return fingerprint
+
+    fileHash = genHash(file)
+    if fileHash is None:
+        return None
+    if fileHash == fullHash:
+        return None if indexedExists else fingerprint
+
+    # Different content sharing a fingerprint
+    return keyFor(conn, file, fileHash)
+
+def keyFor(conn: sqlite3.Connection, file: str, fileHash: str) -> str:
+    """
+    Key a file by its full hash, unless that is indexed under another existing path too.
+
+    Args:
+        conn: The database connection object.
+        file: The path to the media file.
+        fileHash: The full-content hash of the file.
+
+    Returns:
+        The full-content hash, None if the file is a duplicate of media indexed under another path.
+    """
+    other = getMediaByHash(conn, fileHash)
+    if other is not None and other[1] != file and pathExist(other[1]):
+        return None
+    return fileHash
@@ -0,0 +1,308 @@
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Set, Tuple
+
+MIMETYPES = {"jpg": "image/jpeg", "webp": "image/webp"}
+
+
+def encodeThumbnail(img: "np.ndarray", size: int, fmt: str = "jpg", quality: int = 80) -> bytes:
+    """
+    Downscale an image to fit in a `size` pixels square and encode it.
+
+    Args:
+        img (np.ndarray): The BGR image.
+        size (int): The longest edge of the thumbnail.
+        fmt (str): 'jpg' or 'webp'.
+        quality (int): The encoder quality, from 1 to 100.
+
+    Returns:
+        bytes: The encoded thumbnail, None if encoding failed.
+    """
+    import cv2
+
+    height, width = img.shape[:2]
+    scale = size / max(height, width)
+    if scale < 1:
+        img = cv2.resize(img, (max(1, round(width * scale)), max(1, round(height * scale))), interpolation=cv2.INTER_AREA)
+
+    qualityFlag = cv2.IMWRITE_WEBP_QUALITY if fmt == "webp" else cv2.IMWRITE_JPEG_QUALITY
+    success, encoded = cv2.imencode(f".{fmt}", img, [qualityFlag, quality])
+    return encoded.tobytes() if success else None
+
+
+def createThumbnail(path: str, fileType: str, size: int, fmt: str = "jpg", quality: int = 80) -> bytes:
+    """
+    Create the thumbnail of a media file.
+    JPEGs are decoded at a reduced scale, so large photos are never decoded at full size.
+    Videos get their poster frame, see `media.video.posterFrame`.
+
+    Args:
+        path (str): The path to the media file.
+        fileType (str): 'img' or 'vid'.
+        size (int): The longest edge of the thumbnail.
+        fmt (str): 'jpg' or 'webp'.
+        quality (int): The encoder quality, from 1 to 100.
+
+    Returns:
+        bytes: The encoded thumbnail, None if the media could not be read.
+    """
+    # Imported on first use, the directory views never need OpenCV
+    if fileType == "vid":
+        from media.video import posterFrame
+        img = posterFrame(path)
+    else:
+        from media.image import readImage
+        img, _ = readImage(path, (size, size))
+    return None if img is None else encodeThumbnail(img, size, fmt, quality)
+
+
+class ThumbnailCache:
+    """
+    Image thumbnails and video posters on disk, keyed by the content hash of the media and the thumbnail size,
+    so moved or renamed files keep their thumbnails and files changed in place get new ones.
+    Thumbnails of hashes no longer indexed are dropped by `retain`.
+
+    The least recently used thumbnails are deleted once the cache grows over `budget` bytes.
+    Recency is tracked in memory and in the modification time of the files, which survives restarts.
+    """
+
+    def __init__(self, directory: str, size: int = 320, fmt: str = "jpg", quality: int = 80, budget: int = 512 * 2**20) -> None:
+        self.directory = directory
+        self.size = size
+        self.format = fmt
+        self.quality = quality
+        self.budget = budget
+        self.mimetype = MIMETYPES[fmt]
+        self.lock = threading.Lock()
+        # Path to file size, least recently used first, read from disk on first use
+        self.entries = None
+        self.total = 0
+        self.counts = {"hits": 0, "created": 0, "evicted": 0, "failed": 0}
+
+    def path(self, fileHash: str) -> str:
+        """
+        Get where the thumbnail of a media hash is stored, whether it exists or not.
+
+        Args:
+            fileHash (str): The hash of the media.
+
+        Returns:
+            str: The path to the thumbnail file.
+        """
+        return os.path.join(self.directory, fileHash[:2], f"{fileHash}_{self.size}.{self.format}")
+
+    def load(self) -> None:
+        # Called with the lock held
+        if self.entries is not None:
+            return
+        found = []
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                if name.endswith(".tmp"):
+                    # Left over by an interrupted write
+                    os.remove(path)
+                    continue
+                found.append((stat.st_mtime, path, stat.st_size))
+        found.sort()
+        self.entries = OrderedDict((path, size) for _, path, size in found)
+        self.total = sum(self.entries.values())
+
+    def contains(self, fileHash: str) -> bool:
+        """
+        Check if the thumbnail of a media hash is cached, without counting it as a use.
+
+        Args:
+            fileHash (str): The hash of the media.
+
+        Returns:
+            bool: True if the thumbnail is cached.
+        """
+        with self.lock:
+            self.load()
+            return self.path(fileHash) in self.entries
+
+    def get(self, fileHash: str, mediaPath: str, fileType: str = "img") -> str:
+        """
+        Get the cached thumbnail of a media file, creating it first if it is missing.
+
+        Args:
+            fileHash (str): The hash of the media, as stored in MEDIA.hash.
+            mediaPath (str): The path to the media file.
+            fileType (str): 'img' or 'vid'.
+
+        Returns:
+            str: The path to the thumbnail file, None if the media could not be read.
+        """
+        path = self.path(fileHash)
+        with self.lock:
+            self.load()
+            cached = path in self.entries
+            if cached:
+                self.entries.move_to_end(path)
+                self.counts["hits"] += 1
+        if cached:
+            try:
+                os.utime(path)
+                return path
+            except OSError:
+                # Deleted behind our back, create it again
+                self.forget(path)
+
+        data = self.create(mediaPath, fileType)
+        if data is None:
+            return None
+        try:
+            self.store(path, data)
+        except OSError as e:
+            print(f"Unable to store the thumbnail of {mediaPath}: {e}")
+            with self.lock:
+                self.counts["failed"] += 1
+            return None
+        return path
+
+    def create(self, mediaPath: str, fileType: str) -> bytes:
+        """
+        Create the thumbnail of a media file, counting media that could not be read as failed.
+        A corrupt file must not abort the other thumbnails of a batch or an index run.
+
+        Returns:
+            bytes: The encoded thumbnail, None if the media could not be read.
+        """
+        try:
+            data = createThumbnail(mediaPath, fileType, self.size, self.format, self.quality)
+        except Exception as e:
+            print(f"Unable to create the thumbnail of {mediaPath}: {e}")
+            data = None
+        if data is None:
+            with self.lock:
+                self.counts["failed"] += 1
+        return data
+
+    def getMany(self, media: List[Tuple[str, str, str]], workers: int = 4) -> List[str]:
+        """
+        Get the cached thumbnails of several media files, the missing ones are created in parallel.
+
+        Args:
+            media (List[Tuple[str, str, str]]): (hash, path, fileType) of the media.
+            workers (int): Number of threads decoding and encoding media.
+
+        Returns:
+            List[str]: The path to each thumbnail file, None for media that could not be read.
+        """
+        if all(self.contains(fileHash) for fileHash, _, _ in media):
+            return [self.get(*item) for item in media]
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(lambda item: self.get(*item), media))
+
+    def store(self, path: str, data: bytes, evict: bool = True) -> bool:
+        if not evict:
+            with self.lock:
+                if self.total + len(data) > self.budget:
+                    return False
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Readers never see a partially written file
+        temporary = f"{path}.{threading.get_ident()}.tmp"
+        with open(temporary, "wb") as f:
+            f.write(data)
+        os.replace(temporary, path)
+
+        evicted = []
+        with self.lock:
+            self.total += len(data) - self.entries.pop(path, 0)
+            self.entries[path] = len(data)
+            self.counts["created"] += 1
+            # The thumbnail just created is kept even if it alone is over budget
+            while self.total > self.budget and len(self.entries) > 1:
+                oldest, size = self.entries.popitem(last=False)
+                self.total -= size
+                evicted.append(oldest)
+            self.counts["evicted"] += len(evicted)
+        for oldest in evicted:
+            try:
+                os.remove(oldest)
+            except OSError:
+                pass
+        return True
+
+    def forget(self, path: str) -> None:
+        with self.lock:
+            self.total -= self.entries.pop(path, 0)
+
+    def retain(self, hashes: Set[str]) -> int:
+        """
+        Delete the thumbnails of media that are no longer indexed, or changed and got a new hash,
+        and those left by another thumbnail size or format.
+
+        Args:
+            hashes (Set[str]): The hashes of all indexed media.
+
+        Returns:
+            int: The number of thumbnails deleted.
+        """
+        with self.lock:
+            self.load()
+            stale = [path for path in self.entries
+                     if os.path.basename(path).rsplit("_", 1)[0] not in hashes
+                     or self.path(os.path.basename(path).rsplit("_", 1)[0]) != path]
+            for path in stale:
+                self.total -= self.entries.pop(path)
+        for path in stale:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        return len(stale)
+
+    def fill(self, media: Iterable[Tuple[str, str, str]], workers: int = 4) -> int:
+        """
+        Create the missing thumbnails of media, stopping once the next one would not fit in the budget,
+        so pregeneration never evicts thumbnails that are in use.
+
+        Args:
+            media (Iterable[Tuple[str, str, str]]): (hash, path, fileType) of the media, most wanted first.
+            workers (int): Number of threads decoding and encoding media.
+
+        Returns:
+            int: The number of thumbnails created.
+        """
+        missing = [item for item in media if not self.contains(item[0])]
+        stop = threading.Event()
+
+        def create(item: Tuple[str, str, str]) -> bool:
+            fileHash, mediaPath, fileType = item
+            if stop.is_set():
+                return False
+            data = self.create(mediaPath, fileType)
+            if data is None:
+                return False
+            try:
+                stored = self.store(self.path(fileHash), data, evict=False)
+            except OSError as e:
+                # Likely the disk is full, later thumbnails would fail the same way
+                print(f"Unable to store the thumbnail of {mediaPath}: {e}")
+                stop.set()
+                return False
+            if not stored:
+                stop.set()
+                return False
+            return True
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return sum(executor.map(create, missing))
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Returns:
+            Dict: Thumbnails served from the cache, created, evicted and failed,
+            and the number and total bytes of the cached thumbnails.
+        """
+        with self.lock:
+            self.load()
+            return {**self.counts, "thumbnails": len(self.entries), "bytes": self.total}
@@ -1,10 +1,16 @@
 import cv2
-from yolov8 import detectClasses
-from typing import Generator, Tuple, Set
+import itertools
+import math
+import numpy as np
+from config import frameInterval, maxVideoFrames, videoSampling, sceneProbeInterval, sceneThreshold, stableKeyframes, classThreshold
+from yolov8 import get_detector
+from yolov8.YOLOv8 import uniqueClasses
+from typing import Dict, Generator, List, Tuple, Set
 
 def extractFrames(inputPath: str, skip: int = 50) -> Generator[bytes, None, None]:
     """
     Extract frames from a video file.
+    Skipped frames are only grabbed, not converted to images.
 
     Args:
     - inputPath: Path to the input video file.
@@ -16,27 +22,245 @@ def extractFrames(inputPath: str, skip: int = 50) -> Generator[bytes, None, None
     cap = cv2.VideoCapture(inputPath)
     frameCount = 0
     while cap.isOpened():
-        ret, frame = cap.read()
-        if not ret:
-            break
         if frameCount % skip == 0:
+            ret, frame = cap.read()
+            if not ret:
+                break
             yield frame
+        elif not cap.grab():
+            break
         frameCount += 1
     cap.release()
 
-def processFrames(frames: Generator, modelPath: str) -> Generator[Tuple[str, bytes], None, None]:
+def sampleFrames(inputPath: str, interval: float = 2.0, maxFrames: int = 120, stats: Dict[str, int] = None,
+                 segment: Tuple[float, float] = (0.0, None), times: List[float] = None) -> Generator[bytes, None, None]:
+    """
+    Sample one frame every `interval` seconds of a video, at most `maxFrames` frames.
+    Longer videos are sampled more sparsely to stay within the budget.
+    Targets a second or more past the last frame read are reached by seeking, closer ones by grabbing,
+    so frames between samples are not converted and mostly not decoded at all.
+
+    Args:
+    - inputPath: Path to the input video file.
+    - interval: Seconds of video between two sampled frames.
+    - maxFrames: Maximum number of frames sampled.
+    - stats: Optional dictionary, gets 'videos', 'sampled', 'decoded' and 'seeks' counts added to it.
+    - segment: (start, end) in seconds of the part to sample, end None samples to the end of the video.
+    - times: Optional list, gets the position in seconds of each frame appended before it is yielded.
+
+    Returns:
+    - Generator: Yields the sampled frames.
+    """
+    cap = cv2.VideoCapture(inputPath)
+    if not cap.isOpened():
+        raise ValueError("Unable to open the video file.")
+
+    fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+    frameCount = int(cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
+    start, end = segment
+    if end is not None:
+        frameCount = min(frameCount, round(end * fps)) if frameCount > 0 else round(end * fps)
+    target = round(start * fps)
+    step = max(1, round(interval * fps))
+    if frameCount > 0:
+        step = max(step, math.ceil((frameCount - target) / maxFrames))
+
+    # Index of the frame the next read() returns
+    position = 0
+    sampled = decoded = seeks = 0
+    try:
+        while sampled < maxFrames and (frameCount <= 0 or target < frameCount):
+            gap = target - position
+            if gap + 1 >= fps and frameCount > 0 and cap.set(cv2.CAP_PROP_POS_FRAMES, target):
+                seeks += 1
+            else:
+                while gap > 0 and cap.grab():
+                    decoded += 1
+                    gap -= 1
+                if gap > 0:
+                    break
+            ret, frame = cap.read()
+            if not ret:
+                break
+            decoded += 1
+            sampled += 1
+            position = target + 1
+            if times is not None:
+                times.append(target / fps)
+            yield frame
+            target += step
+    finally:
+        cap.release()
+        if stats is not None:
+            for key, value in (("videos", 1), ("sampled", sampled), ("decoded", decoded), ("seeks", seeks)):
+                stats[key] = stats.get(key, 0) + value
+
+def frameHistogram(frame: np.ndarray, bins: int = 32) -> np.ndarray:
+    """
+    Normalised grey-level histogram of a downscaled frame, a cheap signature for scene detection.
+
+    Args:
+    - frame: BGR frame.
+    - bins: Number of histogram bins, must divide 256.
+
+    Returns:
+    - np.ndarray: Histogram summing to 1.
+    """
+    small = cv2.resize(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY), (64, 36), interpolation=cv2.INTER_AREA)
+    histogram = np.bincount(small.ravel() // (256 // bins), minlength=bins)
+    return histogram / small.size
+
+def sceneFrames(inputPath: str, probeInterval: float = 1.0, maxFrames: int = 120, threshold: float = 0.25,
+                stats: Dict[str, int] = None, segment: Tuple[float, float] = (0.0, None),
+                times: List[float] = None) -> Generator[bytes, None, None]:
+    """
+    Yield only the frames starting a new scene.
+    The video is probed every `probeInterval` seconds, a probe becomes a keyframe when the
+    histogram distance to the previous keyframe exceeds `threshold`.
+    Static footage yields few frames, short scenes in fast cuts are still caught.
+
+    Args:
+    - inputPath: Path to the input video file.
+    - probeInterval: Seconds of video between two probed frames.
+    - maxFrames: Maximum number of keyframes, four times as many frames are probed at most.
+    - threshold: Histogram distance (0 to 1) marking a scene change.
+    - stats: Optional dictionary, gets sampleFrames() counts and 'keyframes' added to it.
+    - segment: (start, end) in seconds of the part to probe, end None probes to the end of the video.
+    - times: Optional list, gets the position in seconds of each keyframe appended before it is yielded.
+
+    Returns:
+    - Generator: Yields the keyframes.
+    """
+    previous = None
+    keyframes = 0
+    probeTimes = []
+    try:
+        for frame in sampleFrames(inputPath, probeInterval, maxFrames * 4, stats, segment, probeTimes):
+            histogram = frameHistogram(frame)
+            # Total variation distance between the two histograms
+            if previous is not None and 0.5 * np.abs(histogram - previous).sum() <= threshold:
+                continue
+            previous = histogram
+            keyframes += 1
+            if times is not None:
+                times.append(probeTimes[-1])
+            yield frame
+            if keyframes >= maxFrames:
+                break
+    finally:
+        if stats is not None:
+            stats["keyframes"] = stats.get("keyframes", 0) + keyframes
+
+def videoFrames(inputPath: str, stats: Dict[str, int] = None, segment: Tuple[float, float] = (0.0, None),
+                segments: int = 1, times: List[float] = None) -> Generator[bytes, None, None]:
+    """
+    Frames of a video to classify, picked as configured by videoSampling().
+
+    Args:
+    - inputPath: Path to the input video file.
+    - stats: Optional dictionary for the sampler's counts.
+    - segment: (start, end) in seconds of the part to sample, end None samples to the end of the video.
+    - segments: Number of segments the video was split into, they share the frame budget.
+    - times: Optional list, gets the position in seconds of each frame appended before it is yielded.
+
+    Returns:
+    - Generator: Yields the frames to classify.
+    """
+    maxFrames = max(1, maxVideoFrames() // segments)
+    if videoSampling() == "scene":
+        return sceneFrames(inputPath, sceneProbeInterval(), maxFrames, sceneThreshold(), stats, segment, times)
+    return sampleFrames(inputPath, frameInterval(), maxFrames, stats, segment, times)
+
+def videoSegments(inputPath: str, minLength: float = 300.0, maxSegments: int = 4) -> List[Tuple[float, float]]:
+    """
+    Split a video into time ranges that can be classified in parallel, each with its own capture.
+    No segment is shorter than `minLength` seconds, so short clips stay whole.
+
+    Args:
+    - inputPath: Path to the input video file.
+    - minLength: Minimum segment length in seconds.
+    - maxSegments: Maximum number of segments.
+
+    Returns:
+    - List: (start, end) of each segment in seconds, the last one ends with None (end of video).
+    """
+    cap = cv2.VideoCapture(inputPath)
+    fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+    frameCount = cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0
+    cap.release()
+
+    duration = frameCount / fps
+    count = max(1, min(maxSegments, int(duration // minLength)))
+    length = duration / count
+    return [(i * length, (i + 1) * length if i < count - 1 else None) for i in range(count)]
+
+class ClassStability:
+    """
+    Tracks the classes found in a video's frames to stop once no new class turns up.
+    """
+
+    def __init__(self, patience: int) -> None:
+        """
+        Args:
+        - patience: Number of consecutive frames without new classes before the set counts as stable, 0 never does.
+        """
+        self.patience = patience
+        self.classes = set()
+        self.unchanged = 0
+
+    def update(self, classes: List[str]) -> bool:
+        """
+        Record the classes of the next frame.
+
+        Returns:
+        - bool: True once the set of classes has been stable for `patience` frames.
+        """
+        if set(classes) - self.classes:
+            self.classes.update(classes)
+            self.unchanged = 0
+        else:
+            self.unchanged += 1
+        return 0 < self.patience <= self.unchanged
+
+def processFrames(frames: Generator, modelPath: str, batchSize: int = 8, render: bool = False) -> Generator[Tuple[str, bytes], None, None]:
     """
     Process frames using a detection model.
+    Frames are sent to the model in batches of `batchSize`.
 
     Args:
     - frames: Generator yielding frames.
     - modelPath: Path to the detection model.
+    - batchSize: Number of frames per inference run.
+    - render: Draw the detections on a copy of each frame.
 
     Yields:
-    - Generator: Yields detected classes for each frame.
+    - Generator: Yields detected classes for each frame, with the annotated frame or None.
     """
+    detector = get_detector(modelPath)
+    batch = []
     for frame in frames:
-        yield detectClasses(frame, modelPath)
+        batch.append(frame)
+        if len(batch) == batchSize:
+            yield from detectFrames(detector, batch, render)
+            batch = []
+    if batch:
+        yield from detectFrames(detector, batch, render)
+
+def detectFrames(detector, frames: List, render: bool = False) -> Generator[Tuple[List[str], bytes], None, None]:
+    """
+    Run one batched detection over a list of frames.
+
+    Args:
+    - detector: The shared YOLOv8 detector.
+    - frames: Frames to detect objects in.
+    - render: Draw the detections on a copy of each frame.
+
+    Yields:
+    - Generator: Yields detected classes for each frame, with the annotated frame or None.
+    """
+    results = detector.detect_batch(frames, conf_thres=classThreshold(), iou_thres=0.5)
+    for frame, (boxes, scores, class_ids) in zip(frames, results):
+        yield uniqueClasses(class_ids), detector.draw_detections(frame, boxes, scores, class_ids) if render else None
 
 def saveVideo(outputPath: str, frames: Generator, fps: float, frameSize: Tuple[int, int]) -> None:
     """
@@ -57,59 +281,99 @@ def saveVideo(outputPath: str, frames: Generator, fps: float, frameSize: Tuple[i
 def videoClasses(inputPath: str, modelPath: str, outputPath: str = None) -> Set[str]:
     """
     Extract and save video classes.
+    Detection runs exactly once on each frame picked by videoFrames(),
+    and stops once the classes have been stable for stableKeyframes() frames.
 
     Args:
     - inputPath: Path to the input video file.
     - modelPath: Path to the detection model.
-    - outputPath: Optional path to save the output video file.
+    - outputPath: Optional path to save the annotated sampled frames as a video file.
 
     Returns:
     - Set[str]: Set of unique classes detected across all frames.
     """
-    frames = extractFrames(inputPath)
-    fps = cv2.VideoCapture(inputPath).get(cv2.CAP_PROP_FPS)
-    firstFrameClasses, firstFrame = next(processFrames(frames, modelPath))
+    stats = {}
+    stability = ClassStability(stableKeyframes())
 
-    def combinedFrames() -> Generator[bytes, None, None]:
-        yield firstFrame
-        for _, frame in processFrames(frames, modelPath):
+    def annotatedFrames() -> Generator[bytes, None, None]:
+        # Frames are only drawn on when they are saved
+        for classes, frame in processFrames(videoFrames(inputPath, stats), modelPath, render=bool(outputPath)):
+            stable = stability.update(classes)
             yield frame
+            if stable:
+                break
 
-    if outputPath:
+    frames = annotatedFrames()
+    firstFrame = next(frames, None) if outputPath else None
+    if firstFrame is not None:
         height, width, _ = firstFrame.shape
-        frameSize = (width, height)
+        # One output frame per sampled frame
+        saveVideo(outputPath, itertools.chain([firstFrame], frames), 1 / frameInterval(), (width, height))
+    else:
+        for _ in frames:
+            pass
 
-        # Save the first frame and the rest of the processed frames
-        saveVideo(outputPath, combinedFrames(), fps, frameSize)
+    print(f"{inputPath}: decoded {stats.get('decoded', 0)} frames for {stats.get('sampled', 0)} samples")
+    return stability.classes
 
-    # Collect and return combined classes from each frame of the video
-    allClasses = set(firstFrameClasses)
-    for classes, _ in processFrames(frames, modelPath):
-        allClasses.update(classes)
-    
-    return allClasses
-
-def getThumbnail(inputPath: str) -> bytes:
+def posterFrame(inputPath: str, positions: Tuple[float, ...] = (0.1, 0.25, 0.5, 0.75),
+                minBrightness: float = 24.0, minContrast: float = 16.0) -> np.ndarray:
     """
-    Get a single frame from the video and return it as a thumbnail.
+    Pick a representative frame of a video for its poster, instead of the often black first frame.
+    Frames at `positions` are tried in order, the first one that is neither dark nor flat
+    (fades, black intros, blank title cards) is used, otherwise the one with the most contrast.
 
     Args:
     - inputPath: Path to the input video file.
+    - positions: Candidate positions as fractions of the duration. Videos of unknown length use one per second instead.
+    - minBrightness: Minimum mean grey level of an acceptable frame, from 0 to 255.
+    - minContrast: Minimum standard deviation of the grey levels of an acceptable frame.
 
     Returns:
-    - bytes: Thumbnail image in bytes format.
+    - np.ndarray: The chosen frame, None if no frame could be read.
     """
     cap = cv2.VideoCapture(inputPath)
-    
-    # Ensure the video was opened successfully
     if not cap.isOpened():
-        raise ValueError("Unable to open the video file.")
-    
-    # Read the first frame
-    ret, frame = cap.read()
-    cap.release()
+        return None
 
-    if not ret:
+    fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+    frameCount = int(cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
+    best, bestContrast = None, -1.0
+    position = 0
+    try:
+        for i, fraction in enumerate(positions):
+            if frameCount > 0:
+                cap.set(cv2.CAP_PROP_POS_FRAMES, int(fraction * (frameCount - 1)))
+            else:
+                # Without a length to seek in, walk forward a second at a time
+                while position < round(i * fps) and cap.grab():
+                    position += 1
+            ret, frame = cap.read()
+            if not ret:
+                continue
+            position += 1
+            grey = cv2.cvtColor(cv2.resize(frame, (160, 90), interpolation=cv2.INTER_AREA), cv2.COLOR_BGR2GRAY)
+            mean, std = (value[0][0] for value in cv2.meanStdDev(grey))
+            if mean >= minBrightness and std >= minContrast:
+                return frame
+            if std > bestContrast:
+                best, bestContrast = frame, std
+    finally:
+        cap.release()
+    return best
+
+def getThumbnail(inputPath: str) -> bytes:
+    """
+    Get the poster frame of the video and return it as a thumbnail.
+
+    Args:
+    - inputPath: Path to the input video file.
+
+    Returns:
+    - bytes: Thumbnail image in bytes format.
+    """
+    frame = posterFrame(inputPath)
+    if frame is None:
         raise ValueError("Unable to read the video file.")
 
     # Encode the frame to JPEG format
@@ -121,4 +385,4 @@ def getThumbnail(inputPath: str) -> bytes:
     # Convert the encoded image to bytes
     thumbnailBytes = encodedImage.tobytes()
 
-    return thumbnailBytes
\ No newline at end of file
+    return thumbnailBytes
@@ -9,6 +9,16 @@ let groupBy = "directory";
 let openedGroup = "";
 let fetchController;
 let isShowingInfo = false;
+// Object URLs of the thumbnails loaded in bundles, by media ID
+let thumbnailURLs = new Map();
+// Most thumbnails per bundle request, matches config.thumbnailBundleSize()
+const bundleSize = 100;
+// Most bundle requests in flight at once, so the server creates missing thumbnails a few bundles at a time
+const maxBundleRequests = 2;
+// Bumped by every view, bundles still queued for a previous view are not requested
+let thumbnailView = 0;
+// Transparent image shown on cards until their bundle arrives, so no card requests its own thumbnail
+const placeholderThumbnail = 'data:image/gif;base64,R0lGODlhAQABAIAAAAAAAP///yH5BAEAAAAALAAAAAABAAEAAAIBRAA7';
 
 // Navbar configuration
 const navConfig = {
@@ -91,68 +101,128 @@ function hideLoading(button, originalSrc, originalCursor) {
     button.style.cursor = originalCursor;
 }
 
-// Get thumbnail URL based on the media type
-async function getThumbnail(path, type) {
-    if (type === 'vid') {
-        return `/thumbnail/${path}`;
-    } else {
-        return `/media/${path}`;
+// Get the thumbnail URL of a media from its loaded bundle, the placeholder until it is loaded
+function getThumbnail(id) {
+    return thumbnailURLs.get(id) || placeholderThumbnail;
+}
+
+// Load the thumbnails of media IDs that are not loaded yet, in bundles of up to bundleSize,
+// calling onBundle with the IDs of each bundle once it arrives
+async function fetchThumbnails(ids, onBundle = () => {}) {
+    const view = ++thumbnailView;
+    const missing = [...new Set(ids)].filter(id => !thumbnailURLs.has(id));
+    const bundles = [];
+    for (let i = 0; i < missing.length; i += bundleSize) {
+        bundles.push(missing.slice(i, i + bundleSize));
+    }
+    const next = async () => {
+        while (bundles.length > 0 && view === thumbnailView) {
+            const bundle = bundles.shift();
+            await fetchThumbnailBundle(bundle);
+            if (view === thumbnailView) onBundle(bundle);
+        }
+    };
+    await Promise.all(Array.from({ length: Math.min(maxBundleRequests, bundles.length) }, next));
+}
+
+// Swap the thumbnails of a loaded bundle into the card images of their media IDs.
+// Media the bundle has no thumbnail for, or all of them if its request failed, are requested on their own by content hash
+function swapThumbnails(images, ids) {
+    for (const id of ids) {
+        const image = images.get(id);
+        if (image) image.src = thumbnailURLs.get(id) || `/t/${image.dataset.hash}`;
     }
 }
 
-// Fetch thumbnails for a list of paths and types
-async function fetchThumbnails(paths, types) {
-    const thumbnailsPromises = paths.map(async (path, index) => {
-        const fileType = types[index];
-        return getThumbnail(path, fileType);
-    });
+// Unpack a bundle: a 4 byte length, a JSON index of that length, then the thumbnails back to back
+async function fetchThumbnailBundle(ids) {
+    try {
+        const response = await fetch(`/thumbnails?ids=${ids.join(',')}`);
+        if (!response.ok) {
+            throw new Error(`HTTP error! Status: ${response.status}`);
+        }
+        const buffer = await response.arrayBuffer();
+        const indexLength = new DataView(buffer).getUint32(0);
+        const index = JSON.parse(new TextDecoder().decode(new Uint8Array(buffer, 4, indexLength)));
+        const start = 4 + indexLength;
+        for (const [id, offset, length] of index.items) {
+            const blob = new Blob([new Uint8Array(buffer, start + offset, length)], { type: index.mimetype });
+            thumbnailURLs.set(String(id), URL.createObjectURL(blob));
+        }
+    } catch (error) {
+        console.error('Failed to fetch thumbnails:', error);
+    }
+}
 
-    return await Promise.all(thumbnailsPromises);
+// Drop the loaded thumbnails, the media may have changed since
+function releaseThumbnails() {
+    for (const url of thumbnailURLs.values()) {
+        URL.revokeObjectURL(url);
+    }
+    thumbnailURLs.clear();
 }
 
 // Create a card element
-function createCard(type, thumbnailSrc, altText, name = '', pathsArray = [], typesArray = [], index = -1) {
+function createCard(type, thumbnailSrc, altText, name = '', idsArray = [], typesArray = [], index = -1, hashesArray = []) {
     const card = document.createElement('div');
     card.className = 'card';
     card.dataset.type = type;
+    // Thumbnails are object URLs, cards are matched to selected media by ID
+    card.dataset.id = idsArray[Math.max(index, 0)] || '';
+    const hash = hashesArray[Math.max(index, 0)] || '';
 
     if (type === 'group') {
         card.classList.add('group');
         card.innerHTML = `
-            <img src="${thumbnailSrc}" alt="${altText}" class="thumbnail">
+            <img src="${thumbnailSrc}" alt="${altText}" class="thumbnail" data-hash="${hash}" loading="lazy">
             <div class="group-name">${name}</div>
         `;
-        card.addEventListener('click', () => handleGroupClick(name, pathsArray, typesArray, index));
+        card.addEventListener('click', () => handleGroupClick(name, idsArray, typesArray, hashesArray));
     } else {
         card.innerHTML = `
-            <img src="${thumbnailSrc}" alt="${altText}" class="thumbnail">
+            <img src="${thumbnailSrc}" alt="${altText}" class="thumbnail" data-hash="${hash}" loading="lazy">
         `;
-        card.addEventListener('click', () => handleMediaClick(pathsArray, typesArray, index));
+        card.addEventListener('click', () => handleMediaClick(idsArray, typesArray, index));
     }
 
     return card;
 }
 
 // Handle group card click
-function handleGroupClick(name, pathsArray, typesArray, index) {
+function handleGroupClick(name, idsArray, typesArray, hashesArray) {
     if (selectionMode) {
-        toggleGroupSelection(pathsArray);
+        toggleGroupSelection(idsArray);
     } else {
-        displayGroup(name, pathsArray, typesArray, index);
+        displayGroup(name, idsArray, typesArray, hashesArray);
     }
 }
 
 // Handle media card click
-function handleMediaClick(pathsArray, typesArray, index) {
+function handleMediaClick(idsArray, typesArray, index) {
     if (selectionMode) {
-        toggleMediaSelection(pathsArray[index]);
+        toggleMediaSelection(idsArray[index]);
     } else {
-        openMedia(pathsArray, index, typesArray);
+        openMedia(idsArray, index, typesArray);
+    }
+}
+
+// Wait until the background indexer has no pending or running work
+async function waitForIndexer() {
+    while (true) {
+        try {
+            const response = await fetch('/index/status');
+            const status = await response.json();
+            if (!status.running && status.queued === 0) return;
+        } catch (error) {
+            console.error('Failed to fetch indexing status:', error);
+            return;
+        }
+        await new Promise(resolve => setTimeout(resolve, 2000));
     }
 }
 
 // Display group cards with data
-async function displayData(_section, button) {
+async function displayData(_section, button, waitIndexing = true) {
     section = _section;
     localStorage.setItem('defaultSection', section)
 
@@ -168,6 +238,15 @@ async function displayData(_section, button) {
 
     if (data.length === 0) {
 
+        // The server answers from what has been indexed so far, check again once indexing settles
+        if (waitIndexing) {
+            container.textContent = 'Indexing media...';
+            await waitForIndexer();
+            // Skip if the user moved to another section meanwhile
+            if (section === _section) displayData(_section, button, false);
+            return;
+        }
+
         /*
         If media is being processed by models, revert to directory grouping 
         to avoid false positives indicating that the section is empty.
@@ -182,24 +261,32 @@ async function displayData(_section, button) {
         return;
     }
 
-    for (const [groupName, paths, types] of data) {
-        const pathsArray = paths.split(',').map(s => s.trim());
-        const typesArray = types.split(',').map(s => s.trim());
-
-        const thumbnails = await fetchThumbnails(pathsArray, typesArray);
-
-        const groupCard = createCard('group', thumbnails[0], groupName, groupName, pathsArray, typesArray);
-        container.appendChild(groupCard);
+    const groups = data.map(([groupName, ids, types, hashes]) => [
+        groupName,
+        ids.split(','),
+        types.split(','),
+        hashes.split(','),
+    ]);
 
+    releaseThumbnails();
+    const covers = new Map();
+    for (const [groupName, idsArray, typesArray, hashesArray] of groups) {
         if (openedGroup === groupName && selectionMode) {
-            displayGroup(groupName, pathsArray, typesArray);
-            break;
+            displayGroup(groupName, idsArray, typesArray, hashesArray);
+            return;
         }
+
+        const groupCard = createCard('group', getThumbnail(idsArray[0]), groupName, groupName, idsArray, typesArray, -1, hashesArray);
+        covers.set(idsArray[0], groupCard.querySelector('img'));
+        container.appendChild(groupCard);
     }
+
+    // The cover thumbnails of all groups come in one or a few bundles
+    await fetchThumbnails([...covers.keys()], ids => swapThumbnails(covers, ids));
 }
 
 // Display media cards within a group
-async function displayGroup(groupName, pathsArray, typesArray) {
+async function displayGroup(groupName, idsArray, typesArray, hashesArray) {
     openedGroup = groupName;
     const container = document.getElementById('dataContainer');
     
@@ -210,14 +297,19 @@ async function displayGroup(groupName, pathsArray, typesArray) {
 
     container.innerHTML = '';
 
-    for (let i = 0; i < pathsArray.length; i++) {
-        const path = pathsArray[i].trim();
-        const fileType = typesArray[i];
-        const thumbnail = await getThumbnail(path, fileType);
+    // Cards are drawn right away with the placeholder, their thumbnails are swapped in as the bundles arrive
+    const images = new Map();
+    const fragment = document.createDocumentFragment();
+    for (let i = 0; i < idsArray.length; i++) {
+        const thumbnail = getThumbnail(idsArray[i]);
 
-        const mediaCard = createCard('media', thumbnail, groupName, '', pathsArray, typesArray, i);
-        container.appendChild(mediaCard);
+        const mediaCard = createCard('media', thumbnail, groupName, '', idsArray, typesArray, i, hashesArray);
+        images.set(idsArray[i], mediaCard.querySelector('img'));
+        fragment.appendChild(mediaCard);
     }
+    container.appendChild(fragment);
+
+    await fetchThumbnails(idsArray, ids => swapThumbnails(images, ids));
 }
 
 // Open a media file in a floating window
@@ -227,7 +319,7 @@ function openMedia(mediaArray, mediaIndex, typesArray) {
     currentMediaIndex = mediaIndex;
     currentMediaTypesArray = typesArray; 
 
-    const mediaUrl = `/media/${currentMediaArray[currentMediaIndex]}`;
+    const mediaUrl = `/m/${currentMediaArray[currentMediaIndex]}`;
     const mediaType = currentMediaTypesArray[currentMediaIndex]; 
     const mediaContent = document.getElementById('mediaContent');
     const floatingWindow = document.getElementById('floatingWindow');
@@ -282,7 +374,7 @@ function toggleGroup(button) {
 function toggleSelectionMode() {
     selectionMode = !selectionMode;
     for (const card of document.getElementsByClassName('card')) {
-        card.classList.toggle('selected', selectedMedia.includes(card.querySelector('img').src));
+        card.classList.toggle('selected', selectedMedia.includes(card.dataset.id));
     }
     selectedMedia = [];
     // Deferred navbar update
@@ -290,38 +382,38 @@ function toggleSelectionMode() {
 }
 
 // Toggle selection of a media item
-function toggleMediaSelection(path) {
-    const index = selectedMedia.indexOf(path);
+function toggleMediaSelection(id) {
+    const index = selectedMedia.indexOf(id);
     if (index === -1) {
-        selectedMedia.push(path);
+        selectedMedia.push(id);
     } else {
         selectedMedia.splice(index, 1);
     }
-    updateCardSelection(path);
+    updateCardSelection(id);
 }
 
 // Toggle selection of all media items in a group
-function toggleGroupSelection(pathsArray) {
-    for (const path of pathsArray) {
-        toggleMediaSelection(path.trim());
+function toggleGroupSelection(idsArray) {
+    for (const id of idsArray) {
+        toggleMediaSelection(id);
     }
 }
 
 // Update the selection status of a card
-function updateCardSelection(path) {
-    console.log(`Called updateCardSelection with path: ${path}`);
+function updateCardSelection(id) {
+    console.log(`Called updateCardSelection with id: ${id}`);
     const cards = document.getElementsByClassName('card');
     console.log(`Found ${cards.length} cards`);
     for (const card of cards) {
         console.log(`Processing card: ${card.outerHTML}`);
-        if (card.querySelector('img').src.endsWith(path.replace(/\\/g, '/'))) {
-            card.classList.toggle('selected', selectedMedia.includes(path));
+        if (card.dataset.id === id) {
+            card.classList.toggle('selected', selectedMedia.includes(id));
             console.log("Selected");
         }
     }
 }
 
-// Send selected media paths to the specified route
+// Send selected media IDs to the specified route
 async function sendSelectedMedia(route) {
     if (selectedMedia.length === 0) return;
 
@@ -331,7 +423,7 @@ async function sendSelectedMedia(route) {
             headers: {
                 'Content-Type': 'application/json'
             },
-            body: JSON.stringify({ selectedMedia: selectedMedia })
+            body: JSON.stringify({ selectedMedia: selectedMedia.map(Number) })
         });
 
         if (!response.ok) {
@@ -386,8 +478,7 @@ function updateNavbar(mode = 'default') {
 async function fetchMediaInfo() {
     if (currentMediaIndex === -1) return {}; // Return empty object if no media is selected
 
-    const mediaPath = `/info/${currentMediaArray[currentMediaIndex]}`;
-    const mediaInfo = await readRoute(mediaPath);
+    const mediaInfo = await readRoute(`/i/${currentMediaArray[currentMediaIndex]}`);
 
     return mediaInfo;
 }
@@ -1,4 +1,4 @@
 
-from .fs import genHash, checkExtension, mediaPaths, deleteFile, pathExist, pathOf, decodeLinkPath
-from .db import createSchema, connectDB, createTable, closeConnection, groupByClass, groupByDir, updateMediaPath, hideByClass, deleteFromDB, cleanDB, insertMedia, insertClassRelation, toggleVisibility, moveToTrash, getUnlinkedMedia, getClassesForMediaID, getMediaIDForPath, getInfoByPath, executeQuery
+from .fs import genHash, genFingerprint, isSampled, genHashes, fileSignature, checkExtension, mediaPaths, deleteFile, pathExist, pathOf, decodeLinkPath
+from .db import createSchema, createIndexes, upgradeDB, connectDB, createTable, closeConnection, groupByClass, groupByDir, updateMediaPath, updateMediaContent, getMediaSignatures, getMediaByHash, setFullHash, hideByClass, deleteFromDB, deleteByID, cleanDB, insertMedia, insertClassRelation, insertDetections, toggleVisibility, toggleVisibilityByID, moveToTrash, moveToTrashByID, getUnlinkedMedia, getClassesForMediaID, getMediaIDForPath, getMediaForPath, getMediaSignature, getMediaRecord, getMediaForIDs, getMediaHashes, getInfoByID, getInfoByPath, executeQuery
 from .log import StreamToLogger
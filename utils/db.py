@@ -1,6 +1,6 @@
 import sqlite3
 from typing import List, Dict, Tuple, Generator
-from utils.fs import deleteFile, pathExist
+from utils.fs import deleteFile, pathExist, genFingerprint, isSampled
 
 def connectDB(dbPath: str) -> sqlite3.Connection:
     """Connects to the database at the given path.
@@ -32,8 +32,24 @@ def createTable(conn: sqlite3.Connection, tableID: str, columns: List[str]) -> N
     query = f"CREATE TABLE IF NOT EXISTS {tableID} ({', '.join(columns)})"
     executeQuery(conn, query)
 
+def addMissingColumns(conn: sqlite3.Connection, tableID: str, columns: List[str]) -> None:
+    """Adds columns to an existing table that were introduced after it was created.
+
+    Args:
+        conn: A sqlite3.Connection object.
+        tableID: The name of the table to migrate.
+        columns: A list of column definitions.
+    """
+    existing = {row[1] for row in executeQuery(conn, f"PRAGMA table_info({tableID})").fetchall()}
+    for column in columns:
+        name = column.split()[0]
+        if name.upper() in ("FOREIGN", "PRIMARY", "UNIQUE", "CHECK") or name in existing:
+            continue
+        executeQuery(conn, f"ALTER TABLE {tableID} ADD COLUMN {column}")
+
 def createSchema(conn: sqlite3.Connection, tables: Dict[str, List[str]]) -> None:
     """Creates tables for MEDIA, JUNCTION, and CLASS in the database.
+    Tables created by older versions get the missing columns added.
 
     Args:
         conn: A sqlite3.Connection object.
@@ -41,6 +57,43 @@ def createSchema(conn: sqlite3.Connection, tables: Dict[str, List[str]]) -> None
     """
     for tableName, columns in tables.items():
         createTable(conn, tableName, columns)
+        addMissingColumns(conn, tableName, columns)
+
+def createIndexes(conn: sqlite3.Connection, indexes: Dict[str, str]) -> None:
+    """Creates the indexes that do not exist yet.
+
+    Args:
+        conn: A sqlite3.Connection object.
+        indexes: A dictionary where each key is an index name and each value the indexed table and columns.
+    """
+    for indexName, columns in indexes.items():
+        executeQuery(conn, f"CREATE INDEX IF NOT EXISTS {indexName} ON {columns}")
+
+def upgradeDB(conn: sqlite3.Connection) -> None:
+    """Migrates data written by older versions, tracked with PRAGMA user_version.
+
+    Version 1: MEDIA.hash holds sampled fingerprints of large files instead of full-content hashes.
+    The previous full hash is kept in fullHash. If two files end up with the same fingerprint
+    the older full hash stays as the key.
+
+    Args:
+        conn: A sqlite3.Connection object.
+    """
+    version = executeQuery(conn, "PRAGMA user_version").fetchone()[0]
+    if version < 1:
+        rows = executeQuery(conn, "SELECT mediaID, path, hash FROM MEDIA").fetchall()
+        for mediaID, path, fileHash in rows:
+            if not pathExist(path):
+                continue
+            fingerprint = genFingerprint(path)
+            if fingerprint is None or not isSampled(fingerprint):
+                continue
+            try:
+                executeQuery(conn, "UPDATE MEDIA SET hash = ?, fullHash = ? WHERE mediaID = ?", [fingerprint, fileHash, mediaID])
+            except sqlite3.IntegrityError:
+                executeQuery(conn, "UPDATE MEDIA SET fullHash = ? WHERE mediaID = ?", [fileHash, mediaID])
+        executeQuery(conn, "PRAGMA user_version = 1")
+        conn.commit()
 
 def executeQuery(conn: sqlite3.Connection, query: str, params: List = ()) -> sqlite3.Cursor:
     """Executes a query on the database.
@@ -84,7 +137,7 @@ def hashExist(conn: sqlite3.Connection, hashValue: str) -> bool:
     result = executeQuery(conn, query, [hashValue])
     return result[0][0] == 1
 
-def groupByClass(conn: sqlite3.Connection, hidden: int = 0, fileType: str = "img", groupOf: str = "path") -> List[Tuple[str, str]]:
+def groupByClass(conn: sqlite3.Connection, hidden: int = 0, fileType: str = "img", groupOf: str = "path", threshold: float = None) -> List[Tuple[str, str]]:
     """Returns paths grouped by classes from the database.
 
     Args:
@@ -92,29 +145,53 @@ def groupByClass(conn: sqlite3.Connection, hidden: int = 0, fileType: str = "img
         hidden: Filter media by hidden status.
         fileType: Filter media by file type ('img' or 'vid').
         groupOf: The column to be grouped.
+        threshold: Confidence above which stored detections count, None uses the classes of the JUNCTION table.
+            Media without stored detections keep their JUNCTION classes, media whose detections all fall
+            below the threshold are 'unidentified'.
 
     Returns:
-        A list of tuples where each tuple contains a class name and a group of paths.
+        A list of tuples where each tuple contains a class name, a group of `groupOf` values, their file types and their hashes.
     """
     if fileType == "any":
         fileTypeCondition = ""
     else:
         fileTypeCondition = "AND i.fileType = ?"
 
+    params = [hidden] if fileType == "any" else [hidden, fileType]
+    if threshold is None:
+        labels = """
+        SELECT j.mediaID, c.class
+        FROM JUNCTION j
+        JOIN CLASS c ON c.classID = j.classID
+        """
+    else:
+        labels = """
+        SELECT DISTINCT d.mediaID, c.class
+        FROM DETECTIONS d
+        JOIN CLASS c ON c.classID = d.classID
+        WHERE d.score > ?
+        UNION
+        SELECT j.mediaID, c.class
+        FROM JUNCTION j
+        JOIN CLASS c ON c.classID = j.classID
+        WHERE NOT EXISTS (SELECT 1 FROM DETECTIONS d WHERE d.mediaID = j.mediaID)
+        UNION
+        SELECT d.mediaID, 'unidentified'
+        FROM DETECTIONS d
+        GROUP BY d.mediaID
+        HAVING MAX(d.score) <= ?
+        """
+        params = [threshold, threshold] + params
+
     query = f"""
-    SELECT c.class, GROUP_CONCAT(i.{groupOf}), GROUP_CONCAT(i.fileType)
-    FROM CLASS c
-    JOIN JUNCTION j ON c.classID = j.classID 
-    JOIN MEDIA i ON j.mediaID = i.mediaID 
+    SELECT l.class, GROUP_CONCAT(i.{groupOf}), GROUP_CONCAT(i.fileType), GROUP_CONCAT(i.hash)
+    FROM ({labels}) l
+    JOIN MEDIA i ON l.mediaID = i.mediaID 
     WHERE i.hidden = ? {fileTypeCondition}
-    GROUP BY c.class
+    GROUP BY l.class
     """
-    result = {}
-    if fileType == "any":
-        cursor = executeQuery(conn, query, [hidden])
-    else:
-        cursor = executeQuery(conn, query, [hidden, fileType])
-    
+    cursor = executeQuery(conn, query, params)
+
     return cursor.fetchall()
 
 def groupByDir(conn: sqlite3.Connection, hidden: int = 0, fileType: str = "img", groupOf: str = "path") -> List[Tuple[str, str]]:
@@ -127,7 +204,7 @@ def groupByDir(conn: sqlite3.Connection, hidden: int = 0, fileType: str = "img",
         groupOf: The column to be grouped.
 
     Returns:
-        A list of tuples where each tuple contains a directory name and a group of paths.
+        A list of tuples where each tuple contains a directory name, a group of `groupOf` values, their file types and their hashes.
     """
     if fileType == "any":
         fileTypeCondition = ""
@@ -135,7 +212,7 @@ def groupByDir(conn: sqlite3.Connection, hidden: int = 0, fileType: str = "img",
         fileTypeCondition = "AND fileType = ?"
 
     query = f"""
-    SELECT directory, GROUP_CONCAT({groupOf}), GROUP_CONCAT(fileType) 
+    SELECT directory, GROUP_CONCAT({groupOf}), GROUP_CONCAT(fileType), GROUP_CONCAT(hash)
     FROM MEDIA
     WHERE hidden = ? {fileTypeCondition}
     GROUP BY directory
@@ -159,6 +236,17 @@ def toggleVisibility(conn: sqlite3.Connection, paths: List[str], hidden: int) ->
     query = f"UPDATE MEDIA SET hidden=? WHERE path IN ({', '.join('?' * len(paths))})"
     executeQuery(conn, query, [hidden] + paths)
 
+def toggleVisibilityByID(conn: sqlite3.Connection, mediaIDs: List[int], hidden: int) -> None:
+    """Switch visibility of media by ID.
+
+    Args:
+        conn: sqlite3.Connection object.
+        mediaIDs: A list of media IDs to switch visibility.
+        hidden: The new value of hidden column.
+    """
+    query = f"UPDATE MEDIA SET hidden=? WHERE mediaID IN ({', '.join('?' * len(mediaIDs))})"
+    executeQuery(conn, query, [hidden] + mediaIDs)
+
 def listByClass(conn: sqlite3.Connection, classes: List[str], hidden: int = 0, groupOf: str = "path") -> List[str]:
     """List all paths associated with the given classes.
 
@@ -207,6 +295,15 @@ def deleteFromDB(conn: sqlite3.Connection, paths: List[str]) -> None:
     executeQuery(conn, query, paths)
     deleteFile(paths)
 
+def deleteByID(conn: sqlite3.Connection, mediaIDs: List[int]) -> None:
+    """Deletes media by ID, their rows and their files.
+
+    Args:
+        conn: sqlite3.Connection object.
+        mediaIDs: A list of media IDs to delete.
+    """
+    deleteFromDB(conn, [path for _, path, _ in getMediaForIDs(conn, mediaIDs).values()])
+
 def deleteByClass(conn: sqlite3.Connection, classes: List[str]) -> None:
     """Deletes media by class.
 
@@ -253,28 +350,88 @@ def cleanDB(conn: sqlite3.Connection) -> None:
         print(paths)
         deleteFromDB(conn, paths)
 
-def updateMediaPath(conn, file, directory, fileHash):
-    """Updates the path and directoryof a media file in the database.
+def updateMediaPath(conn, file, directory, fileHash, fileStat=(None, None, None, None)):
+    """Updates the path, directory and stat signature of a media file in the database.
 
     Args:
         conn: sqlite3.Connection object.
         file: The path to the media file.
         fileHash: The hash value of the media.
+        fileStat: The (size, mtime, inode, device) signature of the file.
 
     Returns:
         True if the path was updated, False otherwise.
     """
-    if executeQuery(conn, "UPDATE MEDIA SET path = ?, directory = ? WHERE hash = ?", [file, directory, fileHash]).rowcount == 0:
+    query = "UPDATE MEDIA SET path = ?, directory = ?, size = ?, mtime = ?, inode = ?, device = ? WHERE hash = ?"
+    if executeQuery(conn, query, [file, directory, *fileStat, fileHash]).rowcount == 0:
         return False
     return True
 
-def insertMedia(conn: sqlite3.Connection, fileHash: str, file: str, directory: str, fileType: str) -> Tuple[int, str, str]:
+def updateMediaContent(conn: sqlite3.Connection, file: str, fileHash: str, fileStat=(None, None, None, None)) -> bool:
+    """Replaces the hash of a media file whose content changed in place.
+    Its classes and detections are dropped so that it gets classified again.
+
+    Args:
+        conn: sqlite3.Connection object.
+        file: The path to the media file.
+        fileHash: The new hash value of the media.
+        fileStat: The (size, mtime, inode, device) signature of the file.
+
+    Returns:
+        True if a row for the path was updated, False otherwise.
+    """
+    mediaID = getMediaIDForPath(conn, file)
+    if mediaID is None:
+        return False
+    # The cached full-content hash belongs to the old content
+    query = "UPDATE MEDIA SET hash = ?, fullHash = NULL, size = ?, mtime = ?, inode = ?, device = ? WHERE mediaID = ?"
+    executeQuery(conn, query, [fileHash, *fileStat, mediaID])
+    executeQuery(conn, "DELETE FROM JUNCTION WHERE mediaID = ?", [mediaID])
+    executeQuery(conn, "DELETE FROM DETECTIONS WHERE mediaID = ?", [mediaID])
+    return True
+
+def getMediaByHash(conn: sqlite3.Connection, fileHash: str) -> Tuple[int, str, str]:
+    """Get the media row identified by a hash.
+
+    Args:
+        conn: sqlite3.Connection object.
+        fileHash: The hash value of the media.
+
+    Returns:
+        A tuple of mediaID, path and full-content hash (None if not computed yet), or None if not found.
+    """
+    return executeQuery(conn, "SELECT mediaID, path, fullHash FROM MEDIA WHERE hash = ?", [fileHash]).fetchone()
+
+def setFullHash(conn: sqlite3.Connection, mediaID: int, fullHash: str) -> None:
+    """Stores the full-content hash of a media file.
+
+    Args:
+        conn: sqlite3.Connection object.
+        mediaID: The ID of the media file.
+        fullHash: The hash of the whole file.
+    """
+    executeQuery(conn, "UPDATE MEDIA SET fullHash = ? WHERE mediaID = ?", [fullHash, mediaID])
+
+def getMediaSignatures(conn: sqlite3.Connection) -> Dict[str, Tuple[int, int, int, int]]:
+    """Get the stat signature recorded for every media path.
+
+    Args:
+        conn: sqlite3.Connection object.
+
+    Returns:
+        A dictionary mapping path to its (size, mtime, inode, device) signature.
+    """
+    query = "SELECT path, size, mtime, inode, device FROM MEDIA"
+    return {row[0]: tuple(row[1:]) for row in executeQuery(conn, query).fetchall()}
+
+def insertMedia(conn: sqlite3.Connection, fileHash: str, file: str, directory: str, fileType: str, fileStat=(None, None, None, None)) -> Tuple[int, str, str]:
     """Populates the MEDIA table with the given file information.
 
     Args:
         conn: sqlite3.Connection object.
         file: The path to the media file.
         fileType: The type of the media file.
+        fileStat: The (size, mtime, inode, device) signature of the file.
 
     Returns:
         A tuple of mediaID, file, and fileType.
@@ -283,24 +440,55 @@ def insertMedia(conn: sqlite3.Connection, fileHash: str, file: str, directory: s
         No need to check if mediaID exist in Junction Table.
         updateMediaPath() won't allow older mediaIDs.
     """
-    return executeQuery(conn, "INSERT INTO MEDIA(hash, path, directory, fileType, hidden) VALUES(?, ?, ?, ?, 0)", [fileHash, file, directory, fileType]).lastrowid, file, fileType
+    query = "INSERT INTO MEDIA(hash, path, directory, fileType, hidden, size, mtime, inode, device) VALUES(?, ?, ?, ?, 0, ?, ?, ?, ?)"
+    return executeQuery(conn, query, [fileHash, file, directory, fileType, *fileStat]).lastrowid, file, fileType
 
-def insertClassRelation(conn: sqlite3.Connection, mediaClass: List[str], mediaID) -> None:
+def insertClassRelation(conn: sqlite3.Connection, mediaClass: List[str], mediaID, commit: bool = True) -> None:
     """Populates the JUNCTION table with the given class information.
 
     Args:
         conn: sqlite3.Connection object.
         mediaClass: A list of class names.
         mediaID: The ID of the media file.
+        commit: Commit right away, callers batching inserts into one transaction pass False.
     """
     for className in mediaClass:
-        try:
-            classID = executeQuery(conn, "INSERT INTO CLASS(class) VALUES(?)", [className]).lastrowid
-        except sqlite3.IntegrityError:
-            classID = executeQuery(conn, "SELECT classID FROM CLASS WHERE class = ?", [className]).fetchall()[0][0]
-        
+        classID = getClassID(conn, className)
         executeQuery(conn, "INSERT OR IGNORE INTO JUNCTION(mediaID, classID) VALUES(?, ?)", [mediaID, classID])
-    conn.commit()
+    if commit:
+        conn.commit()
+
+def getClassID(conn: sqlite3.Connection, className: str) -> int:
+    """Get the ID of a class, adding it to the CLASS table if needed.
+
+    Args:
+        conn: sqlite3.Connection object.
+        className: The class name.
+
+    Returns:
+        The class ID.
+    """
+    try:
+        return executeQuery(conn, "INSERT INTO CLASS(class) VALUES(?)", [className]).lastrowid
+    except sqlite3.IntegrityError:
+        return executeQuery(conn, "SELECT classID FROM CLASS WHERE class = ?", [className]).fetchall()[0][0]
+
+def insertDetections(conn: sqlite3.Connection, detections: List[Tuple], mediaID, commit: bool = True) -> None:
+    """Populates the DETECTIONS table with the objects detected in a media file.
+
+    Args:
+        conn: sqlite3.Connection object.
+        detections: Tuples of class name, score, (x1, y1, x2, y2) box and frame time in seconds (None for images).
+        mediaID: The ID of the media file.
+        commit: Commit right away, callers batching inserts into one transaction pass False.
+    """
+    classIDs = {className: getClassID(conn, className) for className in {detection[0] for detection in detections}}
+    conn.executemany(
+        "INSERT INTO DETECTIONS(mediaID, classID, score, x1, y1, x2, y2, frameTime) VALUES(?, ?, ?, ?, ?, ?, ?, ?)",
+        [(mediaID, classIDs[className], score, *box, frameTime) for className, score, box, frameTime in detections],
+    )
+    if commit:
+        conn.commit()
 
 def moveToTrash(conn: sqlite3.Connection, paths: List[str]) -> None:
     """Move images to trash by setting the hidden column to -1.
@@ -317,6 +505,21 @@ def moveToTrash(conn: sqlite3.Connection, paths: List[str]) -> None:
     """
     executeQuery(conn, query, paths)
 
+def moveToTrashByID(conn: sqlite3.Connection, mediaIDs: List[int]) -> None:
+    """Move media to trash by ID.
+
+    Args:
+        conn: sqlite3.Connection object.
+        mediaIDs: A list of media IDs to move to trash.
+    """
+    query = f"""
+        UPDATE MEDIA 
+        SET hidden = -1,
+        timeStamp = CURRENT_TIMESTAMP
+        WHERE mediaID IN ({', '.join('?' * len(mediaIDs))})
+    """
+    executeQuery(conn, query, mediaIDs)
+
 def getUnlinkedMedia(conn: sqlite3.Connection) -> Generator[Tuple[int, str, str], None, None]:
     """
     Retrieves mediaID, path, and fileType from MEDIA table where mediaID does not exist in JUNCTION table.
@@ -377,22 +580,98 @@ def getMediaIDForPath(conn: sqlite3.Connection, path: str) -> int:
     else:
         return None
 
-def getInfoByPath(conn: sqlite3.Connection, path: str) -> Dict[str, str]:
+def getMediaForPath(conn: sqlite3.Connection, path: str) -> Tuple[int, str, str]:
     """
-    Get row for a given path.
+    Get the media row of a path.
     Args:
         conn: sqlite3.Connection object.
         path: The path of the media file.
+    Returns:
+        A tuple of mediaID, hash and fileType, or None if the path is not indexed.
+    """
+    return executeQuery(conn, "SELECT mediaID, hash, fileType FROM MEDIA WHERE path = ?", [path]).fetchone()
+
+def getMediaSignature(conn: sqlite3.Connection, path: str) -> Tuple[str, Tuple[int, int, int, int]]:
+    """
+    Get the hash of a media path and the stat signature the file had when it was hashed.
+    Args:
+        conn: sqlite3.Connection object.
+        path: The path of the media file.
+    Returns:
+        A tuple of the hash and the (size, mtime, inode, device) signature, or None if the path is not indexed.
+    """
+    row = executeQuery(conn, "SELECT hash, size, mtime, inode, device FROM MEDIA WHERE path = ?", [path]).fetchone()
+    return (row[0], tuple(row[1:])) if row else None
+
+def getMediaRecord(conn: sqlite3.Connection, key: str, value) -> Tuple[int, str, str, str, Tuple[int, int, int, int]]:
+    """
+    Get the media row of a media ID or a hash, both are indexed.
+    Args:
+        conn: sqlite3.Connection object.
+        key: The column to look up, 'mediaID' or 'hash'.
+        value: The media ID or the hash.
+    Returns:
+        A tuple of mediaID, hash, path, fileType and the (size, mtime, inode, device) signature, or None if not found.
+    """
+    if key not in ("mediaID", "hash"):
+        raise ValueError(f"Media can not be looked up by {key}")
+    query = f"SELECT mediaID, hash, path, fileType, size, mtime, inode, device FROM MEDIA WHERE {key} = ?"
+    row = executeQuery(conn, query, [value]).fetchone()
+    return (*row[:4], tuple(row[4:])) if row else None
+
+def getMediaForIDs(conn: sqlite3.Connection, mediaIDs: List[int]) -> Dict[int, Tuple[str, str, str]]:
+    """
+    Get the media rows of several media IDs.
+    Args:
+        conn: sqlite3.Connection object.
+        mediaIDs: The IDs of the media.
+    Returns:
+        A dictionary mapping each media ID found to its hash, path and fileType.
+    """
+    if not mediaIDs:
+        return {}
+    query = f"SELECT mediaID, hash, path, fileType FROM MEDIA WHERE mediaID IN ({', '.join('?' * len(mediaIDs))})"
+    return {row[0]: tuple(row[1:]) for row in executeQuery(conn, query, mediaIDs).fetchall()}
+
+def getMediaHashes(conn: sqlite3.Connection, includeTrash: bool = False) -> List[Tuple[str, str, str]]:
+    """
+    Get the hash, path and type of the media, most recently added first.
+    Args:
+        conn: sqlite3.Connection object.
+        includeTrash: Whether to include media moved to the trash.
+    Returns:
+        A list of (hash, path, fileType) tuples.
+    """
+    condition = "" if includeTrash else "WHERE hidden != -1"
+    return executeQuery(conn, f"SELECT hash, path, fileType FROM MEDIA {condition} ORDER BY mediaID DESC").fetchall()
+
+def getInfoByID(conn: sqlite3.Connection, mediaID: int) -> Dict[str, str]:
+    """
+    Get row for a given media ID.
+    Args:
+        conn: sqlite3.Connection object.
+        mediaID: The ID of the media file.
     Returns:
         A dictionary of row values.
     """
     query = """
     SELECT path, fileType, timeStamp
     FROM MEDIA
-    WHERE path = ?
+    WHERE mediaID = ?
     """
-    row = executeQuery(conn, query, [path]).fetchone()
+    row = executeQuery(conn, query, [mediaID]).fetchone()
     if row:
-        return {"Path": row[0], "Type": row[1], "Date": row[2], "Tags": getClassesForMediaID(conn, getMediaIDForPath(conn, path))}
+        return {"Path": row[0], "Type": row[1], "Date": row[2], "Tags": getClassesForMediaID(conn, mediaID)}
     else:
         return {"Error": "No matching record found"}
+
+def getInfoByPath(conn: sqlite3.Connection, path: str) -> Dict[str, str]:
+    """
+    Get row for a given path.
+    Args:
+        conn: sqlite3.Connection object.
+        path: The path of the media file.
+    Returns:
+        A dictionary of row values.
+    """
+    return getInfoByID(conn, getMediaIDForPath(conn, path))
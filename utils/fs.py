@@ -2,7 +2,9 @@ import os
 import sys
 import xxhash
 import mmap
-from typing import Generator, Union, List
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Generator, Iterable, Union, List, Tuple
 from markupsafe import escape
 from urllib.parse import unquote
 
@@ -30,6 +32,95 @@ def genHash(path: str) -> str:
         print(f"An error occurred: {e}")
         return None
 
+def genFingerprint(path: str, chunkSize: int = 1024 * 1024) -> str:
+    """
+    Generates a sampled fingerprint of a file: its size plus the xxHash of
+    fixed-size chunks from its head, middle and tail.
+    Multi-GB videos are identified by reading a few MB instead of the whole file.
+    Files no larger than four chunks are hashed whole, so for them the fingerprint is the full hash.
+
+    Args:
+        path: Path to the file.
+        chunkSize: Size of each sampled chunk in bytes.
+
+    Returns:
+        A string of the form '<size in hex>-<xxHash of the chunks>' for sampled files,
+        the full hash otherwise.
+    """
+    try:
+        size = os.path.getsize(path)
+        if size <= 4 * chunkSize:
+            return genHash(path)
+
+        hash_xx = xxhash.xxh64()
+        with open(path, "rb") as f:
+            for offset in (0, (size - chunkSize) // 2, size - chunkSize):
+                f.seek(offset)
+                hash_xx.update(f.read(chunkSize))
+        return f"{size:x}-{hash_xx.hexdigest()}"
+    except Exception as e:
+        print(f"An error occurred: {e}")
+        return None
+
+def isSampled(fingerprint: str) -> bool:
+    """
+    Check whether a fingerprint was sampled from parts of the file or covers all of it.
+
+    Args:
+        fingerprint: Value returned by genFingerprint().
+
+    Returns:
+        True if the fingerprint only covers sampled chunks of the file.
+    """
+    return "-" in fingerprint
+
+def genHashes(items: Iterable[Tuple], workers: int, hashFunction: Callable[[str], str] = genHash) -> Generator[Tuple[Tuple, str], None, None]:
+    """
+    Hash files on a bounded pool of threads while keeping the input order.
+    xxHash releases the GIL while hashing large buffers, so several files are read and hashed at once.
+    At most a few files per worker are in flight, so a long input is never buffered whole.
+
+    Args:
+        items: Tuples whose first element is the path to hash.
+        workers: Number of hashing threads, 1 hashes in the calling thread.
+        hashFunction: Function hashing a path, genHash() or genFingerprint().
+
+    Yields:
+        Tuple of (item, hash of item's file) in input order.
+    """
+    if workers <= 1:
+        for item in items:
+            yield item, hashFunction(item[0])
+        return
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="hash") as executor:
+        pending = deque()
+        for item in items:
+            pending.append((item, executor.submit(hashFunction, item[0])))
+            if len(pending) >= workers * 4:
+                item, future = pending.popleft()
+                yield item, future.result()
+        while pending:
+            item, future = pending.popleft()
+            yield item, future.result()
+
+def fileSignature(path: str) -> Union[Tuple[int, int, int, int], None]:
+    """
+    Get the stat signature of a file.
+    A file whose signature is unchanged since the last scan is assumed to have unchanged content.
+
+    Args:
+        path: Path to the file.
+
+    Returns:
+        Tuple of (size, mtime in nanoseconds, inode, device), None if the file cannot be accessed.
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime_ns, stat.st_ino, stat.st_dev
+
 def checkExtension(filePath: str, extensions: List[str]) -> bool:
     """
     Checks if the file has one of the specified extensions.
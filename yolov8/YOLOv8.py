@@ -1,3 +1,6 @@
+import hashlib
+import os
+import threading
 import time
 import cv2
 import numpy as np
@@ -5,23 +8,44 @@ import onnxruntime
 from typing import List, Tuple
 
 from yolov8.utils import xywh2xyxy, draw_detections, multiclass_nms, class_names
+from yolov8.preprocess import letterbox_geometry, preprocess_into
+from yolov8.registry import get_detector
+
+OPTIMIZATION_LEVELS = {
+    "disable": onnxruntime.GraphOptimizationLevel.ORT_DISABLE_ALL,
+    "basic": onnxruntime.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+    "extended": onnxruntime.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+    "all": onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL,
+}
 
 
 class YOLOv8:
-    def __init__(self, path: str, conf_thres: float = 0.7, iou_thres: float = 0.5) -> None:
+    def __init__(self, path: str, conf_thres: float = 0.7, iou_thres: float = 0.5, threads: int = 0,
+                 letterbox: bool = False, profile: dict = None, cache_dir: str = None) -> None:
         """
         Initialize the YOLOv8 object detector.
 
+        The detector keeps no per-image state, so a single instance (and its
+        ONNX session) can be shared between threads. Use `get_detector` to
+        obtain the process-wide instance for a model path.
+
         Args:
             path (str): The path to the YOLOv8 model file.
             conf_thres (float): The confidence threshold for object detection.
             iou_thres (float): The IoU threshold for non-maxima suppression.
+            threads (int): Intra-op threads of the ONNX session, 0 lets ONNX Runtime decide.
+            letterbox (bool): Preserve the aspect ratio of images and pad them instead of stretching to the input size.
+            profile (dict, optional): Session settings, see `initialize_model`.
+            cache_dir (str, optional): Directory to keep the optimized model in, so later loads skip graph optimization.
         """
         self.conf_threshold = conf_thres
         self.iou_threshold = iou_thres
+        self.letterbox = letterbox
+        # Per thread input tensor reused between calls
+        self._local = threading.local()
 
         # Initialize model
-        self.initialize_model(path)
+        self.initialize_model(path, threads, profile, cache_dir)
 
     def __call__(self, image: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
         """
@@ -35,60 +59,214 @@ class YOLOv8:
         """
         return self.detect_objects(image)
 
-    def initialize_model(self, path: str) -> None:
+    def initialize_model(self, path: str, threads: int = 0, profile: dict = None, cache_dir: str = None) -> None:
         """
         Initialize the ONNX model.
 
         Args:
             path (str): The path to the YOLOv8 model file.
+            threads (int): Intra-op threads of the ONNX session, overrides the profile unless 0.
+            profile (dict, optional): intra_op_threads, inter_op_threads, execution_mode ('sequential' or 'parallel')
+                and optimization_level ('disable', 'basic', 'extended' or 'all'). Threads set to 0 let ONNX Runtime decide.
+            cache_dir (str, optional): Directory to keep the optimized model in. It is keyed by the model's content,
+                the optimization level, the execution providers and the ONNX Runtime version.
+                'all' adds layout optimizations specific to the CPU, so the cached model is only optimized up to
+                'extended' and they are applied again when it is loaded.
         """
-        self.session = onnxruntime.InferenceSession(path, providers=onnxruntime.get_available_providers())
+        profile = profile or {}
+        providers = onnxruntime.get_available_providers()
+
+        def session_options(level: str) -> onnxruntime.SessionOptions:
+            options = onnxruntime.SessionOptions()
+            options.intra_op_num_threads = threads or profile.get("intra_op_threads", 0)
+            options.inter_op_num_threads = profile.get("inter_op_threads", 0)
+            if profile.get("execution_mode") == "parallel":
+                options.execution_mode = onnxruntime.ExecutionMode.ORT_PARALLEL
+            else:
+                options.execution_mode = onnxruntime.ExecutionMode.ORT_SEQUENTIAL
+            options.graph_optimization_level = OPTIMIZATION_LEVELS[level]
+            return options
+
+        level = profile.get("optimization_level", "all")
+        # A cached model may be loaded on another machine sharing the data directory
+        saved_level = "extended" if level == "all" else level
+        cached = self.optimized_model_path(path, cache_dir, saved_level, providers) if cache_dir and level != "disable" else None
+
+        self.session = None
+        self.from_cache = cached is not None and os.path.exists(cached)
+        if cached and not self.from_cache:
+            options = session_options(saved_level)
+            # Written under a temporary name so a concurrent load never reads a partial file
+            options.optimized_model_filepath = f"{cached}.{os.getpid()}.tmp"
+            session = onnxruntime.InferenceSession(path, sess_options=options, providers=providers)
+            try:
+                os.replace(options.optimized_model_filepath, cached)
+            except OSError as e:
+                print(f"Unable to cache optimized model: {e}")
+            if saved_level == level:
+                self.session = session
+        if self.session is None and cached and os.path.exists(cached):
+            # Already optimized, only the CPU specific optimizations of 'all' are left to apply
+            self.session = onnxruntime.InferenceSession(
+                cached, sess_options=session_options("all" if level == "all" else "disable"), providers=providers
+            )
+        elif self.session is None:
+            self.session = onnxruntime.InferenceSession(path, sess_options=session_options(level), providers=providers)
         # Get model info
         self.get_input_details()
         self.get_output_details()
 
-    def detect_objects(self, image: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    @staticmethod
+    def optimized_model_path(path: str, cache_dir: str, level: str, providers: List[str]) -> str:
+        """
+        Get the path of the cached optimized version of a model.
+
+        Args:
+            path (str): The path to the YOLOv8 model file.
+            cache_dir (str): The model cache directory.
+            level (str): The graph optimization level.
+            providers (list): The execution providers of the session.
+
+        Returns:
+            str: The path of the optimized model, which may not exist yet.
+        """
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+        digest.update(f"{onnxruntime.__version__}|{level}|{','.join(providers)}".encode())
+        name = os.path.splitext(os.path.basename(path))[0]
+        return os.path.join(cache_dir, f"{name}-{digest.hexdigest()[:16]}.onnx")
+
+    def warm_up(self) -> None:
+        """
+        Run one inference on a blank batch, so the first real call does not pay for allocating the session's buffers.
+        """
+        rows = self.batch_size or 1
+        self.inference(np.zeros((rows, 3, self.input_height, self.input_width), dtype=np.float32))
+
+    def detect_objects(self, image: np.ndarray, conf_thres: float = None, iou_thres: float = None,
+                       img_shape: Tuple[int, int] = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
         """
         Detect objects in the given image.
 
         Args:
             image (np.ndarray): The input image.
+            conf_thres (float, optional): Overrides the detector's confidence threshold for this call.
+            iou_thres (float, optional): Overrides the detector's IoU threshold for this call.
+            img_shape (tuple, optional): The (height, width) to rescale boxes to when `image` was decoded
+                at a reduced size, defaults to the shape of `image`.
 
         Returns:
             tuple: A tuple containing the bounding boxes, scores, and class IDs of the detected objects.
         """
-        input_tensor = self.prepare_input(image)
+        input_tensor = self.prepare_input(image, self.input_buffer(1))
 
         # Perform inference on the image
         outputs = self.inference(input_tensor)
 
-        self.boxes, self.scores, self.class_ids = self.process_output(outputs)
-
-        return self.boxes, self.scores, self.class_ids
+        return self.process_output(outputs, img_shape or image.shape[:2], conf_thres, iou_thres)
 
-    def prepare_input(self, image: np.ndarray) -> np.ndarray:
+    def prepare_input(self, image: np.ndarray, out: np.ndarray = None) -> np.ndarray:
         """
         Prepare the input image for the model.
 
         Args:
             image (np.ndarray): The input image.
+            out (np.ndarray, optional): A (1, 3, height, width) float32 tensor to write into instead of allocating one.
 
         Returns:
             np.ndarray: The preprocessed image tensor.
         """
-        self.img_height, self.img_width = image.shape[:2]
+        if out is None:
+            out = np.empty((1, 3, self.input_height, self.input_width), dtype=np.float32)
+        preprocess_into(image, out[0], self.letterbox)
+        return out
+
+    def prepare_batch(self, images: List[np.ndarray], out: np.ndarray = None) -> np.ndarray:
+        """
+        Prepare several images as a single NCHW input tensor.
+
+        Args:
+            images (list): The input images.
+            out (np.ndarray, optional): A float32 NCHW tensor with at least one row per image to write into.
 
-        input_img = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+        Returns:
+            np.ndarray: The stacked preprocessed image tensor, the first rows of `out` when given.
+        """
+        if out is None:
+            out = np.empty((len(images), 3, self.input_height, self.input_width), dtype=np.float32)
+        for i, image in enumerate(images):
+            preprocess_into(image, out[i], self.letterbox)
+        return out[:len(images)]
+
+    def input_buffer(self, rows: int) -> np.ndarray:
+        """
+        Get the calling thread's reusable input tensor with `rows` rows, grown when needed.
+
+        Args:
+            rows (int): Number of images the tensor has to hold.
+
+        Returns:
+            np.ndarray: A (rows, 3, height, width) float32 tensor, its contents are undefined.
+        """
+        buffer = getattr(self._local, "buffer", None)
+        if buffer is None or buffer.shape[0] < rows:
+            buffer = self._local.buffer = np.empty((rows, 3, self.input_height, self.input_width), dtype=np.float32)
+        return buffer[:rows]
+
+    def detect_batch(self, images: List[np.ndarray], conf_thres: float = None, iou_thres: float = None,
+                     img_shapes: List[Tuple[int, int]] = None) -> List[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+        """
+        Detect objects in several images with as few inference runs as the model allows.
+
+        Models exported with a dynamic batch dimension receive all images in one tensor,
+        models with a fixed batch size are fed chunks of that size.
+
+        Args:
+            images (list): The input images.
+            conf_thres (float, optional): Overrides the detector's confidence threshold for this call.
+            iou_thres (float, optional): Overrides the detector's IoU threshold for this call.
+            img_shapes (list, optional): The (height, width) to rescale each image's boxes to,
+                defaults to the shapes of `images`.
+
+        Returns:
+            list: The bounding boxes, scores, and class IDs for each image, in input order.
+        """
+        img_shapes = img_shapes or [image.shape[:2] for image in images]
+        chunk = self.batch_size or len(images)
+        results = []
+        for start in range(0, len(images), max(chunk, 1)):
+            batch = images[start:start + chunk]
+            # Fixed batch models get the blank padding rows in the same buffer
+            input_tensor = self.input_buffer(self.batch_size or len(batch))
+            self.prepare_batch(batch, out=input_tensor)
+            input_tensor[len(batch):] = 0
+            results.extend(self.detect_prepared(input_tensor, img_shapes[start:start + chunk], conf_thres, iou_thres))
+        return results
+
+    def detect_prepared(self, input_tensor: np.ndarray, img_shapes: List[Tuple[int, int]], conf_thres: float = None,
+                        iou_thres: float = None) -> List[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+        """
+        Run inference on an already prepared batch and post-process every item.
 
-        # Resize input image
-        input_img = cv2.resize(input_img, (self.input_width, self.input_height))
+        Args:
+            input_tensor (np.ndarray): The NCHW tensor built by `prepare_batch`.
+            img_shapes (list): The (height, width) of each original image.
+            conf_thres (float, optional): Overrides the detector's confidence threshold for this call.
+            iou_thres (float, optional): Overrides the detector's IoU threshold for this call.
 
-        # Scale input pixel values to 0 to 1
-        input_img = input_img / 255.0
-        input_img = input_img.transpose(2, 0, 1)
-        input_tensor = input_img[np.newaxis, :, :, :].astype(np.float32)
+        Returns:
+            list: The bounding boxes, scores, and class IDs for each image.
+        """
+        count = len(img_shapes)
+        if self.batch_size and input_tensor.shape[0] < self.batch_size:
+            # Fixed batch models need a full batch, pad with blank images
+            padding = np.zeros((self.batch_size - input_tensor.shape[0], *input_tensor.shape[1:]), dtype=input_tensor.dtype)
+            input_tensor = np.concatenate([input_tensor, padding], axis=0)
 
-        return input_tensor
+        outputs = self.inference(input_tensor)
+        return [self.process_output([outputs[0][i]], img_shapes[i], conf_thres, iou_thres) for i in range(count)]
 
     def inference(self, input_tensor: np.ndarray) -> List[np.ndarray]:
         """
@@ -106,22 +284,29 @@ class YOLOv8:
         # print(f"Inference time: {(time.perf_counter() - start)*1000:.2f} ms")
         return outputs
 
-    def process_output(self, output: List[np.ndarray]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    def process_output(self, output: List[np.ndarray], img_shape: Tuple[int, int], conf_thres: float = None,
+                       iou_thres: float = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
         """
         Process the model outputs to extract bounding boxes, scores, and class IDs.
 
         Args:
             output (list): The model outputs.
+            img_shape (tuple): The (height, width) of the original image.
+            conf_thres (float, optional): Overrides the detector's confidence threshold.
+            iou_thres (float, optional): Overrides the detector's IoU threshold.
 
         Returns:
             tuple: A tuple containing the bounding boxes, scores, and class IDs of the detected objects.
         """
+        conf_thres = self.conf_threshold if conf_thres is None else conf_thres
+        iou_thres = self.iou_threshold if iou_thres is None else iou_thres
+
         predictions = np.squeeze(output[0]).T
 
         # Filter out object confidence scores below threshold
         scores = np.max(predictions[:, 4:], axis=1)
-        predictions = predictions[scores > self.conf_threshold, :]
-        scores = scores[scores > self.conf_threshold]
+        predictions = predictions[scores > conf_thres, :]
+        scores = scores[scores > conf_thres]
 
         if len(scores) == 0:
             return np.array([]), np.array([]), np.array([])
@@ -130,56 +315,70 @@ class YOLOv8:
         class_ids = np.argmax(predictions[:, 4:], axis=1)
 
         # Get bounding boxes for each object
-        boxes = self.extract_boxes(predictions)
+        boxes = self.extract_boxes(predictions, img_shape)
 
         # Apply non-maxima suppression to suppress weak, overlapping bounding boxes
-        indices = multiclass_nms(boxes, scores, class_ids, self.iou_threshold)
+        indices = multiclass_nms(boxes, scores, class_ids, iou_thres)
 
         return boxes[indices], scores[indices], class_ids[indices]
 
-    def extract_boxes(self, predictions: np.ndarray) -> np.ndarray:
+    def extract_boxes(self, predictions: np.ndarray, img_shape: Tuple[int, int]) -> np.ndarray:
         """
         Extract bounding boxes from the predictions.
 
         Args:
             predictions (np.ndarray): The model predictions.
+            img_shape (tuple): The (height, width) of the original image.
 
         Returns:
             np.ndarray: The bounding boxes.
         """
         boxes = predictions[:, :4]
-        boxes = self.rescale_boxes(boxes)
+        boxes = self.rescale_boxes(boxes, img_shape)
         boxes = xywh2xyxy(boxes)
         return boxes
 
-    def rescale_boxes(self, boxes: np.ndarray) -> np.ndarray:
+    def rescale_boxes(self, boxes: np.ndarray, img_shape: Tuple[int, int]) -> np.ndarray:
         """
         Rescale bounding boxes to the original image dimensions.
+        Boxes of an image decoded at a reduced size land in full size coordinates
+        when `img_shape` is the full size, since the model input covers the whole image.
 
         Args:
             boxes (np.ndarray): The bounding boxes.
+            img_shape (tuple): The (height, width) of the original image.
 
         Returns:
             np.ndarray: The rescaled bounding boxes.
         """
+        if self.letterbox:
+            scale, (top, left), _ = letterbox_geometry(img_shape, (self.input_height, self.input_width))
+            boxes = boxes - np.array([left, top, 0, 0], dtype=np.float32)
+            return np.divide(boxes, scale, dtype=np.float32)
+
+        img_height, img_width = img_shape
         input_shape = np.array([self.input_width, self.input_height, self.input_width, self.input_height])
         boxes = np.divide(boxes, input_shape, dtype=np.float32)
-        boxes *= np.array([self.img_width, self.img_height, self.img_width, self.img_height])
+        boxes *= np.array([img_width, img_height, img_width, img_height])
         return boxes
 
-    def draw_detections(self, image: np.ndarray, draw_scores: bool = True, mask_alpha: float = 0.4) -> np.ndarray:
+    def draw_detections(self, image: np.ndarray, boxes: np.ndarray, scores: np.ndarray, class_ids: np.ndarray,
+                        draw_scores: bool = True, mask_alpha: float = 0.4) -> np.ndarray:
         """
         Draw detections on the image.
 
         Args:
             image (np.ndarray): The input image.
+            boxes (np.ndarray): The bounding boxes returned by `detect_objects`.
+            scores (np.ndarray): The scores returned by `detect_objects`.
+            class_ids (np.ndarray): The class IDs returned by `detect_objects`.
             draw_scores (bool, optional): Whether to draw scores on the image. Defaults to True.
             mask_alpha (float, optional): The transparency of the mask. Defaults to 0.4.
 
         Returns:
             np.ndarray: The image with detections drawn on it.
         """
-        return draw_detections(image, self.boxes, self.scores, self.class_ids, mask_alpha)
+        return draw_detections(image, boxes, scores, class_ids, mask_alpha)
 
     def get_input_details(self) -> None:
         """
@@ -192,6 +391,9 @@ class YOLOv8:
         self.input_height = self.input_shape[2]
         self.input_width = self.input_shape[3]
 
+        # Dynamic batch dimensions are exported as names (e.g. 'batch'), fixed ones as integers
+        self.batch_size = self.input_shape[0] if isinstance(self.input_shape[0], int) else None
+
     def get_output_details(self) -> None:
         """
         Get the output details of the model.
@@ -237,8 +439,7 @@ def imgDetector(imgPath: str, model_path: str, conf_thres: float = 0.3, iou_thre
     Returns:
         tuple: A tuple containing the image and the object detector.
     """
-    return cv2.imread(imgPath), 
-    YOLOv8(model_path, conf_thres = 0.3, iou_thres = 0.5)
+    return cv2.imread(imgPath), get_detector(model_path)
 
 def markObjects(img: np.ndarray, yolov8_detector: YOLOv8) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
     """
@@ -273,19 +474,56 @@ def uniqueClasses(class_ids: List[int]) -> List[str]:
     return classes
 
 
-def detectClasses(img: np.ndarray, model_path: str) -> Tuple[List[str], np.ndarray]:
+def namedDetections(boxes: np.ndarray, scores: np.ndarray, class_ids: np.ndarray) -> List[Tuple[str, float, Tuple[float, float, float, float]]]:
+    """
+    Convert detections to plain tuples, e.g. for storing them.
+
+    Args:
+        boxes (np.ndarray): The (x1, y1, x2, y2) bounding boxes of the detected objects.
+        scores (np.ndarray): The confidence scores of the detected objects.
+        class_ids (np.ndarray): The class IDs of the detected objects.
+
+    Returns:
+        list: The class name, score and box of each detection.
+    """
+    return [(class_names[int(class_id)], float(score), tuple(float(value) for value in box))
+            for box, score, class_id in zip(boxes, scores, class_ids)]
+
+
+def detectClasses(img: np.ndarray, model_path: str, img_shape: Tuple[int, int] = None,
+                  conf_thres: float = 0.3) -> List[str]:
     """
     Detect objects in an image and return a list of unique classes.
+    Nothing is drawn, use `renderClasses` for an annotated image.
 
     Args:
-        imgPath (str): The path to the image file.
+        img (np.ndarray): The image to detect objects in.
+        model_path (str): The path to the YOLOv8 model file.
+        img_shape (tuple, optional): The full size (height, width) when `img` was decoded at a reduced size.
+        conf_thres (float, optional): The confidence threshold for object detection. Defaults to 0.3.
+
+    Returns:
+        list: A list of unique class names.
+    """
+
+    yolovDetector = get_detector(model_path)
+    _, _, class_ids = yolovDetector.detect_objects(img, conf_thres = conf_thres, iou_thres = 0.5, img_shape = img_shape)
+    return uniqueClasses(class_ids)
+
+
+def renderClasses(img: np.ndarray, model_path: str, conf_thres: float = 0.3) -> Tuple[List[str], np.ndarray]:
+    """
+    Detect objects in an image and draw them on a copy of it.
+
+    Args:
+        img (np.ndarray): The full size image to detect objects in.
         model_path (str): The path to the YOLOv8 model file.
-        outputPath (str, optional): The path to save the output image. Defaults to None.
+        conf_thres (float, optional): The confidence threshold for object detection. Defaults to 0.3.
 
     Returns:
         tuple: A tuple containing a list of unique class names and the image with detections drawn on it.
     """
 
-    yolovDetector = YOLOv8(model_path, conf_thres = 0.3, iou_thres = 0.5)
-    _, _, class_ids = markObjects(img, yolovDetector)
-    return uniqueClasses(class_ids), yolovDetector.draw_detections(img)
+    yolovDetector = get_detector(model_path)
+    boxes, scores, class_ids = yolovDetector.detect_objects(img, conf_thres = conf_thres, iou_thres = 0.5)
+    return uniqueClasses(class_ids), yolovDetector.draw_detections(img, boxes, scores, class_ids)
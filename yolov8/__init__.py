@@ -1 +1,28 @@
-from .YOLOv8 import YOLOv8, detectClasses
+import importlib
+import sys
+import types
+
+from .registry import get_detector, configure_sessions, warm_up, model_stats, release_detectors
+
+# The detector pulls in ONNX Runtime, OpenCV and NumPy, it is imported on first use
+_lazy = {"YOLOv8": ".YOLOv8", "detectClasses": ".YOLOv8", "renderClasses": ".YOLOv8"}
+__all__ = list(_lazy) + ["get_detector", "configure_sessions", "warm_up", "model_stats", "release_detectors"]
+
+
+def __getattr__(name):
+    if name not in _lazy:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(_lazy[name], __name__), name)
+    globals()[name] = value
+    return value
+
+
+class _Package(types.ModuleType):
+    def __setattr__(self, name, value):
+        # Importing the YOLOv8 submodule binds it on the package, `yolov8.YOLOv8` stays the class
+        if name in _lazy and isinstance(value, types.ModuleType):
+            return
+        super().__setattr__(name, value)
+
+
+sys.modules[__name__].__class__ = _Package
@@ -0,0 +1,111 @@
+import threading
+from typing import Dict, List, Tuple
+
+import cv2
+import numpy as np
+
+# Grey used by YOLOv8 to pad letterboxed inputs
+LETTERBOX_FILL = 114 / 255.0
+
+
+def letterbox_geometry(img_shape: Tuple[int, int], input_shape: Tuple[int, int]) -> Tuple[float, Tuple[int, int], Tuple[int, int]]:
+    """
+    Compute where an image lands in the model input when its aspect ratio is preserved.
+
+    Args:
+        img_shape (tuple): The (height, width) of the image.
+        input_shape (tuple): The (height, width) of the model input.
+
+    Returns:
+        tuple: The scale factor, the (top, left) padding and the (height, width) of the resized image.
+    """
+    img_height, img_width = img_shape
+    input_height, input_width = input_shape
+    scale = min(input_height / img_height, input_width / img_width)
+    height = min(input_height, max(1, round(img_height * scale)))
+    width = min(input_width, max(1, round(img_width * scale)))
+    return scale, ((input_height - height) // 2, (input_width - width) // 2), (height, width)
+
+
+def preprocess_into(image: np.ndarray, out: np.ndarray, letterbox: bool = False) -> None:
+    """
+    Write a BGR image into a (3, height, width) float32 model input slot.
+
+    The image is resized while still uint8, then each colour plane is scaled to 0..1 and written
+    straight into its RGB channel of `out`, so no float64 or transposed intermediate is created.
+
+    Args:
+        image (np.ndarray): The BGR input image.
+        out (np.ndarray): The float32 CHW slot to fill, e.g. one item of an NCHW batch buffer.
+        letterbox (bool): Preserve the aspect ratio and pad the borders instead of stretching.
+    """
+    input_height, input_width = out.shape[1:]
+    if letterbox:
+        _, (top, left), (height, width) = letterbox_geometry(image.shape[:2], (input_height, input_width))
+        out.fill(LETTERBOX_FILL)
+        region = out[:, top:top + height, left:left + width]
+    else:
+        height, width = input_height, input_width
+        region = out
+
+    resized = cv2.resize(image, (width, height), dst=_scratch(height, width))
+    for channel in range(3):
+        # Channel 0 of the model input is red, the last plane of the BGR image
+        np.divide(resized[:, :, 2 - channel], np.float32(255.0), out=region[channel])
+
+
+_local = threading.local()
+
+
+def _scratch(height: int, width: int) -> np.ndarray:
+    """
+    Get this thread's uint8 resize buffer, a view of `height` x `width` pixels.
+    """
+    buffer = getattr(_local, "resize", None)
+    if buffer is None or buffer.shape[0] < height or buffer.shape[1] < width:
+        size = (height, width) if buffer is None else (max(height, buffer.shape[0]), max(width, buffer.shape[1]))
+        buffer = _local.resize = np.empty((*size, 3), dtype=np.uint8)
+    return buffer[:height, :width]
+
+
+class InputBuffers:
+    """
+    Pool of float32 NCHW input tensors of one image size, reused between batches.
+
+    Buffers are handed out by row count, so a single image does not hold a full batch worth of memory.
+    Acquiring never blocks, an empty pool allocates a new buffer.
+    """
+
+    def __init__(self, input_shape: Tuple[int, int], keep: int = 8) -> None:
+        """
+        Args:
+            input_shape (tuple): The (height, width) of the model input.
+            keep (int): Maximum number of idle buffers kept per row count.
+        """
+        self.input_shape = tuple(input_shape)
+        self.keep = keep
+        self.free: Dict[int, List[np.ndarray]] = {}
+        self.allocated = 0
+        self.lock = threading.Lock()
+
+    def acquire(self, rows: int) -> np.ndarray:
+        """
+        Get a (rows, 3, height, width) float32 buffer, its contents are undefined.
+        """
+        with self.lock:
+            free = self.free.get(rows)
+            if free:
+                return free.pop()
+            self.allocated += 1
+        return np.empty((rows, 3, *self.input_shape), dtype=np.float32)
+
+    def release(self, buffer: np.ndarray) -> None:
+        """
+        Return a buffer from `acquire`, or a slice of one, to the pool.
+        """
+        while buffer.base is not None and isinstance(buffer.base, np.ndarray):
+            buffer = buffer.base
+        with self.lock:
+            free = self.free.setdefault(buffer.shape[0], [])
+            if len(free) < self.keep:
+                free.append(buffer)
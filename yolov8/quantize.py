@@ -0,0 +1,133 @@
+"""
+Create the INT8 variant of a YOLOv8 ONNX model with ONNX Runtime static quantization.
+
+Activation ranges are calibrated on images from a local folder, e.g. a sample of the photo library,
+preprocessed exactly as the detector does it. Only the Conv layers are quantized by default,
+the detection head keeps float precision so box coordinates and scores stay close to the original.
+
+Usage:
+    python -m yolov8.quantize --calibration ~/Pictures [--model models/yolov8n.onnx]
+        [--output models/yolov8n.int8.onnx] [--count 64] [--ops Conv] [--per-tensor]
+"""
+import argparse
+import os
+import tempfile
+from typing import Iterator, List, Optional
+
+import cv2
+import numpy as np
+import onnxruntime
+from onnxruntime.quantization import CalibrationDataReader, QuantFormat, QuantType, quantize_static
+from onnxruntime.quantization.shape_inference import quant_pre_process
+
+from yolov8.preprocess import preprocess_into
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp", ".bmp")
+
+
+def calibration_images(folder: str, count: int) -> List[str]:
+    """
+    Pick up to `count` images spread evenly over a folder and its subdirectories, skipping hidden ones.
+
+    Args:
+        folder (str): The folder to take the images from.
+        count (int): The maximum number of images.
+
+    Returns:
+        list: The image paths.
+    """
+    paths = []
+    for root, dirs, files in os.walk(folder):
+        dirs[:] = sorted(d for d in dirs if not d.startswith("."))
+        paths.extend(os.path.join(root, f) for f in sorted(files) if f.lower().endswith(IMAGE_EXTENSIONS))
+    if len(paths) <= count:
+        return paths
+    return [paths[i] for i in np.linspace(0, len(paths) - 1, count).astype(int)]
+
+
+class ImageCalibrationReader(CalibrationDataReader):
+    """
+    Feed calibration images to the quantizer as model inputs, one batch at a time.
+    """
+
+    def __init__(self, model_path: str, paths: List[str], letterbox: bool = False) -> None:
+        session = onnxruntime.InferenceSession(model_path, providers=["CPUExecutionProvider"])
+        model_input = session.get_inputs()[0]
+        self.input_name = model_input.name
+        self.input_shape = model_input.shape
+        # Models exported with a fixed batch size must be fed full batches
+        self.batch_size = self.input_shape[0] if isinstance(self.input_shape[0], int) else 1
+        self.paths = paths
+        self.letterbox = letterbox
+        self.batches = self.read_batches()
+
+    def read_batches(self) -> Iterator[dict]:
+        images = (image for image in map(cv2.imread, self.paths) if image is not None)
+        while True:
+            batch = [image for _, image in zip(range(self.batch_size), images)]
+            if not batch:
+                return
+            # Short last batches are padded by repeating their images
+            batch += batch[:1] * (self.batch_size - len(batch))
+            tensor = np.empty((self.batch_size, 3, self.input_shape[2], self.input_shape[3]), dtype=np.float32)
+            for image, out in zip(batch, tensor):
+                preprocess_into(image, out, self.letterbox)
+            yield {self.input_name: tensor}
+
+    def get_next(self) -> Optional[dict]:
+        return next(self.batches, None)
+
+
+def quantize_model(model_path: str, output_path: str, calibration_paths: List[str], op_types: List[str] = None,
+                   per_channel: bool = True, letterbox: bool = False) -> None:
+    """
+    Quantize a YOLOv8 model to INT8 weights and activations, in QDQ format.
+
+    Args:
+        model_path (str): The path to the float model.
+        output_path (str): Where to write the quantized model.
+        calibration_paths (list): Images used to calibrate the activation ranges.
+        op_types (list, optional): Operator types to quantize, all supported types when None.
+        per_channel (bool): Quantize weights per output channel, more accurate for convolutions.
+        letterbox (bool): Preprocess the calibration images the way a letterboxing detector does.
+    """
+    if not calibration_paths:
+        raise ValueError("No calibration images found")
+
+    with tempfile.TemporaryDirectory() as folder:
+        # Shape inference and graph cleanup let more of the model be quantized
+        prepared_path = os.path.join(folder, "prepared.onnx")
+        try:
+            quant_pre_process(model_path, prepared_path)
+        except Exception as e:
+            print(f"Skipping quantization preprocessing: {e}")
+            prepared_path = model_path
+
+        quantize_static(
+            prepared_path,
+            output_path,
+            ImageCalibrationReader(prepared_path, calibration_paths, letterbox),
+            quant_format=QuantFormat.QDQ,
+            op_types_to_quantize=op_types,
+            per_channel=per_channel,
+            activation_type=QuantType.QUInt8,
+            weight_type=QuantType.QInt8,
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default="models/yolov8n.onnx")
+    parser.add_argument("--output", default="models/yolov8n.int8.onnx")
+    parser.add_argument("--calibration", required=True, help="Folder of images to calibrate with")
+    parser.add_argument("--count", type=int, default=64, help="Number of calibration images")
+    parser.add_argument("--ops", nargs="*", default=["Conv"], help="Operator types to quantize, none for all")
+    parser.add_argument("--per-tensor", action="store_true", help="Quantize weights per tensor instead of per channel")
+    parser.add_argument("--letterbox", action="store_true")
+    args = parser.parse_args()
+
+    paths = calibration_images(os.path.expanduser(args.calibration), args.count)
+    print(f"Calibrating on {len(paths)} images")
+    quantize_model(args.model, args.output, paths, args.ops or None, not args.per_tensor, args.letterbox)
+    print(f"Wrote {args.output} ({os.path.getsize(args.output) / 2**20:.1f} MiB, "
+          f"{os.path.getsize(args.model) / 2**20:.1f} MiB before)")
@@ -0,0 +1,102 @@
+import threading
+import time
+from typing import Dict
+
+_detectors = {}
+_stats = {}
+_lock = threading.Lock()
+# Session settings of the detectors loaded from now on, see configure_sessions()
+_session = {"profile": None, "cache_dir": None}
+
+
+def configure_sessions(profile: Dict = None, cache_dir: str = None) -> None:
+    """
+    Set the session profile and optimized model cache used by the detectors loaded after this call.
+
+    Args:
+        profile (dict, optional): Session settings, see `YOLOv8.initialize_model`.
+        cache_dir (str, optional): Directory to keep optimized models in.
+    """
+    with _lock:
+        _session["profile"] = profile
+        _session["cache_dir"] = cache_dir
+
+
+def get_detector(path: str, threads: int = 0) -> "YOLOv8":
+    """
+    Get the process-wide YOLOv8 detector for a model path.
+
+    The ONNX session for each path is created once and reused by every caller,
+    loading happens under a lock so concurrent callers never build duplicate sessions.
+
+    Args:
+        path (str): The path to the YOLOv8 model file.
+        threads (int): Intra-op threads of the session, overrides the configured profile.
+            Only used by the call that loads the model.
+
+    Returns:
+        YOLOv8: The shared detector for the model.
+    """
+    with _lock:
+        detector = _detectors.get(path)
+        stats = _stats.setdefault(path, {"loads": 0, "load_time": 0.0, "hits": 0})
+        if detector is not None:
+            stats["hits"] += 1
+            return detector
+
+        from yolov8.YOLOv8 import YOLOv8
+
+        start = time.perf_counter()
+        detector = YOLOv8(path, threads=threads, profile=_session["profile"], cache_dir=_session["cache_dir"])
+        elapsed = time.perf_counter() - start
+
+        stats["loads"] += 1
+        stats["load_time"] += elapsed
+        _detectors[path] = detector
+
+    print(f"Loaded model {path} in {elapsed * 1000:.2f} ms{' from the optimized model cache' if detector.from_cache else ''}")
+    return detector
+
+
+def warm_up(path: str) -> threading.Thread:
+    """
+    Load a model and run a blank inference in a background thread,
+    so the first classification does not pay for loading and optimizing it.
+
+    Args:
+        path (str): The path to the YOLOv8 model file.
+
+    Returns:
+        threading.Thread: The started warm-up thread.
+    """
+    def run() -> None:
+        try:
+            start = time.perf_counter()
+            get_detector(path).warm_up()
+            print(f"Warmed up model {path} in {(time.perf_counter() - start) * 1000:.2f} ms")
+        except Exception as e:
+            print(f"Unable to warm up model {path}: {e}")
+
+    thread = threading.Thread(target=run, name="model-warm-up", daemon=True)
+    thread.start()
+    return thread
+
+
+def model_stats() -> Dict[str, Dict[str, float]]:
+    """
+    Get load statistics of the models loaded through `get_detector`.
+
+    Returns:
+        dict: Maps each model path to its load count, total load time in seconds
+        and the number of times the cached session was reused.
+    """
+    with _lock:
+        return {path: dict(stats) for path, stats in _stats.items()}
+
+
+def release_detectors() -> None:
+    """
+    Drop all cached detectors, the next `get_detector` call reloads the model.
+    """
+    with _lock:
+        _detectors.clear()
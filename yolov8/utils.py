@@ -31,28 +31,15 @@ def nms(boxes: np.ndarray, scores: np.ndarray, iou_threshold: float) -> np.ndarr
     # Sort by score
     sorted_indices = np.argsort(scores)[::-1]
 
-    keep_boxes = []
-    while sorted_indices.size > 0:
-        # Pick the last box
-        box_id = sorted_indices[0]
-        keep_boxes.append(box_id)
-
-        # Compute IoU of the picked box with the rest
-        ious = compute_iou(boxes[box_id, :], boxes[sorted_indices[1:], :])
-
-        # Remove boxes with IoU over the threshold
-        keep_indices = np.where(ious < iou_threshold)[0]
-
-        # print(keep_indices.shape, sorted_indices.shape)
-        sorted_indices = sorted_indices[keep_indices + 1]
-
-    return keep_boxes
+    return sorted_indices[greedy_suppression(boxes[sorted_indices], np.zeros(len(sorted_indices)), iou_threshold)]
 
 
 def multiclass_nms(boxes: np.ndarray, scores: np.ndarray, class_ids: np.ndarray, iou_threshold: float) -> np.ndarray:
     """
     Performs multi-class non-maximum suppression (NMS) on a set of bounding boxes.
 
+    All classes are suppressed in one pass, a box only suppresses boxes of its own class.
+
     Args:
         boxes: A numpy array of bounding boxes in the format (x1, y1, x2, y2).
         scores: A numpy array of scores for each bounding box.
@@ -60,21 +47,79 @@ def multiclass_nms(boxes: np.ndarray, scores: np.ndarray, class_ids: np.ndarray,
         iou_threshold: The IoU threshold for suppression.
 
     Returns:
-        A numpy array of indices of the kept boxes.
+        A numpy array of indices of the kept boxes, by class then by descending score.
     """
 
-    unique_class_ids = np.unique(class_ids)
+    # Group boxes by class, each class sorted by score as the per-class NMS does
+    order = [np.where(class_ids == class_id)[0] for class_id in np.unique(class_ids)]
+    order = np.concatenate([indices[np.argsort(scores[indices])[::-1]] for indices in order]) if order else np.array([], dtype=int)
+
+    return order[greedy_suppression(boxes[order], class_ids[order], iou_threshold)]
 
-    keep_boxes = []
-    for class_id in unique_class_ids:
-        class_indices = np.where(class_ids == class_id)[0]
-        class_boxes = boxes[class_indices,:]
-        class_scores = scores[class_indices]
 
-        class_keep_boxes = nms(class_boxes, class_scores, iou_threshold)
-        keep_boxes.extend(class_indices[class_keep_boxes])
+def greedy_suppression(boxes: np.ndarray, class_ids: np.ndarray, iou_threshold: float, block_size: int = 128) -> np.ndarray:
+    """
+    Greedy NMS over boxes already sorted by class and descending score.
+
+    IoUs are computed block by block against the later, not yet suppressed, boxes of the same classes.
+    Within a block, the kept set is iterated to its fixed point, which is the greedy result
+    since each box only depends on the boxes before it.
 
-    return keep_boxes
+    Args:
+        boxes: A numpy array of bounding boxes in the format (x1, y1, x2, y2), in processing order.
+        class_ids: The class ID of each box, boxes of a class must be contiguous.
+        iou_threshold: The IoU threshold for suppression.
+        block_size: Number of boxes whose IoUs are computed at once.
+
+    Returns:
+        A numpy array of the positions of the kept boxes, in processing order.
+    """
+    count = len(boxes)
+    suppressed = np.zeros(count, dtype=bool)
+    if count == 0:
+        return np.flatnonzero(suppressed)
+
+    # End of each box's class in the processing order, boxes past it are never compared
+    starts = np.flatnonzero(np.r_[True, class_ids[1:] != class_ids[:-1]])
+    class_end = np.repeat(np.r_[starts[1:], count], np.diff(np.r_[starts, count]))
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+
+    for start in range(0, count, block_size):
+        end = min(start + block_size, count)
+        rows = start + np.flatnonzero(~suppressed[start:end])
+        if rows.size == 0:
+            continue
+        # Candidates start with the block's own remaining boxes
+        columns = start + np.flatnonzero(~suppressed[start:class_end[end - 1]])
+
+        # Same operations as compute_iou so the IoUs are bit for bit equal
+        row_boxes, col_boxes = boxes[rows, None, :], boxes[None, columns, :]
+        xmin = np.maximum(row_boxes[..., 0], col_boxes[..., 0])
+        ymin = np.maximum(row_boxes[..., 1], col_boxes[..., 1])
+        xmax = np.minimum(row_boxes[..., 2], col_boxes[..., 2])
+        ymax = np.minimum(row_boxes[..., 3], col_boxes[..., 3])
+        intersection_area = np.maximum(0, xmax - xmin) * np.maximum(0, ymax - ymin)
+        union_area = areas[rows, None] + areas[None, columns] - intersection_area
+        with np.errstate(divide="ignore", invalid="ignore"):
+            # Degenerate boxes give NaN, which the per-box NMS treats as overlapping
+            overlaps = ~(intersection_area / union_area < iou_threshold)
+
+        # Only later boxes of the same class can be suppressed
+        overlaps &= (columns[None, :] > rows[:, None]) & (columns[None, :] < class_end[rows, None])
+
+        # Greedy result within the block
+        inner = overlaps[:, :len(rows)]
+        keep = np.ones(len(rows), dtype=bool)
+        while True:
+            updated = ~inner[keep].any(axis=0)
+            if np.array_equal(updated, keep):
+                break
+            keep = updated
+
+        suppressed[rows[~keep]] = True
+        suppressed[columns] |= overlaps[keep].any(axis=0)
+
+    return np.flatnonzero(~suppressed)
 
 
 def compute_iou(box: np.ndarray, boxes: np.ndarray) -> np.ndarray: